@@ -3,16 +3,22 @@ import os
 import sys
 import glob
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Add parent folder to path
 src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if src_path not in sys.path:
     sys.path.append(src_path)
 # Can now import:
-from extract_features_unified import extract_all_pcap_data
+from feature_cache import extract_cached
+from dataset_store import write_table
 
 DATA_DIR = "datasets/"
+# Parquet keeps the dtypes and lets train_model read only the columns it uses (see dataset_store)
+OUTPUT_PATH = "../model_training/master_training_data.parquet"
 ACTIONS = ["Like", "Play", "Subscribe", "Comment", "Search"]
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5
 
 def label_flows(df_flows, action):
     # Start everything as 'Background'
@@ -44,45 +50,101 @@ def label_flows(df_flows, action):
     return df_flows
 
 
-#  Extract ML features from all PCAP files and produce master_training_data.csv.
-def run(data_dir=DATA_DIR, actions=ACTIONS):
-
-    all_rows = []
-    test_data = {"pcap": [400, 300]}
-    print("Testing CSV output")
-    if save_to_csv(test_data) is False:
-        return
-    
-    print("Beginning extraction...")
-    start = time.time()
-    for i, action in enumerate(actions):
-        print(f"\nExtracting features from {action} dataset ({i + 1}/{len(actions)})")
+# Extract and label the ML flows of one capture, runs in a worker process when workers > 1
+# Returns (df_flows or None, error message or None) so one bad capture doesn't stop the run
+def extract_file(action, full_path):
+    try:
+        # Extract ALL flows from this PCAP into a dataframe, unchanged captures come from the cache
+        df_flows = extract_cached(full_path, True, engine="fast")[1]
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+    if df_flows is None or df_flows.empty:
+        return None, None
+    # Attempt to find the most likely flow containing the action that is being trained on.
+    df_flows = label_flows(df_flows, action)
+    df_flows.insert(0, "file_source", os.path.basename(full_path))
+    return df_flows, None
+
+# (action, path) for every capture, sorted so the CSV rows come out in the same order every run
+def list_jobs(data_dir, actions):
+    jobs = []
+    for action in actions:
         folder_path = os.path.join(data_dir, action)
         # Searches for files that match the specified pattern
-        pcap_files = glob.glob(os.path.join(folder_path, "*.pcap"))
-        total_files = len(pcap_files)
+        pcap_files = sorted(glob.glob(os.path.join(folder_path, "*.pcap")))
+        print(f"{action}: {len(pcap_files)} captures")
+        jobs.extend((action, full_path) for full_path in pcap_files)
+    return jobs
+
+# Yield (job index, result) as captures finish, in a process pool when workers > 1
+def run_jobs(jobs, workers):
+    if workers <= 1:
+        for index, (action, full_path) in enumerate(jobs):
+            yield index, extract_file(action, full_path)
+        return
 
-        for index, full_path in enumerate(pcap_files):
-            filename = os.path.basename(full_path)
-            count = index + 1
-            elapsed = round(time.time() - start)
-            print(f"\r{elapsed}s | Processing: {count}/{total_files} ({filename})".ljust(50), end="")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(extract_file, action, full_path): index
+                   for index, (action, full_path) in enumerate(jobs)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
 
-            # Extract ALL flows from this PCAP into a dataframe
-            df_flows = extract_all_pcap_data(full_path, True)[1]
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+# One progress line: elapsed time, files done, files/s and MB/s
+def progress_line(start, done, total, done_bytes, errors):
+    elapsed = max(time.time() - start, 1e-9)
+    return (f"{round(elapsed)}s | {done}/{total} files | {done / elapsed:.1f} files/s | "
+            f"{done_bytes / elapsed / 1e6:.1f} MB/s | {errors} errors")
+
+#  Extract ML features from all PCAP files and produce master_training_data.parquet.
+#  workers sets the number of processes (default: one per core), output order doesn't depend on it
+#  output_path can also end in .csv or .feather, the format follows the extension
+def run(data_dir=DATA_DIR, actions=ACTIONS, workers=None, output_path=OUTPUT_PATH):
+    if workers is None:
+        workers = os.cpu_count() or 1
 
-            if df_flows is not None and not df_flows.empty:
-                # Attempt to find the most likely flow containing the action that is being trained on.
-                df_flows = label_flows(df_flows, action)
-                df_flows.insert(0, "file_source", filename)
-                all_rows.append(df_flows)
+    test_data = {"pcap": [400, 300]}
+    print("Testing dataset output")
+    if save_dataset(test_data, output_path) is False:
+        return
 
-    # Combine everything into one dataframe
+    jobs = list_jobs(data_dir, actions)
+    print(f"Beginning extraction of {len(jobs)} captures with {workers} worker(s)...")
+    start = time.time()
+    last_report = start
+
+    results = [None] * len(jobs)
+    errors = []
+    done_bytes = 0
+    for done, (index, (df_flows, error)) in enumerate(run_jobs(jobs, workers), 1):
+        results[index] = df_flows
+        done_bytes += file_size(jobs[index][1])
+        if error is not None:
+            errors.append((jobs[index][1], error))
+            print(f"Failed: {jobs[index][1]} ({error})")
+
+        now = time.time()
+        if now - last_report >= PROGRESS_INTERVAL or done == len(jobs):
+            print(progress_line(start, done, len(jobs), done_bytes, len(errors)))
+            last_report = now
+
+    if errors:
+        print(f"\n{len(errors)} capture(s) could not be read:")
+        for full_path, error in errors:
+            print(f"  {full_path}: {error}")
+
+    # Combine everything into one dataframe, in job order
+    all_rows = [df_flows for df_flows in results if df_flows is not None]
     if all_rows:
-        master_df = save_to_csv(all_rows)
-        output_path="../model_training/master_training_data.csv"
+        master_df = save_dataset(all_rows, output_path)
         print(f"\n\nSuccess! Dataset created at {output_path} with {len(master_df)} total flows")
-        print("Final Label Counts in CSV:")
+        print("Final Label Counts in dataset:")
         print(master_df["action"].value_counts())
         beep()
         return master_df
@@ -90,7 +152,8 @@ def run(data_dir=DATA_DIR, actions=ACTIONS):
         print("\nNo data was extracted. Check your file paths.")
         return None
 
-def save_to_csv(data, output_path="../model_training/master_training_data.csv"):
+# Writes the combined rows to output_path (.parquet, .feather or .csv), returns them in job order
+def save_dataset(data, output_path=OUTPUT_PATH):
     # Ensure the directory exists
     try:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -100,17 +163,22 @@ def save_to_csv(data, output_path="../model_training/master_training_data.csv"):
         else:
             new_df = pd.DataFrame(data)
 
-        new_df.to_csv(output_path, index=False)
+        write_table(new_df, output_path)
         return new_df
     except Exception as e:
-        print(f"Error creating CSV: {e}")
+        print(f"Error creating dataset: {e}")
         beep()
         return False
-    
-    print(f"\n\nSuccess! Dataset created at {output_path}")
+
+
+def save_to_csv(data, output_path="../model_training/master_training_data.csv"):
+    return save_dataset(data, output_path)
 
 def beep():
-    import winsound
+    try:
+        import winsound
+    except ImportError:
+        return
     duration = 500
     freq = 440  
     winsound.Beep(freq, duration)
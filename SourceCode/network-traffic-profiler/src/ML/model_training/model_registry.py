@@ -0,0 +1,111 @@
+# Shared, lazily loaded model artifacts
+# Nothing is read from disk until an artifact is first asked for, loading is thread-safe
+# and each artifact is loaded once per version.
+# mmap_mode="r" memory-maps the numpy arrays stored in uncompressed pickles, so worker processes
+# loading the same file share them through the page cache. sklearn trees copy their node arrays
+# when unpickled, so for a forest this only saves the extra read buffer while loading.
+# swap() loads a new version next to the current one and replaces it in one step, so
+# predictions already running keep the artifacts they started with.
+# A file replaced on disk (e.g. by retraining) is loaded again on its next use, so long-lived
+# processes such as the dashboard's pool workers never predict with a model that is no longer there.
+import os
+import threading
+import time
+
+import joblib
+
+
+class ModelRegistry:
+
+    def __init__(self, paths, mmap_mode=None):
+        # {artifact name: file path}
+        self.paths = dict(paths)
+        self.mmap_mode = mmap_mode
+        self.version = 1
+        self._artifacts = {}
+        self._metrics = {}
+        self._lock = threading.RLock()
+
+    def _load(self, path):
+        started = time.perf_counter()
+        artifact = joblib.load(path, mmap_mode=self.mmap_mode)
+        metrics = {
+            "path": path,
+            "mtime": os.path.getmtime(path),
+            "bytes": os.path.getsize(path),
+            "seconds": time.perf_counter() - started,
+            "mmap_mode": self.mmap_mode,
+            "loaded_at": time.time(),
+        }
+        return artifact, metrics
+
+    # True when the artifact's path was changed or its file modified since it was loaded
+    # A file removed since then is not, the loaded artifact stays in use
+    def _is_stale(self, name):
+        metrics = self._metrics[name]
+        if self.paths[name] != metrics["path"]:
+            return True
+        try:
+            return os.path.getmtime(metrics["path"]) != metrics["mtime"]
+        except OSError:
+            return False
+
+    # Returns {name: artifact} for the given names (default: all), all from the same version
+    # Stale artifacts are loaded again first, as a new version
+    def artifacts(self, names=None):
+        names = list(self.paths) if names is None else list(names)
+        with self._lock:
+            stale = [name for name in names if name in self._artifacts and self._is_stale(name)]
+            if stale:
+                self.version += 1
+            for name in names:
+                if name not in self._artifacts or name in stale:
+                    artifact, metrics = self._load(self.paths[name])
+                    self._artifacts[name] = artifact
+                    self._metrics[name] = dict(metrics, version=self.version)
+            return {name: self._artifacts[name] for name in names}
+
+    def get(self, name):
+        return self.artifacts([name])[name]
+
+    def is_loaded(self, name):
+        return name in self._artifacts
+
+    # Load time, file size and version of every artifact loaded so far
+    def metrics(self):
+        with self._lock:
+            return {name: dict(metrics) for name, metrics in self._metrics.items()}
+
+    # {name: (path, modification time)} of the file each artifact was loaded from,
+    # or of its file on disk (None when missing) for artifacts not loaded yet
+    def stamps(self):
+        with self._lock:
+            stamps = {}
+            for name, path in self.paths.items():
+                if name in self._artifacts and self._metrics[name]["path"] == path:
+                    stamps[name] = (path, self._metrics[name]["mtime"])
+                else:
+                    stamps[name] = (path, os.path.getmtime(path) if os.path.exists(path) else None)
+            return stamps
+
+    # Replace some or all artifacts with new files without restarting the process
+    # The new files are loaded before the switch, so a bad file leaves the current version in place
+    # Returns the new version number
+    def swap(self, **paths):
+        unknown = set(paths) - set(self.paths)
+        if unknown:
+            raise ValueError(f"Unknown model artifacts: {sorted(unknown)}")
+
+        loaded = {name: self._load(path) for name, path in paths.items()}
+        with self._lock:
+            self.version += 1
+            self.paths.update(paths)
+            for name, (artifact, metrics) in loaded.items():
+                self._artifacts[name] = artifact
+                self._metrics[name] = dict(metrics, version=self.version)
+            return self.version
+
+    # Forget loaded artifacts, they are read again from their paths on next use
+    def unload(self):
+        with self._lock:
+            self._artifacts.clear()
@@ -3,64 +3,91 @@
 # Accepts extracted flow features as input
 # Predicts the action type for each flow
 # Returns the original DataFrame with an added 'action_type' column
-import joblib
+import logging
 import os
 import pandas as pd
 import numpy as np
 
-# Load trained model and label encoder
+from .model_registry import ModelRegistry
+
+log = logging.getLogger(__name__)
+
+# Trained model, label encoder and feature list
 MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "action_model.pkl")
 ENCODER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "label_encoder.pkl")
 FEATURES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "model_features.pkl")
-model = joblib.load(MODEL_PATH)
-label_encoder = joblib.load(ENCODER_PATH)
-model_features = joblib.load(FEATURES_PATH)
+
+# Loaded on first prediction rather than at import, so importing main or the dashboard
+# doesn't pay for deserialising the forest
+# Set registry.mmap_mode = "r" before the first prediction to memory-map the pickled arrays,
+# registry.swap(model=new_path) switches to a retrained model without a restart
+registry = ModelRegistry({
+    "model": MODEL_PATH,
+    "label_encoder": ENCODER_PATH,
+    "model_features": FEATURES_PATH,
+})
+ARTIFACTS = ("model", "label_encoder", "model_features")
+
+
+# predict.model, predict.label_encoder and predict.model_features still work, loaded on access
+# A file that can't be loaded reads as a missing attribute, so hasattr/getattr(..., default) work
+def __getattr__(name):
+    if name in ARTIFACTS:
+        try:
+            return registry.get(name)
+        except OSError as e:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r} ({e})") from e
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# The artifacts to predict with: assigned module attributes (tests) win over the registry,
+# the rest come from the registry in one call so they belong to the same version
+def current_artifacts():
+    assigned = {name: globals()[name] for name in ARTIFACTS if name in globals()}
+    loaded = registry.artifacts([name for name in ARTIFACTS if name not in assigned])
+    return tuple({**loaded, **assigned}[name] for name in ARTIFACTS)
+
+# A large flow predicted as Background is given the runner-up action instead
+# when the runner-up is at least this likely
+OVERRULE_MIN_BYTES = 1_000_000
+OVERRULE_MIN_SCORE = 0.30
 
 # Predicts action types for each flow in the given feature DataFrame
-def predict_action_type(features_df: pd.DataFrame) -> pd.DataFrame:
+# with_confidence=True also adds 'action_confidence', the probability of the chosen action
+def predict_action_type(features_df: pd.DataFrame, with_confidence: bool = False) -> pd.DataFrame:
     
     # Handles None or empty DataFrame
     if features_df is None or features_df.empty:
         return features_df
 
     # Preparation
-    X = features_df.copy()
-    X = X[model_features]
+    model, label_encoder, model_features = current_artifacts()
+    X = features_df[model_features]
     
     # Get a matrix of probabilities for each action for each flow
     probs = model.predict_proba(X) 
     # Action classes
-    classes = label_encoder.classes_
-    
-    final_results = []
-    # Iterate through each flow
-    for i in range(len(probs)):
-        row_probs = probs[i]
-        # Finds the highest predicted action index
-        best_idx = np.argmax(row_probs)
-        # Action label, eg 'Comment'
-        best_label = classes[best_idx]
-        # Actual confidence 'eg 0.7'
-        best_score = row_probs[best_idx]
-        
-        flow_size = features_df.iloc[i]['total_bytes']
-        # If a large flow is labelled as background, and the runner up prediction
-        # is is more than 0.3 then overrule
-        if best_label == "Background" and flow_size > 1_000_000:
-            # Find the second best prediction
-            # Sort indices by probability descending
-            sorted_indices = np.argsort(row_probs)[::-1]
-            runner_up_idx = sorted_indices[1]
-            runner_up_label = classes[runner_up_idx]
-            runner_up_score = row_probs[runner_up_idx]
+    classes = np.asarray(label_encoder.classes_)
+    rows = np.arange(len(probs))
+
+    # Finds the highest predicted action index of every flow
+    chosen = probs.argmax(axis=1)
 
-            if runner_up_score > 0.30:
-                print(f"  - ACTION: Overruling Background -> {runner_up_label}")
-                final_results.append(runner_up_label)
-            else:
-                final_results.append(best_label)
-        else:
-            final_results.append(best_label)
+    # If a large flow is labelled as background, and the runner up prediction
+    # is more than 0.3 then overrule
+    background = np.flatnonzero(classes == "Background")
+    if len(background) and "total_bytes" in features_df.columns:
+        flow_size = features_df["total_bytes"].to_numpy()
+        candidates = np.flatnonzero((chosen == background[0]) & (flow_size > OVERRULE_MIN_BYTES))
+        if len(candidates):
+            # Second best prediction: second entry of the probabilities sorted descending
+            runner_up = np.argsort(probs[candidates], axis=1)[:, ::-1][:, 1]
+            overrule = probs[candidates, runner_up] > OVERRULE_MIN_SCORE
+            chosen[candidates[overrule]] = runner_up[overrule]
+            for label, count in zip(*np.unique(classes[runner_up[overrule]], return_counts=True)):
+                log.info("Overruling Background -> %s (%d flows)", label, count)
 
-    features_df["action_type"] = final_results
-    return features_df
\ No newline at end of file
+    features_df["action_type"] = classes[chosen]
+    if with_confidence:
+        features_df["action_confidence"] = probs[rows, chosen]
+    return features_df
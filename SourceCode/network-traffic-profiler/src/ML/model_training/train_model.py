@@ -4,6 +4,8 @@
 # using sklearn metrics this produces an accuracy of around 75% on the test set rn
 # model doesn't perform well on like and subscribe
 
+import os
+import sys
 import pandas as pd
 import numpy as np
 import joblib
@@ -16,22 +18,12 @@ from sklearn.metrics import classification_report, accuracy_score
 from test_model import run_tests
 from sklearn.model_selection import GroupShuffleSplit, cross_val_score
 
-# load dataset created in /action_classification
-df = pd.read_csv("master_training_data.csv")
-#df = pd.read_csv("../action_classification/master_training_data.csv")
-
-# Strip excess background flows 
-# Create dataframe of action flows
-actions_df = df[df['action'] != 'Background']
-# Create dataframe of background flows
-background_df = df[df['action'] == 'Background'].sample(n=600, random_state=42)
-
-# Combine them back
-df = pd.concat([actions_df, background_df])
-print(f"New balanced dataset shape: {df['action'].value_counts()}")
+# dataset_store lives in src/
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from dataset_store import first_existing, read_table
 
-# define X and y, features with low permutation importance are not included to reduce overfitting
-X = df[[
+# features with low permutation importance are not included to reduce overfitting
+FEATURES = [
     "duration", 
     "std_iat", 
     "avg_iat", 
@@ -45,7 +37,26 @@ X = df[[
     "outbound_ratio",
     #"avg_packet_size",
     "throughput"
-]] 
+]
+
+# load dataset created in /action_classification, only the columns used here are read
+# the parquet file keeps its dtypes, older csv datasets still work
+dataset_path = first_existing("master_training_data.parquet", "master_training_data.csv")
+df = read_table(dataset_path, columns=FEATURES + ["action", "file_source"])
+#df = pd.read_csv("../action_classification/master_training_data.csv")
+
+# Strip excess background flows 
+# Create dataframe of action flows
+actions_df = df[df['action'] != 'Background']
+# Create dataframe of background flows
+background_df = df[df['action'] == 'Background'].sample(n=600, random_state=42)
+
+# Combine them back
+df = pd.concat([actions_df, background_df])
+print(f"New balanced dataset shape: {df['action'].value_counts()}")
+
+# define X and y
+X = df[FEATURES]
 y = df["action"]
 groups = df["file_source"]
 
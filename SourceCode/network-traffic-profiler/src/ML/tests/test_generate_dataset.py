@@ -231,3 +231,73 @@ class TestRunFunction:
 
         assert result is not None
         assert isinstance(result, pd.DataFrame)
+
+# Section 8: run() — process pool, ordering and error isolation
+def write_action_captures(data_dir, action, count):
+    from scapy.all import Ether, IP, TCP, wrpcap
+    folder = data_dir / action
+    folder.mkdir(parents=True, exist_ok=True)
+    for n in range(count):
+        packets = [
+            Ether() / IP(src="192.168.1.5", dst="172.217.0.1") / TCP(sport=40000 + n, dport=443) / (b"x" * (100 + k * n))
+            for k in range(4)
+        ]
+        for k, pkt in enumerate(packets):
+            pkt.time = 1000.0 + k * 0.1
+        wrpcap(str(folder / f"{action}_{n}.pcap"), packets)
+
+class TestParallelRun:
+
+    @pytest.fixture(autouse=True)
+    def work_dir(self, tmp_path, monkeypatch):
+        # save_to_csv writes relative to the working directory
+        work = tmp_path / "work"
+        work.mkdir()
+        monkeypatch.chdir(work)
+        import feature_cache
+        monkeypatch.setattr(feature_cache, "CACHE_DIR", str(tmp_path / "cache"))
+
+    def test_output_order_does_not_depend_on_workers(self, tmp_path):
+        write_action_captures(tmp_path / "datasets", "Like", 3)
+        write_action_captures(tmp_path / "datasets", "Play", 2)
+        data_dir = str(tmp_path / "datasets")
+
+        serial = run(data_dir=data_dir, actions=["Like", "Play"], workers=1)
+        parallel = run(data_dir=data_dir, actions=["Like", "Play"], workers=2)
+
+        assert list(serial["file_source"]) == ["Like_0.pcap", "Like_1.pcap", "Like_2.pcap", "Play_0.pcap", "Play_1.pcap"]
+        pd.testing.assert_frame_equal(parallel, serial)
+
+    def test_bad_capture_is_reported_and_skipped(self, tmp_path, capsys):
+        write_action_captures(tmp_path / "datasets", "Like", 2)
+        (tmp_path / "datasets" / "Like" / "Like_broken.pcap").write_bytes(b"not a capture")
+
+        result = run(data_dir=str(tmp_path / "datasets"), actions=["Like"], workers=1)
+
+        assert sorted(result["file_source"].unique()) == ["Like_0.pcap", "Like_1.pcap"]
+        out = capsys.readouterr().out
+        assert "Like_broken.pcap" in out
+        assert "1 errors" in out
+
+
+# Section 9: dataset output formats
+class TestSaveDataset:
+
+    def test_parquet_keeps_rows_and_job_order(self, tmp_path):
+        from action_classification.generate_dataset import save_dataset
+        from dataset_store import read_table
+        frames = [make_flows([{"file_source": f"{action}_0.pcap", "total_bytes": n, "action": action}])
+                  for n, action in enumerate(["Play", "Like", "Background"])]
+        output = str(tmp_path / "master_training_data.parquet")
+
+        result = save_dataset(frames, output)
+
+        assert list(result["action"]) == ["Play", "Like", "Background"]
+        stored = read_table(output, columns=["total_bytes", "action"])
+        assert sorted(zip(stored["total_bytes"], stored["action"].astype(str))) == [(0, "Play"), (1, "Like"), (2, "Background")]
+
+    def test_save_to_csv_still_writes_csv(self, tmp_path):
+        from action_classification.generate_dataset import save_to_csv
+        output = tmp_path / "master_training_data.csv"
+        save_to_csv([make_flows([{"total_bytes": 5, "outbound_ratio": 0.5}])], output_path=str(output))
+        assert pd.read_csv(output).to_dict("records") == [{"total_bytes": 5, "outbound_ratio": 0.5}]
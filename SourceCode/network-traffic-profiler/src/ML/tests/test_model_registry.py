@@ -0,0 +1,177 @@
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder
+
+import ML.model_training.model_registry as registry_module
+from ML.model_training.model_registry import ModelRegistry
+
+FEATURES = ["duration", "pk_count"]
+
+
+# Writes a small model, label encoder and feature list, returns their paths
+def write_artifacts(tmp_path, labels=("Comment", "Play"), suffix=""):
+    X = pd.DataFrame({"duration": [1, 2, 3, 4], "pk_count": [10, 20, 30, 40]})
+    le = LabelEncoder().fit(list(labels))
+    y = le.transform([labels[0], labels[0], labels[1], labels[1]])
+    model = RandomForestClassifier(n_estimators=3, random_state=0).fit(X, y)
+
+    paths = {
+        "model": str(tmp_path / f"model{suffix}.pkl"),
+        "label_encoder": str(tmp_path / f"encoder{suffix}.pkl"),
+        "model_features": str(tmp_path / f"features{suffix}.pkl"),
+    }
+    joblib.dump(model, paths["model"])
+    joblib.dump(le, paths["label_encoder"])
+    joblib.dump(FEATURES, paths["model_features"])
+    return paths
+
+
+# Counts joblib.load calls made by the registry
+@pytest.fixture
+def load_calls(monkeypatch):
+    calls = []
+    real_load = joblib.load
+
+    def counting_load(path, mmap_mode=None):
+        calls.append(path)
+        return real_load(path, mmap_mode=mmap_mode)
+
+    monkeypatch.setattr(registry_module.joblib, "load", counting_load)
+    return calls
+
+
+def test_nothing_is_loaded_until_asked(tmp_path, load_calls):
+    registry = ModelRegistry(write_artifacts(tmp_path))
+    assert load_calls == []
+    assert registry.metrics() == {}
+
+    assert registry.get("model_features") == FEATURES
+    assert load_calls == [registry.paths["model_features"]]
+    assert not registry.is_loaded("model")
+
+
+def test_concurrent_first_use_loads_once(tmp_path, load_calls):
+    registry = ModelRegistry(write_artifacts(tmp_path))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("model"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert load_calls == [registry.paths["model"]]
+    assert all(result is results[0] for result in results)
+
+
+def test_load_metrics(tmp_path):
+    registry = ModelRegistry(write_artifacts(tmp_path))
+    registry.artifacts()
+
+    metrics = registry.metrics()
+    assert set(metrics) == {"model", "label_encoder", "model_features"}
+    for name, entry in metrics.items():
+        assert entry["path"] == registry.paths[name]
+        assert entry["bytes"] > 0
+        assert entry["seconds"] >= 0
+        assert entry["version"] == 1
+        assert entry["mmap_mode"] is None
+
+
+def test_mmap_mode(tmp_path):
+    paths = write_artifacts(tmp_path)
+    arrays_path = str(tmp_path / "arrays.pkl")
+    joblib.dump({"thresholds": np.arange(10.0)}, arrays_path)
+    registry = ModelRegistry(dict(paths, arrays=arrays_path), mmap_mode="r")
+
+    assert isinstance(registry.get("arrays")["thresholds"], np.memmap)
+    X = pd.DataFrame({"duration": [1, 4], "pk_count": [10, 40]})
+    assert registry.get("model").predict(X).tolist() == [0, 1]
+    assert registry.metrics()["model"]["mmap_mode"] == "r"
+
+
+def test_swap_replaces_model_without_reloading_the_rest(tmp_path, load_calls):
+    registry = ModelRegistry(write_artifacts(tmp_path))
+    old_model = registry.get("model")
+    old_features = registry.get("model_features")
+    new_paths = write_artifacts(tmp_path, suffix="-v2")
+
+    assert registry.swap(model=new_paths["model"]) == 2
+    assert registry.get("model") is not old_model
+    assert registry.get("model_features") is old_features
+    assert registry.metrics()["model"]["version"] == 2
+    assert registry.metrics()["model_features"]["version"] == 1
+    assert load_calls.count(new_paths["model"]) == 1
+
+
+def test_failed_swap_keeps_current_version(tmp_path):
+    registry = ModelRegistry(write_artifacts(tmp_path))
+    model = registry.get("model")
+
+    with pytest.raises(FileNotFoundError):
+        registry.swap(model=str(tmp_path / "missing.pkl"))
+    with pytest.raises(ValueError):
+        registry.swap(scaler=str(tmp_path / "scaler.pkl"))
+
+    assert registry.version == 1
+    assert registry.get("model") is model
+
+
+def test_files_replaced_on_disk_are_reloaded(tmp_path, load_calls):
+    import os
+
+    paths = write_artifacts(tmp_path)
+    registry = ModelRegistry(paths)
+    model = registry.get("model")
+    features = registry.get("model_features")
+    stamps = registry.stamps()
+    assert stamps["model"] == (paths["model"], os.path.getmtime(paths["model"]))
+
+    # retrained in place
+    joblib.dump(RandomForestClassifier(n_estimators=1).fit([[0, 0], [1, 1]], [0, 1]), paths["model"])
+    os.utime(paths["model"], (1, 1))
+    # what is loaded until the next use
+    assert registry.stamps() == stamps
+
+    assert registry.get("model") is not model
+    assert registry.get("model_features") is features
+    assert registry.version == 2 and registry.metrics()["model"]["version"] == 2
+    assert registry.stamps()["model"] == (paths["model"], 1)
+    assert load_calls.count(paths["model"]) == 2
+
+    # a removed file leaves the loaded artifact in use
+    reloaded = registry.get("model")
+    os.remove(paths["model"])
+    assert registry.get("model") is reloaded
+
+
+def test_predict_uses_registry_and_follows_swaps(tmp_path, monkeypatch):
+    import ML.model_training.predict as predict_module
+
+    registry = ModelRegistry(write_artifacts(tmp_path))
+    monkeypatch.setattr(predict_module, "registry", registry)
+    features = pd.DataFrame({"duration": [1, 4], "pk_count": [10, 40]})
+
+    assert predict_module.predict_action_type(features.copy())["action_type"].tolist() == ["Comment", "Play"]
+
+    registry.swap(**write_artifacts(tmp_path, labels=("Like", "Share"), suffix="-v2"))
+    assert predict_module.predict_action_type(features.copy())["action_type"].tolist() == ["Like", "Share"]
+    assert predict_module.model_features == FEATURES
+
+
+def test_missing_artifact_reads_as_missing_attribute(tmp_path, monkeypatch):
+    import ML.model_training.predict as predict_module
+
+    paths = write_artifacts(tmp_path)
+    paths["model"] = str(tmp_path / "missing.pkl")
+    monkeypatch.setattr(predict_module, "registry", ModelRegistry(paths))
+
+    assert not hasattr(predict_module, "model")
+    assert getattr(predict_module, "model", None) is None
+    with pytest.raises(AttributeError, match="missing.pkl"):
+        predict_module.model
+    assert predict_module.model_features == FEATURES
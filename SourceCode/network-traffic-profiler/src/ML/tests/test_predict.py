@@ -28,9 +28,10 @@ def test_predict_action_type(monkeypatch):
     model.fit(X_train, y_enc)
 
     # monkeypatch model, label encoder, and features (mimics the .pkl files)
-    monkeypatch.setattr(predict_module, "model", model)
-    monkeypatch.setattr(predict_module, "label_encoder", le)
-    monkeypatch.setattr(predict_module, "model_features", list(X_train.columns))
+    # Set as module globals: getattr would load the real artifact, which teardown then restores as a global
+    monkeypatch.setitem(vars(predict_module), "model", model)
+    monkeypatch.setitem(vars(predict_module), "label_encoder", le)
+    monkeypatch.setitem(vars(predict_module), "model_features", list(X_train.columns))
 
     # create test input
     test_df = X_train.copy()
@@ -43,4 +44,59 @@ def test_predict_action_type(monkeypatch):
 
     # ensure predictions are returned
     assert len(result["action_type"]) == len(test_df)
-    assert result["action_type"].notnull().all()
\ No newline at end of file
+    assert result["action_type"].notnull().all()
+
+# Model stub returning a fixed probability matrix
+class FixedProbaModel:
+    def __init__(self, probs):
+        self.probs = probs
+
+    def predict_proba(self, X):
+        return self.probs
+
+
+# The per-row loop the array version replaced
+def reference_predictions(probs, classes, total_bytes):
+    results = []
+    for i in range(len(probs)):
+        row_probs = probs[i]
+        best_idx = np.argmax(row_probs)
+        best_label = classes[best_idx]
+        if best_label == "Background" and total_bytes[i] > 1_000_000:
+            runner_up_idx = np.argsort(row_probs)[::-1][1]
+            if row_probs[runner_up_idx] > 0.30:
+                results.append(classes[runner_up_idx])
+                continue
+        results.append(best_label)
+    return results
+
+
+def test_batched_overrule_matches_row_loop(monkeypatch, caplog, capsys):
+    import ML.model_training.predict as predict_module
+
+    rng = np.random.default_rng(0)
+    n = 5000
+    probs = rng.dirichlet(np.ones(4) * 0.7, n)
+    # Rounded probabilities give ties, including between Background and the runner-up
+    probs[: n // 2] = np.round(probs[: n // 2], 1)
+    le = LabelEncoder().fit(["Background", "Comment", "Play", "Search"])
+    features = pd.DataFrame({"duration": rng.random(n), "total_bytes": rng.integers(0, 3_000_000, n)})
+
+    # Set as module globals: getattr would load the real artifact, which teardown then restores as a global
+    monkeypatch.setitem(vars(predict_module), "model", FixedProbaModel(probs))
+    monkeypatch.setitem(vars(predict_module), "label_encoder", le)
+    monkeypatch.setitem(vars(predict_module), "model_features", ["duration"])
+
+    with caplog.at_level("INFO", logger=predict_module.__name__):
+        result = predict_module.predict_action_type(features.copy(), with_confidence=True)
+
+    expected = reference_predictions(probs, le.classes_, features["total_bytes"].to_numpy())
+    assert result["action_type"].tolist() == expected
+    chosen = [list(le.classes_).index(label) for label in expected]
+    assert np.array_equal(result["action_confidence"].to_numpy(), probs[np.arange(n), chosen])
+    assert "action_confidence" not in predict_module.predict_action_type(features.copy()).columns
+
+    # Overrules are logged per action, not printed
+    assert caplog.records
+    assert all(record.getMessage().startswith("Overruling Background -> ") for record in caplog.records)
+    assert capsys.readouterr().out == ""
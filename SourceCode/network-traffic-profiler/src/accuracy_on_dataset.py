@@ -22,36 +22,35 @@ TOTAL          312   438         42%
 import os
 import sys
 import pandas as pd
-import ipaddress
 from collections import defaultdict
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from extract_features_unified import extract_all_pcap_data
-from ML.model_training.predict import predict_action_type
+from feature_cache import extract_cached
+from ML.model_training.predict import predict_action_type, registry
+from ip_utils import YOUTUBE_MATCHER, YOUTUBE_RANGES
 
 DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ML", "datasets")
 ACTIONS = ["Comment", "Like", "Play", "Search", "Subscribe"]
-YT_RANGES = [
-    "172.217.0.0/16", "142.250.0.0/15", "104.237.160.0/19",
-    "208.117.224.0/19", "64.15.112.0/20", "216.58.192.0/19",
-    "74.125.0.0/16"
-] # aligning with extract_features_unified.py
+YT_RANGES = YOUTUBE_RANGES # shared with extract_features_unified.py
 
 # how many files per action to test (None = all)
 MAX_FILES_PER_ACTION = None
 
 # check that flow is yt flow
 def is_youtube_ip(ip):
-    try:
-        ip_obj = ipaddress.ip_address(ip)
-        return any(ip_obj in ipaddress.ip_network(r) for r in YT_RANGES)
-    except Exception:
-        return False
+    return YOUTUBE_MATCHER.contains(ip)
+
+# ML frame columns that prediction and evaluate_pcap use, the flow table isn't needed at all
+# Only the feature list is loaded, not the forest
+def cached_columns():
+    model_features = registry.get("model_features")
+    return {"flows": [], "ml": list(dict.fromkeys(["src_ip", "dst_ip", "total_bytes", *model_features]))}
 
 # run feature extraction + prediction for a single PCAP, returns ml_features_df with action_type
+# captures already in the feature cache only have the columns above read back
 def run_prediction(pcap_path):
-    result = extract_all_pcap_data(pcap_path)
+    result = extract_cached(pcap_path, columns=cached_columns())
     if not result or result[1] is None or result[1].empty:
         return None
     return predict_action_type(result[1])
@@ -67,8 +66,8 @@ def evaluate_pcap(pcap_path, expected_action):
 
     # check yt ips
     yt_df = ml_df[
-        ml_df["src_ip"].apply(is_youtube_ip) |
-        ml_df["dst_ip"].apply(is_youtube_ip)
+        YOUTUBE_MATCHER.contains_many(ml_df["src_ip"]) |
+        YOUTUBE_MATCHER.contains_many(ml_df["dst_ip"])
     ]
 
     # if no yt ips found
@@ -0,0 +1,89 @@
+# Baseline anomaly model trained once over a corpus of captures
+# build_dataset normally fits its scaler and IsolationForest on the capture it is scoring, so every
+# run retrains and scores from different captures can't be compared. A baseline is fitted on many
+# captures together and saved with its scaler and dropped zero-variance columns; while one exists
+# run_pipeline only transforms and scores each capture against it.
+#
+# from .../src run:
+#   python anomaly_baseline.py csv_output/*_validated.csv captures/*.pcap
+#   python anomaly_baseline.py --out other_baseline.joblib --max-fit-rows 100000 csv_output/*.csv
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+
+import pandas as pd
+
+from build_dataset import FIT_SAMPLE_ROWS, fit_anomaly_model, numeric_features, save_anomaly_model, zero_variance_columns
+from dataset_store import read_table
+from feature_cache import extract_cached
+from ML.model_training.model_registry import ModelRegistry
+from process_dataset import validate_dataset
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ML", "anomaly_baseline.joblib")
+
+# Loaded on first use and shared by every pipeline run in this process
+registry = ModelRegistry({"baseline": BASELINE_PATH})
+
+CAPTURE_EXTENSIONS = (".pcap", ".pcapng", ".cap")
+
+
+# Validated flows of one corpus file: a validated flow table (csv_output, .csv/.parquet/.feather)
+# or a capture, extracted as run_pipeline does
+def read_flows(path):
+    if path.lower().endswith(CAPTURE_EXTENSIONS):
+        flows = extract_cached(path, streaming=True, engine="fast", workers=os.cpu_count())[0]
+        return validate_dataset(flows)
+    flows = read_table(path)
+    if "is_valid" not in flows.columns:
+        raise ValueError(f"{path} is not a validated flow file (no is_valid column)")
+    return flows
+
+
+# Fits a baseline on the valid flows of every file, returns the anomaly model
+def train_baseline(paths, max_fit_rows=FIT_SAMPLE_ROWS):
+    frames = []
+    for path in paths:
+        with contextlib.redirect_stdout(io.StringIO()):
+            frames.append(numeric_features(read_flows(path)))
+        print(f"{path}: {len(frames[-1])} valid flows")
+
+    # Files can disagree on columns (e.g. older exports), only columns every file has are used
+    columns = [col for col in frames[0].columns if all(col in frame.columns for frame in frames)]
+    corpus = pd.concat([frame[columns] for frame in frames], ignore_index=True)
+    if corpus.empty:
+        raise ValueError("No valid flows in the corpus")
+
+    dropped = zero_variance_columns(corpus)
+    anomaly_model = fit_anomaly_model(corpus.drop(columns=dropped), max_fit_rows, dropped_columns=dropped)
+    anomaly_model["corpus"] = [os.path.basename(path) for path in paths]
+    anomaly_model["corpus_rows"] = len(corpus)
+    return anomaly_model
+
+
+# The saved baseline, or None when none has been trained
+def current_baseline():
+    if not os.path.exists(registry.paths["baseline"]):
+        return None
+    return registry.get("baseline")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the baseline anomaly model over a corpus of flows")
+    parser.add_argument("paths", nargs="+", help="validated flow tables and/or capture files")
+    parser.add_argument("--out", default=BASELINE_PATH, help="where to save the model (default ML/anomaly_baseline.joblib)")
+    parser.add_argument("--max-fit-rows", type=int, default=FIT_SAMPLE_ROWS)
+    args = parser.parse_args(argv)
+
+    anomaly_model = train_baseline(args.paths, args.max_fit_rows)
+    save_anomaly_model(anomaly_model, args.out)
+    print(f"Baseline fitted on {anomaly_model['fit_rows']} of {anomaly_model['corpus_rows']} flows, "
+          f"features: {anomaly_model['columns']}")
+    print(f"Saved to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+# Throughput benchmarks for the pipeline stages on synthetic captures
+# Results are written as JSON tagged with the git commit, so runs can be compared across commits
+#
+# from .../src run:
+#   python benchmark.py run --scenario small medium --repeat 3
+#   python benchmark.py run --packets 500000 --flows 8000 --youtube-share 0.5 --format pcapng
+#   python benchmark.py compare benchmark_output/bench-OLD.json benchmark_output/bench-NEW.json
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+import feature_cache
+from build_dataset import build_dataset
+from extract_features_unified import extract_all_pcap_data
+from process_dataset import validate_dataset
+from synthetic_pcap import generate_capture
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_output")
+
+SCENARIOS = {
+    "small": {"packets": 20_000, "flows": 500},
+    "medium": {"packets": 200_000, "flows": 5_000},
+    "large": {"packets": 2_000_000, "flows": 50_000},
+}
+CAPTURE_DEFAULTS = {"protocol_mix": None, "youtube_share": 0.3, "file_format": "pcap", "seed": 0}
+
+STAGES = ["extract", "validate", "predict", "build", "pipeline"]
+
+# A stage slower than this fraction is reported as a regression by compare
+REGRESSION_THRESHOLD = 0.10
+
+
+# Generated captures are kept between runs, keyed by their settings
+def scenario_capture(config, capture_dir):
+    key = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+    path = os.path.join(capture_dir, f"{key}.{config['file_format']}")
+    summary_path = path + ".json"
+    if os.path.exists(path) and os.path.exists(summary_path):
+        with open(summary_path) as f:
+            return json.load(f)
+
+    os.makedirs(capture_dir, exist_ok=True)
+    summary = generate_capture(path, **config)
+    with open(summary_path, "w") as f:
+        json.dump(summary, f)
+    return summary
+
+
+# Runs fn(*setup()) repeat times with stdout silenced, returns (last result, seconds per run)
+# setup runs outside the timed part, so every run gets fresh inputs
+def time_runs(fn, setup, repeat):
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        args = setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            result = fn(*args)
+            seconds.append(time.perf_counter() - started)
+    return result, seconds
+
+
+def result_row(scenario, stage, summary, seconds=None, status="ok"):
+    row = {
+        "scenario": scenario,
+        "stage": stage,
+        "packets": summary["packets"],
+        "flows": summary["flows"],
+        "capture_bytes": os.path.getsize(summary["path"]),
+        "status": status,
+    }
+    if seconds:
+        best = min(seconds)
+        row.update({
+            "runs": seconds,
+            "min_seconds": best,
+            "median_seconds": statistics.median(seconds),
+            "packets_per_sec": summary["packets"] / best if best > 0 else None,
+            "flows_per_sec": summary["flows"] / best if best > 0 else None,
+        })
+    return row
+
+
+# Times each requested stage on one capture
+# Stages after extraction are fed the output of the stage before, as in main.run_pipeline
+def bench_capture(scenario, summary, stages, repeat):
+    path = summary["path"]
+    rows = []
+    workers = os.cpu_count()
+
+    (flows, ml_df), seconds = time_runs(
+        lambda: extract_all_pcap_data(path, streaming=True, engine="fast", workers=workers),
+        lambda: (), repeat)
+    if "extract" in stages:
+        rows.append(result_row(scenario, "extract", summary, seconds))
+
+    validated, seconds = time_runs(validate_dataset, lambda: (flows.copy(),), repeat)
+    if "validate" in stages:
+        rows.append(result_row(scenario, "validate", summary, seconds))
+
+    if "predict" in stages:
+        significant = ml_df[ml_df["total_bytes"] > 1000]
+        try:
+            from ML.model_training.predict import predict_action_type
+            _, seconds = time_runs(predict_action_type, lambda: (significant.copy(),), repeat)
+            rows.append(result_row(scenario, "predict", summary, seconds))
+        except OSError as e:
+            # No trained model on this machine
+            rows.append(result_row(scenario, "predict", summary, status=f"skipped: {e}"))
+
+    if "build" in stages:
+        _, seconds = time_runs(build_dataset, lambda: (validated.copy(), scenario), repeat)
+        rows.append(result_row(scenario, "build", summary, seconds))
+
+    if "pipeline" in stages:
+        rows.append(bench_pipeline(scenario, summary, repeat))
+    return rows
+
+
+# End to end run_pipeline with an empty feature cache every time, so extraction is included
+def bench_pipeline(scenario, summary, repeat):
+    import main
+
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    original_cache_dir = feature_cache.CACHE_DIR
+    run = {"count": 0}
+
+    def setup():
+        run["count"] += 1
+        feature_cache.CACHE_DIR = os.path.join(work_dir, f"cache-{run['count']}")
+        return (summary["path"],)
+
+    try:
+        _, seconds = time_runs(lambda path: main.run_pipeline(path), setup, repeat)
+        return result_row(scenario, "pipeline", summary, seconds)
+    except OSError as e:
+        return result_row(scenario, "pipeline", summary, status=f"skipped: {e}")
+    finally:
+        feature_cache.CACHE_DIR = original_cache_dir
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def git_commit():
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=here, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                               capture_output=True, text=True, check=True).stdout.strip() != ""
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def environment():
+    commit, dirty = git_commit()
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+# Runs every scenario and writes the results file, returns (path, results)
+# scenarios: {name: capture settings for synthetic_pcap.generate_capture}
+def run_benchmarks(scenarios, stages=None, repeat=3, out_path=None, capture_dir=None):
+    stages = stages or STAGES
+    capture_dir = capture_dir or os.path.join(BENCH_DIR, "captures")
+    results = {"environment": environment(), "scenarios": {}, "results": []}
+
+    for name, settings in scenarios.items():
+        config = {**CAPTURE_DEFAULTS, **settings}
+        print(f"[{name}] generating capture: {config['packets']} packets, {config['flows']} flows")
+        summary = scenario_capture(config, capture_dir)
+        results["scenarios"][name] = {**config, **summary}
+        for row in bench_capture(name, summary, stages, repeat):
+            results["results"].append(row)
+            if row["status"] == "ok":
+                print(f"[{name}] {row['stage']:<9} {row['median_seconds']:8.3f}s median  "
+                      f"{row['packets_per_sec']:>12,.0f} packets/s")
+            else:
+                print(f"[{name}] {row['stage']:<9} {row['status']}")
+
+    if out_path is None:
+        commit = (results["environment"]["commit"] or "nogit")[:10]
+        out_path = os.path.join(BENCH_DIR, f"bench-{commit}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Results saved to {out_path}")
+    return out_path, results
+
+
+# Median time of every (scenario, stage) in two results files, new relative to old
+def compare_results(old, new, threshold=REGRESSION_THRESHOLD):
+    old_times = {(r["scenario"], r["stage"]): r.get("median_seconds") for r in old["results"]}
+    rows = []
+    for result in new["results"]:
+        key = (result["scenario"], result["stage"])
+        before, after = old_times.get(key), result.get("median_seconds")
+        change = (after - before) / before if before and after is not None else None
+        rows.append({
+            "scenario": key[0],
+            "stage": key[1],
+            "old_seconds": before,
+            "new_seconds": after,
+            "change": change,
+            "regression": change is not None and change > threshold,
+        })
+    return rows
+
+
+def print_comparison(rows, old_env, new_env):
+    print(f"old: {old_env.get('commit')}  new: {new_env.get('commit')}")
+    print(f"{'Scenario':<10}{'Stage':<10}{'Old (s)':>10}{'New (s)':>10}{'Change':>10}")
+    print("─" * 50)
+    for row in rows:
+        old = f"{row['old_seconds']:.3f}" if row["old_seconds"] is not None else "-"
+        new = f"{row['new_seconds']:.3f}" if row["new_seconds"] is not None else "-"
+        change = f"{row['change'] * 100:+.1f}%" if row["change"] is not None else "-"
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['scenario']:<10}{row['stage']:<10}{old:>10}{new:>10}{change:>10}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic captures")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run benchmarks and write a results file")
+    run.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=["small"])
+    run.add_argument("--packets", type=int, help="custom scenario: total packets")
+    run.add_argument("--flows", type=int, help="custom scenario: number of flows")
+    run.add_argument("--tcp", type=float, help="custom scenario: share of TCP flows")
+    run.add_argument("--udp", type=float, help="custom scenario: share of UDP flows")
+    run.add_argument("--icmp", type=float, help="custom scenario: share of ICMP flows")
+    run.add_argument("--youtube-share", type=float, help="share of flows to/from YouTube addresses")
+    run.add_argument("--format", choices=["pcap", "pcapng"], help="capture format")
+    run.add_argument("--seed", type=int)
+    run.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--out", help="results file (default benchmark_output/bench-<commit>-<time>.json)")
+
+    compare = commands.add_parser("compare", help="compare two results files")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                         help="slowdown reported as a regression (0.1 = 10%%)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        rows = compare_results(old, new, args.threshold)
+        print_comparison(rows, old["environment"], new["environment"])
+        return 1 if any(row["regression"] for row in rows) else 0
+
+    overrides = {}
+    if args.youtube_share is not None:
+        overrides["youtube_share"] = args.youtube_share
+    if args.format:
+        overrides["file_format"] = args.format
+    if args.seed is not None:
+        overrides["seed"] = args.seed
+    mix = {name: share for name, share in [("tcp", args.tcp), ("udp", args.udp), ("icmp", args.icmp)]
+           if share is not None}
+    if mix:
+        overrides["protocol_mix"] = mix
+
+    if args.packets or args.flows:
+        scenarios = {"custom": {"packets": args.packets or SCENARIOS["small"]["packets"],
+                                "flows": args.flows or SCENARIOS["small"]["flows"], **overrides}}
+    else:
+        scenarios = {name: {**SCENARIOS[name], **overrides} for name in args.scenario}
+
+    run_benchmarks(scenarios, stages=args.stages, repeat=args.repeat, out_path=args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,12 +4,72 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import RobustScaler
 from sklearn.ensemble import IsolationForest
+import joblib
 import os
 
-def build_dataset(df, pcap_basename):
+from feature_store import matrix_paths, open_writer
 
-    print("Building ML dataset") # confirm csv file that is being passed into function
+# Flows the scaler and IsolationForest are fitted on, larger captures are fitted on a random sample
+FIT_SAMPLE_ROWS = 50_000
+# Flows scaled and scored at a time, so the scaled matrix of a large capture is never held whole
+SCORE_CHUNK_ROWS = 100_000
+
+
+# Fits the scaler and IsolationForest on at most max_fit_rows flows
+# Returns the "anomaly model": {"scaler", "model", "columns", "dropped_columns", "fit_rows"}
+# dropped_columns: zero-variance columns left out before fitting, kept so scoring can report them
+def fit_anomaly_model(numeric_df, max_fit_rows=FIT_SAMPLE_ROWS, random_state=42, dropped_columns=()):
+    sample = numeric_df
+    if len(numeric_df) > max_fit_rows:
+        sample = numeric_df.sample(n=max_fit_rows, random_state=random_state)
+
+    # scale values (normalise feature ranges so the model doesn't treat large-number features as more important)
+    scaler = RobustScaler().fit(sample) # in-built scikit-learn feature, calculates median and IQR for each column
+    # isolationforest with 200 trees, averaging their results, assuming 10% of data is anomalous
+    # -> unsupervised algorithm -> good for isolating unusual points (anomaly detection)
+    model = IsolationForest(n_estimators=200, contamination=0.1, random_state=42).fit(scaler.transform(sample))
+    return {"scaler": scaler, "model": model, "columns": list(numeric_df.columns),
+            "dropped_columns": list(dropped_columns), "fit_rows": len(sample)}
+
+
+# Anomaly score of every flow, scaled and scored chunk_size flows at a time
+# Higher is more unusual, flows scoring above 0 are the ones IsolationForest.predict flags
+# out: optional rows x columns array (e.g. a feature_store matrix) the scaled chunks are also written to
+def score_anomalies(anomaly_model, numeric_df, chunk_size=SCORE_CHUNK_ROWS, out=None):
+    missing = [col for col in anomaly_model["columns"] if col not in numeric_df.columns]
+    if missing:
+        raise ValueError(f"Flows are missing columns used by the anomaly model: {missing}")
+
+    features = numeric_df[anomaly_model["columns"]]
+    scores = np.empty(len(features))
+    for start in range(0, len(features), chunk_size):
+        scaled = anomaly_model["scaler"].transform(features.iloc[start:start + chunk_size])
+        if out is not None:
+            out[start:start + chunk_size] = scaled
+        scores[start:start + chunk_size] = -anomaly_model["model"].decision_function(scaled)
+    return scores
+
+
+# Anomaly scores of flows that are already scaled, e.g. a memory-mapped matrix from feature_store.load_matrix
+# Only chunk_size rows are paged in at a time
+def score_scaled(anomaly_model, scaled, chunk_size=SCORE_CHUNK_ROWS):
+    scores = np.empty(len(scaled))
+    for start in range(0, len(scaled), chunk_size):
+        scores[start:start + chunk_size] = -anomaly_model["model"].decision_function(np.asarray(scaled[start:start + chunk_size]))
+    return scores
+
+
+# Keep a fitted anomaly model to score later captures against the same baseline
+def save_anomaly_model(anomaly_model, path):
+    joblib.dump(anomaly_model, path)
+
+
+def load_anomaly_model(path):
+    return joblib.load(path)
 
+
+# Steps 1-3 of build_dataset: numeric features of the valid flows, with missing values filled
+def numeric_features(df):
     # 1. keep only valid rows from process_dataset.py
     df = df[df["is_valid"] == True] # filter out invalid or corrupted flows
     print(f"Valid rows: {len(df)}") # number of usable flows for ML
@@ -32,40 +92,68 @@ def build_dataset(df, pcap_basename):
     # confirm numeric features and their amount
     print(f"Numeric features: {list(numeric_df.columns)}")
     print(f"Count: {numeric_df.shape[1]}")
+    return numeric_df
 
-    # 4. check for zero-variance features (column where every value is the same -> no variation -> no valuable information)
+
+# Zero-variance columns (every value the same -> no valuable information)
+def zero_variance_columns(numeric_df):
     stds = numeric_df.std() # calculate standard deviation (variation from mean) for each column
-    zero_var = stds[stds < 1e-8] # zero-variance feature when standard deviation is 0, protect from floating point errors 
+    return stds[stds < 1e-8].index.tolist() # zero-variance feature when standard deviation is 0, protect from floating point errors
 
-    if len(zero_var) > 0: # if there are any zero_vars
-        print("Zero-variance features detected and removed:")
-        print(zero_var.index.tolist()) # print list of zero-variance values
-        numeric_df = numeric_df.drop(columns=zero_var.index) # drops (removes) columns with zero-variation values
 
-    # 5. scale values (normalise feature ranges so the model doesn't treat large-number features as more important)
-    scaler = RobustScaler() # in-built scikit-learn feature
-    scaled = scaler.fit_transform(numeric_df) # calculates mean and std for each column, then returns the scaled version
+# reference: an anomaly model (or path to a saved one) to score against instead of fitting on this capture
+# save_scaled: also write the scaled matrix to npy_output/<pcap_basename>_scaled.npy (see feature_store)
+def build_dataset(df, pcap_basename, reference=None, max_fit_rows=FIT_SAMPLE_ROWS, chunk_size=SCORE_CHUNK_ROWS,
+                  save_scaled=False, npy_dir=None):
+
+    print("Building ML dataset") # confirm csv file that is being passed into function
 
-    # 6. save scaled data as npy file (binary matrix format), ready to be passed to the model to be trained
+    # 1-3. valid flows, numeric features only
+    numeric_df = numeric_features(df)
 
-    # npy file creation in sem 2
-    #npy_file = "npy_output/" + pcap_basename + ("_scaled.npy") # create new .npy file with same base name as the pcap file
-    #np.save(npy_file, scaled) # saves the scaled numpy array to npy file
-    #print(f"Scaled dataset saved to {npy_file}")
+    # 4. check for zero-variance features (column where every value is the same -> no variation -> no valuable information)
+    # a reference model keeps the columns it was fitted on, so its scores stay comparable between captures
+    if isinstance(reference, str):
+        reference = load_anomaly_model(reference)
+    zero_var = zero_variance_columns(numeric_df) if reference is None else reference["dropped_columns"]
+    zero_var = [col for col in zero_var if col in numeric_df.columns]
 
-    print(f"Shape: {scaled.shape}") # binary matrix preview
+    if len(zero_var) > 0: # if there are any zero_vars
+        print("Zero-variance features detected and removed:")
+        print(zero_var) # print list of zero-variance values
+        numeric_df = numeric_df.drop(columns=zero_var) # drops (removes) columns with zero-variation values
 
-    # 7. simple anomaly preview using isolationforest algorithm -> unsupervised algorithm -> good for isolating unusual points (anomaly detection)
-    model = IsolationForest(n_estimators=200, contamination=0.1, random_state=42).fit(scaled) # isolationforest with 200 trees, averaging their results, assuming 10% of data is anomalous
-    preds = model.predict(scaled) # apply model to the scaled data and return predicted 1/-1 values (anormal/normal)
-    anomalies = np.sum(preds == -1) # print amount of flows (rows) that are flagged as anomaly
+    # 5. fit the scaler and anomaly model, on a random sample for large captures, unless a reference model is given
+    if reference is None:
+        anomaly_model = fit_anomaly_model(numeric_df, max_fit_rows, dropped_columns=zero_var)
+    else:
+        anomaly_model = reference
+    print(f"Anomaly model fitted on {anomaly_model['fit_rows']} flows")
+
+    print(f"Shape: {numeric_df.shape}") # binary matrix preview
+
+    # 6-7. simple anomaly preview, score every flow in chunks -> positive scores are anomalous
+    if save_scaled:
+        # save scaled data as memory-mappable npy file (binary matrix format) with a json column schema,
+        # each chunk is written as it is scaled so the whole matrix is never held in memory
+        name = pcap_basename + "_scaled" # same base name as the pcap file
+        scaler = anomaly_model["scaler"]
+        with open_writer(name, len(numeric_df), anomaly_model["columns"], npy_dir, source=pcap_basename,
+                         scaler={"center": scaler.center_.tolist(), "scale": scaler.scale_.tolist()},
+                         fit_rows=anomaly_model["fit_rows"], baseline=reference is not None) as scaled:
+            scores = score_anomalies(anomaly_model, numeric_df, chunk_size, out=scaled)
+        print(f"Scaled dataset saved to {matrix_paths(name, npy_dir)[0]}")
+    else:
+        scores = score_anomalies(anomaly_model, numeric_df, chunk_size)
+    flagged = scores > 0
+    anomalies = np.sum(flagged) # print amount of flows (rows) that are flagged as anomaly
 
     # print amount of flagged flows, usually between 10-50%
-    print(f"Anomaly preview: {anomalies}/{len(preds)} flows flagged")
+    print(f"Anomaly preview: {anomalies}/{len(scores)} flows flagged")
 
     if anomalies == 0: # no flows flagged
         print("No anomalies detected - dataset may be too uniform")
-    elif anomalies > len(preds) * 0.5: # more than half of the flows were flagged
+    elif anomalies > len(scores) * 0.5: # more than half of the flows were flagged
         print("Many anomalies detected - dataset may be unusual")
     else:
         print("Anomaly level within expected range")
@@ -73,13 +161,16 @@ def build_dataset(df, pcap_basename):
     print("Dataset ready for ML") # cleaned and scaled dataset ready to be passed through model
     
     # add column for anomaly results to numeric_df for dashboard prototype
-    numeric_df["anomaly"] = (preds == -1)
+    numeric_df["anomaly"] = flagged
+    numeric_df["anomaly_score"] = scores
 
     # dictionary to hold anomaly info for dashboard prototype
     anomaly_info = {
         "anomaly_count": int(anomalies),
-        "total_flows": int(len(preds)),
-        "anomaly_percentage": float(anomalies / len(preds) * 100),
+        "total_flows": int(len(scores)),
+        "anomaly_percentage": float(anomalies / len(scores) * 100),
+        "fit_rows": int(anomaly_model["fit_rows"]),
+        "baseline": reference is not None,
     }
 
     return numeric_df, anomaly_info # for dashboard prototype
@@ -4,8 +4,10 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import main
-import tempfile
+import time
+from jobs import JobManager
+from result_cache import ResultCache, cleanup_uploads, write_upload
+from rollups import build_rollups, chart_tables, flow_mask, time_series
 
 st.set_page_config(page_title="Network Traffic Profiler", layout="wide")
 st.title("Network Traffic Dashboard")
@@ -14,51 +16,51 @@ st.title("Network Traffic Dashboard")
 # Run pipeline
 # ---------------------
 
-# Caches result to speed up filtering data
-# Only bypasses the cache if func arguments change
-# show_spinner=False prevents a loading spinner from being displayed,
-# of which the content of is un-modifable. A custom spinner is used later.
-# In dashboard.py
-@st.cache_data(show_spinner=False)
-def load_dataset(path):
-    # Create a grouped progress area
-    with st.status("Processing...", state="running", expanded=True) as status:
-        # Pass the status object to the pipeline
-        # catch exceptions so no raw tracebacks are passed to the dashboard
-        try:
-            results = main.run_pipeline(path, status)
-        except Exception as e:
-            status.update(label="Processing failed.", state="error", expanded=False)
-            raise RuntimeError(str(e))
-        status.update(label="Processing Complete! Loading results...", state="complete", expanded=False)
-    return results
+# Results are cached by the content hash of the capture (see result_cache.py), so re-uploading
+# a capture that was already processed skips the pipeline. The cache is shared by every session.
+@st.cache_resource
+def result_cache():
+    cache = ResultCache()
+    # Uploads left behind by runs that never finished
+    cleanup_uploads()
+    return cache
+
+# Pipelines run in the background (see jobs.py), shared by every session of this server
+@st.cache_resource
+def job_manager():
+    return JobManager(cache=result_cache())
+
+# Seconds between two polls of a running job
+POLL_SECONDS = 1
 
 # check for possible exceptions from scapy error logs and report back readable error messages
-def safe_load_dataset(path):
-    try:
-        result = load_dataset(path)
-    except RuntimeError as e:
-        msg = str(e).lower()
-        # check for keywords in error trace log 
-        if any(kw in msg for kw in ("no data", "no data could be read", "not a pcap", "magic", "invalid", "truncated", "corrupt", "empty")):
-            raise RuntimeError(
-                "The file appears to be empty or is not a valid PCAP/PCAPNG file."
-            )
-        raise RuntimeError(f"An unexpected error occurred while processing the file: {e}")
-    except Exception as e:
-        raise RuntimeError(f"An unexpected error occurred while processing the file: {e}")
-
-    if result is None or not isinstance(result, (tuple, list)) or len(result) != 3:
+def pipeline_error_message(error):
+    msg = str(error).lower()
+    # check for keywords in error trace log 
+    if any(kw in msg for kw in ("no data", "no data could be read", "not a pcap", "magic", "invalid", "truncated", "corrupt", "empty")):
+        return "The file appears to be empty or is not a valid PCAP/PCAPNG file."
+    return f"An unexpected error occurred while processing the file: {error}"
+
+# Width of a traffic timeline bucket for display, e.g. 100 ms, 5 s, 15 min
+def bucket_label(seconds):
+    for unit, size in (("day", 24 * 60 * 60), ("h", 60 * 60), ("min", 60), ("s", 1)):
+        if seconds >= size:
+            return f"{seconds / size:g} {unit}"
+    return f"{seconds * 1000:g} ms"
+
+# safe load, in case one of the values is missing from the results of a job
+def check_results(result):
+    if result is None or not isinstance(result, (tuple, list)) or len(result) != 4:
         raise RuntimeError("The pipeline returned an unexpected result.")
 
-    flows_df, numeric_df, anomaly_info = result
+    flows_df, numeric_df, anomaly_info, perf_report = result
 
     if flows_df is None or (isinstance(flows_df, pd.DataFrame) and flows_df.empty):
         raise RuntimeError(
             "No network flows were found in this PCAP file: the file may be empty, contain no recognised traffic, or all flows were filtered out during parsing."
         )
 
-    return flows_df, numeric_df, anomaly_info
+    return flows_df, numeric_df, anomaly_info, perf_report
 
 
 # Initialise session state keys
@@ -78,12 +80,24 @@ if "current_file" not in st.session_state:
     st.session_state.current_file = None
 if "pipeline_error" not in st.session_state:
     st.session_state.pipeline_error = None
+if "perf_report" not in st.session_state:
+    st.session_state.perf_report = None
+if "job_id" not in st.session_state:
+    st.session_state.job_id = None
+if "rollups" not in st.session_state:
+    st.session_state.rollups = None
 
 # PCAP File Upload
 st.sidebar.header("File Upload")
+# Results of earlier uploads are kept until they are evicted for space, or cleared here
+if st.sidebar.button("Clear cached results"):
+    result_cache().clear()
+    st.sidebar.success("Cached results cleared")
 uploaded_file = st.sidebar.file_uploader("Upload a .pcap/.pcapng file", type=["pcap", "pcapng"], accept_multiple_files=False, max_upload_size=5000)
+# The job submitted by this session, or the one in the URL (?job=<id>) after a refresh
+job_id = st.session_state.job_id or st.query_params.get("job")
 # If no file has been uploaded, stop the app
-if uploaded_file is None:
+if uploaded_file is None and job_id is None:
     st.info("Upload a PCAP file to start!")
 
     # Legal notice for user to upload data only under compliance with UK law
@@ -110,16 +124,21 @@ if uploaded_file is None:
     st.stop()
 
 # If user selects new file, reset state to prompt for confirmation again
-if uploaded_file != st.session_state.current_file:
+if uploaded_file is not None and uploaded_file != st.session_state.current_file:
     st.session_state.current_file = uploaded_file
     st.session_state.file_pending_upload = True
     st.session_state.flows = None # Clear old results
+    st.session_state.rollups = None
     st.session_state.pipeline_error = None
+    st.session_state.job_id = job_id = None
+    st.query_params.pop("job", None)
 
 # Checkbox to confirm ownership/authorisation
-if st.session_state.file_pending_upload:
+if uploaded_file is not None and st.session_state.file_pending_upload:
     warning_placeholder = st.sidebar.empty()
     confirm = st.sidebar.checkbox("I confirm that I own or am authorised to analyse this PCAP file (required)")
+    # cProfile/tracemalloc per stage, shown in the Performance panel
+    profile = st.sidebar.checkbox("Profile pipeline stages (slower)")
 
     # Button to upload PCAP file
     upload_clicked = st.sidebar.button("Process PCAP")
@@ -140,38 +159,49 @@ if st.session_state.file_pending_upload:
 
     # If the user checked the box and clicked the button, process the file
     if confirm and upload_clicked:
-        # Write to a temporary file as web applications cannot access
-        # local files on a computer
-        temp = tempfile.NamedTemporaryFile(delete=False, suffix=".pcap")
-        temp.write(uploaded_file.read())
-        # Run pipeline passing through the temporary file
-        
-        # safe load, in case one of the values is missing from the return in main.py
+        # Write to a temporary file as web applications cannot access local files on a computer.
+        # Copied in chunks and hashed on the way, the job removes it once the pipeline is done with it
+        path, digest = write_upload(uploaded_file)
+        st.session_state.job_id = job_manager().submit(path, digest, uploaded_file.name, profile)
+        # Kept in the URL so a refresh picks the job up again
+        st.query_params["job"] = st.session_state.job_id
+
+        # Mark file as submitted, hides checkbox & button
+        st.session_state.file_pending_upload = False
+        st.rerun() # Immediate refresh
+
+# Follow the job until its results are loaded
+if job_id is not None and st.session_state.flows is None and not st.session_state.pipeline_error:
+    st.session_state.job_id = job_id
+    job = job_manager().status(job_id)
+    if job is None:
+        st.session_state.pipeline_error = "This job could not be found. Please upload the PCAP file again."
+    elif job["state"] in ("queued", "running"):
+        st.progress(job["progress"] / 100, text=f"{job['name']}: {job['message']} ({job['progress']}%)")
+        if st.button("Cancel processing"):
+            job_manager().cancel(job_id)
+        time.sleep(POLL_SECONDS)
+        st.rerun()
+    elif job["state"] == "cancelled":
+        st.session_state.pipeline_error = "Processing was cancelled."
+    elif job["state"] == "failed":
+        st.session_state.pipeline_error = pipeline_error_message(job["error"])
+    else:
         try:
-            flows_df, numeric_df, anomaly_info = safe_load_dataset(temp.name)
+            flows_df, numeric_df, anomaly_info, perf_report = check_results(job_manager().result(job_id))
 
             # Update session state to track uploaded file
             st.session_state.flows = flows_df
-            st.session_state.uploaded_file_name = uploaded_file.name
+            st.session_state.uploaded_file_name = job["name"]
             st.session_state.numeric_df = numeric_df
             st.session_state.anomaly_info = anomaly_info
+            st.session_state.perf_report = perf_report
+            # Pre-aggregated chart tables, built by the job alongside the result
+            st.session_state.rollups = job_manager().rollups(job_id)
             st.session_state.pipeline_error = None
 
-            # Mark file as processed, hides checkbox & button
-            st.session_state.file_pending_upload = False
-            st.rerun() # Immediate refresh
-
         except RuntimeError as e:
             st.session_state.pipeline_error = str(e)
-            st.session_state.file_pending_upload = False
-            st.rerun()
-
-        except Exception as e:
-            st.session_state.pipeline_error = (
-                f"Unexpected error occurred: {e}\n\n"
-            )
-            st.session_state.file_pending_upload = False
-            st.rerun()
 
 # show error message
 if st.session_state.pipeline_error:
@@ -183,15 +213,13 @@ if st.session_state.flows is None:
     st.info("Please confirm to process the uploaded PCAP file.")
     st.stop()
 
-# Copy the extracted data into a dataframe
-df = st.session_state.flows.copy()
+# Removes invalid rows, the selection copies the extracted data
+df = st.session_state.flows[st.session_state.flows["is_valid"] == True]
 
-# ensure correct formating for port display on macOS
-df["src_port"] = df["src_port"].astype("Int64")
-df["dst_port"] = df["dst_port"].astype("Int64")
-
-# Removes invalid rows
-df = df[df["is_valid"] == True]
+# Built here when the result was stored without them (e.g. evicted from the disk cache)
+if st.session_state.rollups is None:
+    st.session_state.rollups = build_rollups(st.session_state.flows)
+rollups = st.session_state.rollups
 
 # show error message if all flows invalid
 if df.empty:
@@ -231,30 +259,19 @@ dst_ports = st.sidebar.multiselect(
     sorted(df["dst_port"].dropna().unique())
 )
 
-filtered = df.copy()
-
-# Apply filters
-if protocols:
-    filtered = filtered[filtered["protocol_name"].isin(protocols)]
-
-if src_ips:
-    filtered = filtered[filtered["src_ip"].isin(src_ips)]
-
-if dst_ips:
-    filtered = filtered[filtered["dst_ip"].isin(dst_ips)]
-
-if src_ports:
-    filtered = filtered[filtered["src_port"].isin(src_ports)]
-
-if dst_ports:
-    filtered = filtered[filtered["dst_port"].isin(dst_ports)]
+# Apply filters, as one row mask over the rollup codes (rows line up with df)
+mask = flow_mask(rollups, protocol_name=protocols, src_ip=src_ips, dst_ip=dst_ips,
+                 src_port=src_ports, dst_port=dst_ports)
+filtered = df if mask is None else df[mask]
+# Chart tables for the filtered flows, summed from the rollups instead of grouping filtered
+charts = chart_tables(rollups, mask, top_endpoints=20, top_conversations=10)
 
 # return message if no flows match the filter
 if filtered.empty:
     st.warning("No flows match the current filter combination.")
     st.stop()
 
-filtered["action_type"] = filtered["action_type"].replace("Play", "Streaming")
+filtered = filtered.assign(action_type=filtered["action_type"].replace("Play", "Streaming"))
 
 # Table View Filters
 st.sidebar.header("Table Display Options")
@@ -264,12 +281,14 @@ show_top_conversations = st.sidebar.checkbox("Top Conversations", value=True)
 show_flow_table = st.sidebar.checkbox("All Flows", value=True)
 show_anomalous_table = st.sidebar.checkbox("Anomalous Flows", value=True)
 show_flagged_flows = st.sidebar.checkbox("Flagged Flows", value=True)
+show_performance = st.sidebar.checkbox("Performance", value=False)
 
 # CSV Download
 st.sidebar.header("Download Data")
 st.sidebar.download_button(
     label="Download Filtered CSV",
-    data=filtered.to_csv(index=False).encode("utf-8"),
+    # Only converted when the button is clicked, not on every rerun
+    data=lambda flows=filtered: flows.to_csv(index=False).encode("utf-8"),
     file_name="filtered_flows.csv",
     mime="text/csv"
 )
@@ -290,6 +309,7 @@ LABEL_NAMES = {
     "duration": "Flow Duration (s)",
     "error_reason": "Flagged Reason",
     "anomaly": "Anomaly",
+    "anomaly_score": "Anomaly Score",
     "conversation": "Conversation Pair",
     "total_bytes": "Total Bytes",
     "total_packets": "Total Packets",
@@ -339,7 +359,8 @@ colors = {
 with col_a:
     st.write("Traffic Composition (Data Transferred per Action)")
 
-    pie_df = filtered.groupby("action_type", dropna=False)["byte_count"].sum().reset_index()
+    pie_df = charts["actions"][["action_type", "byte_count"]].copy()
+    pie_df["action_type"] = pie_df["action_type"].replace("Play", "Streaming")
     if not pie_df.empty:
         fig_pie = px.pie(
             pie_df,
@@ -414,68 +435,56 @@ if st.session_state.anomaly_info is not None:
     col1.metric("Anomalous Flows", info["anomaly_count"])
     col2.metric("Total Flows", info["total_flows"])
     col3.metric("Anomaly %", f"{info['anomaly_percentage']:.2f}%")
+    if info.get("baseline"):
+        st.caption(f"Scored against the trained baseline model ({info['fit_rows']} flows), comparable between captures.")
 
 # Traffic over time
 st.subheader("Traffic Volume Over Time (Bytes)")
 st.write("Visualises how much traffic occurred over time, helping identify spikes, bursts, or unusual peaks in network activity.")
-time_df = filtered.groupby("first_packet_index")["byte_count"].sum().reset_index()
-
-fig_time = px.bar(
-    time_df,
-    x="first_packet_index",
-    y="byte_count",
-    labels={
-        "first_packet_index": "Time (Packet Index)",
-        "byte_count": "Bytes"
-    }
-)
+# Bytes per time bucket from the rollups, never more than a few thousand bars (see rollups.time_series)
+timeline = rollups["timeline"]
+if timeline.empty:
+    st.info("No timing data available.")
+else:
+    fine_seconds = float(timeline["seconds"].iloc[0])
+    capture_seconds = float(timeline["start"].iloc[-1]) + fine_seconds
+    # Narrowing the window re-buckets it with narrower buckets
+    window = st.slider("Time window (seconds into the capture)", min_value=0.0, max_value=capture_seconds,
+                       value=(0.0, capture_seconds), step=fine_seconds)
+    time_df, width = time_series(rollups, mask, start=window[0], end=window[1])
+
+    fig_time = px.bar(
+        time_df,
+        x="start",
+        y="byte_count",
+        labels={
+            "start": "Time (s)",
+            "byte_count": "Bytes"
+        }
+    )
 
-st.plotly_chart(fig_time, width="stretch")
+    st.plotly_chart(fig_time, width="stretch")
+    st.caption(f"Each bar holds {bucket_label(width)} of traffic, by the time each flow started.")
 
 # Table
 # Top Endpoints Table
 if show_top_endpoints:
     st.subheader("Top Endpoints")
     st.write("Shows which IP pairs exchanged the most data. Useful for identifying the busiest devices on the network.")
-    endpoints_df = (
-        filtered.groupby(["src_ip", "dst_ip"])["byte_count"]
-        .sum()
-        .reset_index()
-        .sort_values(by="byte_count", ascending=False)
-        .head(20)
-    )
+    endpoints_df = charts["endpoints"][["src_ip", "dst_ip", "byte_count"]]
     st.dataframe(rename_cols(endpoints_df), width="stretch")
 
 
 # Top Conversations Table 
-# Add IP-pair conversation key
-df["conversation"] = df.apply(
-    lambda r: tuple(sorted([r["src_ip"], r["dst_ip"]])),
-    axis=1
-)
-
+# Conversations group both directions of an IP pair, the lower address first (see rollups.py)
 if show_top_conversations:
     st.subheader("Top Conversations")
     st.write("Top network conversations between two IP addresses ranked on total bytes transferred.")
-    # Group by conversation pair
-    top_conversations = (
-        df.groupby("conversation")
-        .agg(
-            total_bytes=("byte_count", "sum"),
-            total_packets=("packet_count", "sum"),
-            avg_packet_size=("avg_packet_size", "mean"),
-            flow_count=("conversation", "count"),
-        )
-        .sort_values(by="total_bytes", ascending=False)
-        .reset_index()
-    )
-    # Split pair into individual columns for display
-    top_conversations["Source IP"] = top_conversations["conversation"].apply(lambda x: x[0])
-    top_conversations["Dest IP"] = top_conversations["conversation"].apply(lambda x: x[1])
+    top_conversations = charts["conversations"].rename(columns={"a": "Source IP", "b": "Dest IP"})
     top_conversations = top_conversations[
         ["Source IP", "Dest IP", "total_bytes", "total_packets", "avg_packet_size", "flow_count"]
     ]
-    st.dataframe(rename_cols(top_conversations.head(10)), width="stretch")
+    st.dataframe(rename_cols(top_conversations), width="stretch")
 
 # Anomalous Flows Table
 if show_anomalous_table:
@@ -486,6 +495,8 @@ if show_anomalous_table:
     numeric_df = st.session_state.numeric_df
     if numeric_df is not None and not numeric_df.empty:
         anomalous = numeric_df[numeric_df["anomaly"] == True]
+        if "anomaly_score" in anomalous.columns: # most unusual flows first
+            anomalous = anomalous.sort_values("anomaly_score", ascending=False)
 
         if anomalous.empty:
           st.info("No anomalous flows detected")
@@ -529,3 +540,42 @@ if numeric_df is not None and not numeric_df.empty:
     st.plotly_chart(fig, use_container_width=True)
 else:
     st.info("No data available for the scatter plot.")
+
+# Performance panel
+# per-stage figures recorded by main.run_pipeline, written to disk only for profiled runs or a given perf_dir
+if show_performance and st.session_state.perf_report is not None:
+    report = st.session_state.perf_report
+    st.subheader("Performance")
+    st.write("How processing time and memory were split across the pipeline stages for this capture."
+            "\nPeak RSS is the highest memory use of the process so far, so it only grows from stage to stage.")
+    if report.get("saved_to"):
+        st.caption(f"Report saved to {report['saved_to']}")
+
+    stages_df = pd.DataFrame(report["stages"])
+    perf_cols = {
+        "stage": "Stage",
+        "wall_seconds": "Wall Time (s)",
+        "cpu_seconds": "CPU Time (s)",
+        "peak_rss_mb": "Peak RSS (MB)",
+        "packets_per_sec": "Packets/s",
+        "flows_per_sec": "Flows/s",
+    }
+    stages_df["peak_rss_mb"] = stages_df["peak_rss_bytes"] / (1024 * 1024)
+    display_cols = [col for col in perf_cols if col in stages_df.columns]
+
+    col1, col2 = st.columns(2)
+    col1.metric("Total Time", f"{report['total_wall_seconds']:.2f}s")
+    col2.metric("Capture Size", f"{report['capture_bytes'] / (1024 * 1024):.1f} MB")
+
+    fig_perf = px.bar(stages_df, x="stage", y="wall_seconds",
+                      labels={"stage": "Stage", "wall_seconds": "Wall Time (s)"})
+    st.plotly_chart(fig_perf, width="stretch")
+    st.dataframe(stages_df[display_cols].rename(columns=perf_cols), width="stretch")
+
+    # cProfile / tracemalloc output, only present when profiling was switched on
+    if report.get("profiled"):
+        for stage in report["stages"]:
+            with st.expander(f"Profile: {stage['stage']}"):
+                st.write(f"Peak traced allocations: {stage['traced_peak_bytes'] / (1024 * 1024):.1f} MB")
+                st.dataframe(pd.DataFrame(stage["top_functions"]), width="stretch")
+                st.dataframe(pd.DataFrame(stage["top_allocations"]), width="stretch")
@@ -0,0 +1,131 @@
+# Columnar storage for flow tables and the training dataset
+# The format follows the file extension: .parquet, .feather (Arrow IPC) or .csv.
+# Parquet and Feather files are written with explicit compact dtypes (categoricals for addresses
+# and labels, uint16 ports, float32 features), so reading them back needs no parsing or type
+# inference and only the requested columns are read. Parquet files are also laid out in row
+# groups by action and file_source, so filtered reads skip the row groups that can't match.
+#
+# from .../src run:
+#   python dataset_store.py ML/model_training/master_training_data.csv ML/model_training/master_training_data.parquet
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+FORMATS = {".parquet": "parquet", ".feather": "feather", ".arrow": "feather", ".csv": "csv"}
+
+# Text columns with few distinct values, stored as categoricals
+CATEGORY_COLUMNS = ["src_ip", "dst_ip", "protocol_name", "action", "action_type", "file_source", "error_reason"]
+# Integer columns stored in the smallest type that holds every valid value
+COMPACT_INT_COLUMNS = {"src_port": np.uint16, "dst_port": np.uint16, "protocol": np.uint8}
+
+# Parquet rows are sorted by these, with a new row group whenever the first one changes
+PARTITION_COLUMNS = ["action", "file_source"]
+ROW_GROUP_ROWS = 64 * 1024
+
+
+def storage_format(path):
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown dataset format {extension!r}, expected one of {sorted(FORMATS)}")
+    return FORMATS[extension]
+
+
+# Integer column as dtype if every value fits, otherwise unchanged (e.g. ports missing for ICMP flows)
+def compact_int(series, dtype):
+    if not pd.api.types.is_numeric_dtype(series) or series.isna().any() or series.empty:
+        return series
+    values = series.to_numpy()
+    info = np.iinfo(dtype)
+    if (values != np.round(values)).any() or values.min() < info.min or values.max() > info.max:
+        return series
+    return series.astype(dtype)
+
+
+# Copy of df with the storage dtypes applied
+def apply_dtypes(df):
+    df = df.copy()
+    for col in df.columns:
+        if col in CATEGORY_COLUMNS:
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                # protocol_name mixes names and raw protocol numbers, stored as text
+                df[col] = df[col].astype("string").astype("category")
+        elif col in COMPACT_INT_COLUMNS:
+            df[col] = compact_int(df[col], COMPACT_INT_COLUMNS[col])
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+# Writes df to path in the format of its extension
+# CSV output is written as before (no dtype changes), so existing readers see the same values
+def write_table(df, path, partition_by=PARTITION_COLUMNS, row_group_rows=ROW_GROUP_ROWS):
+    file_format = storage_format(path)
+    directory = os.path.dirname(str(path))
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if file_format == "csv":
+        df.to_csv(path, index=False)
+        return df
+
+    df = apply_dtypes(df).reset_index(drop=True)
+    if file_format == "feather":
+        df.to_feather(path)
+        return df
+
+    keys = [col for col in partition_by if col in df.columns]
+    if keys:
+        df = df.sort_values(keys, kind="stable").reset_index(drop=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # one row group per run of the first key (e.g. per action), split further once it gets large
+    starts = [0]
+    if keys and len(df):
+        first = df[keys[0]].astype(object).to_numpy()
+        starts = [0] + (np.flatnonzero(first[1:] != first[:-1]) + 1).tolist()
+    with pq.ParquetWriter(path, table.schema) as writer:
+        for start, end in zip(starts, starts[1:] + [len(df)]):
+            writer.write_table(table.slice(start, end - start), row_group_size=row_group_rows)
+    return df
+
+
+# Reads a table written by write_table (or any CSV)
+# columns: only these columns are read, filters: pyarrow filters such as [("action", "=", "Like")]
+def read_table(path, columns=None, filters=None):
+    file_format = storage_format(path)
+    if file_format == "parquet":
+        return pd.read_parquet(path, columns=columns, filters=filters)
+
+    if file_format == "feather":
+        df = pd.read_feather(path, columns=columns)
+    else:
+        df = apply_dtypes(pd.read_csv(path, usecols=columns))
+        if columns is not None:
+            df = df[columns]
+    for col, op, value in filters or []:
+        if op in ("=", "=="):
+            df = df[df[col] == value]
+        elif op == "!=":
+            df = df[df[col] != value]
+        elif op == "in":
+            df = df[df[col].isin(value)]
+        else:
+            raise ValueError(f"Unsupported filter operator {op!r}")
+    return df.reset_index(drop=True)
+
+
+# First of paths that exists, e.g. a Parquet dataset with a CSV fallback
+def first_existing(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"None of {list(paths)} exist")
+
+
+if __name__ == "__main__":
+    source, target = sys.argv[1], sys.argv[2]
+    written = write_table(read_table(source), target)
+    print(f"Converted {source} -> {target} ({len(written)} rows, {os.path.getsize(target)} bytes)")
@@ -1,74 +1,148 @@
 import pandas as pd
+import numpy as np
 import os
-import ipaddress
-from scapy.all import rdpcap
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scapy.all import rdpcap, PcapReader
+import packet_parser
+from ip_utils import YOUTUBE_MATCHER
+
+# "scapy" dissects every packet with Scapy, "fast" decodes the headers directly with packet_parser
+ENGINES = ("scapy", "fast")
+
+# Packets between two progress reports while reading a shard in this process
+PROGRESS_PACKETS = 50_000
+
+FLOW_KEY_COLS = ["src_ip", "dst_ip", "src_port", "dst_port", "protocol"]
+
+FLOW_COLS = FLOW_KEY_COLS + [
+    "packet_count", "byte_count", "avg_packet_size", "start_time", "end_time",
+    "first_packet_index", "last_packet_index"
+]
+
+# Compact dtypes of df_flows, applied by finish_flows in every extraction mode
+# Addresses and protocol names repeat across flows, so they are stored once as categories.
+# Ports are nullable so a flow without ports can be represented, byte_count is 64-bit as a
+# long flow can pass 4 GiB. start/end times stay float64: seconds into a long capture lose
+# sub-millisecond detail in float32.
+FLOW_DTYPES = {
+    "src_ip": "category",
+    "dst_ip": "category",
+    "src_port": "UInt16",
+    "dst_port": "UInt16",
+    "protocol": "uint8",
+    "packet_count": "uint32",
+    "byte_count": "uint64",
+    "avg_packet_size": "float32",
+    "start_time": "float64",
+    "end_time": "float64",
+    "first_packet_index": "uint32",
+    "last_packet_index": "uint32",
+    "duration": "float32",
+    "protocol_name": "category",
+}
 
 # Check if an IP belongs to known Youtube CIDR blocks
 def is_google_youtube_ip(ip_str):
-    try:
-        ip_obj = ipaddress.ip_address(ip_str)
-        known_ranges = [
-            "172.217.0.0/16", "142.250.0.0/15", "104.237.160.0/19", 
-            "208.117.224.0/19", "64.15.112.0/20", "216.58.192.0/19", "74.125.0.0/16"
-        ]
-        for network in known_ranges:
-            if ip_obj in ipaddress.ip_network(network):
-                return True
-        return False
-    except ValueError:
-        return False
+    return YOUTUBE_MATCHER.contains(ip_str)
+
+# Read the fields used by both aggregations from a scapy packet
+# Returns None for packets without an IP layer
+def packet_fields(pkt):
+    if "IP" not in pkt:
+        return None
+
+    if pkt.haslayer("TCP"):
+        sport, dport = pkt["TCP"].sport, pkt["TCP"].dport
+    elif pkt.haslayer("UDP"):
+        sport, dport = pkt["UDP"].sport, pkt["UDP"].dport
+    else:
+        sport, dport = None, None
+
+    return pkt["IP"].src, pkt["IP"].dst, sport, dport, pkt["IP"].proto, len(pkt), float(pkt.time)
+
+# Returns True if the packet belongs to a flow the ML model is interested in
+def is_ml_packet(src_ip, dst_ip, sport):
+    return sport is not None and (is_google_youtube_ip(src_ip) or is_google_youtube_ip(dst_ip))
+
+# Outbound packets are the ones sent to a web port
+def is_outbound_port(dport):
+    return 1 if dport in [443, 80, 4433] else 0
+
+# Yield (index, src_ip, dst_ip, sport, dport, protocol, size, timestamp) for every IP packet
+# in the capture using the selected engine
+def iter_packet_rows(pcap_file, engine="scapy", streaming=False):
+    if engine == "fast":
+        # packet_parser always reads the file one record at a time
+        yield from packet_parser.iter_packet_fields(pcap_file)
+        return
+
+    if streaming:
+        with PcapReader(pcap_file) as packets:
+            yield from scapy_packet_rows(packets)
+    else:
+        yield from scapy_packet_rows(rdpcap(pcap_file))
+
+def scapy_packet_rows(packets):
+    for i, pkt in enumerate(packets):
+        fields = packet_fields(pkt)
+        if fields is not None:
+            yield (i,) + fields
 
 # Process a PCAP file and produce a dataframe where each row represents a flow
-def extract_all_pcap_data(pcap_file, ml_only=False, label=None):
+# streaming=True reads the capture one packet at a time instead of loading it with rdpcap,
+# so memory grows with the number of flows rather than the number of packets
+# engine="fast" skips Scapy's packet dissection (see packet_parser.py), the rows are the same
+# workers > 1 splits large captures into shards that are parsed in parallel and merged,
+# this always aggregates like streaming=True
+# progress: called with the fraction of the capture read so far, the capture is then read through
+# the shard reader (a single shard without workers)
+def extract_all_pcap_data(pcap_file, ml_only=False, label=None, streaming=False, engine="scapy", workers=None,
+                          progress=None):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown extraction engine: {engine} (expected one of {ENGINES})")
+
     # End early if file doesn't exist
     if not os.path.exists(pcap_file):
         return None, None
- 
-    packets = rdpcap(pcap_file)
-    
+
+    if (workers is not None and workers > 1) or progress is not None:
+        shards = packet_parser.plan_shards(pcap_file, workers or 1)
+        return aggregate_shards(pcap_file, shards, ml_only, label, engine, progress)
+
+    rows = iter_packet_rows(pcap_file, engine, streaming)
+    if streaming:
+        return aggregate_streaming(rows, ml_only, label)
+
     # Containers for the two different aggregation types
     standard_rows = []
-    ml_flow_map = {}
+    # ML packets are kept as columns, each flow gets an id in order of first appearance
+    ml_flow_ids = {}
+    ml_packets = {"flow": [], "ts": [], "size": [], "is_outbound": []}
 
-    for i, pkt in enumerate(packets):
-        if "IP" in pkt:
-            # Basic packet extraction for analysis
-            src_ip = pkt["IP"].src
-            dst_ip = pkt["IP"].dst
-            protocol_num = pkt["IP"].proto
-            size = len(pkt)
-            ts = float(pkt.time)
-
-            if pkt.haslayer("TCP"):
-                sport, dport = pkt["TCP"].sport, pkt["TCP"].dport
-            elif pkt.haslayer("UDP"):
-                sport, dport = pkt["UDP"].sport, pkt["UDP"].dport
-            else:
-                sport, dport = None, None
-
-            # Add to general packet list
-            if not ml_only:
-                standard_rows.append([src_ip, dst_ip, sport, dport, protocol_num, size, ts, i])
-
-            # ML feature extraction
-            # Filter for YouTube IPs and valid ports
-            if sport is not None and (is_google_youtube_ip(src_ip) or is_google_youtube_ip(dst_ip)):
-                flow_key = (src_ip, dst_ip, sport, dport, protocol_num)
-                
-                if flow_key not in ml_flow_map:
-                    ml_flow_map[flow_key] = []
-                
-                is_outbound = 1 if dport in [443, 80, 4433] else 0
-                ml_flow_map[flow_key].append({'ts': ts, 'size': size, 'is_outbound': is_outbound})
+    for i, src_ip, dst_ip, sport, dport, protocol_num, size, ts in rows:
+        # Add to general packet list
+        if not ml_only:
+            standard_rows.append([src_ip, dst_ip, sport, dport, protocol_num, size, ts, i])
+
+        # ML feature extraction
+        # Filter for YouTube IPs and valid ports
+        if is_ml_packet(src_ip, dst_ip, sport):
+            flow_key = (src_ip, dst_ip, sport, dport, protocol_num)
+            flow_id = ml_flow_ids.setdefault(flow_key, len(ml_flow_ids))
+
+            ml_packets["flow"].append(flow_id)
+            ml_packets["ts"].append(ts)
+            ml_packets["size"].append(size)
+            ml_packets["is_outbound"].append(is_outbound_port(dport))
 
     # --- Processing General Flows ---
     df_packets = pd.DataFrame(standard_rows, columns=[
         "src_ip", "dst_ip", "src_port", "dst_port", "protocol", "packet_size", "timestamp", "packet_index"
     ])
-    
+
     # Aggregate standard flow metrics
-    flow_key_cols = ["src_ip", "dst_ip", "src_port", "dst_port", "protocol"]
-    df_flows = df_packets.groupby(flow_key_cols).agg(
+    df_flows = df_packets.groupby(FLOW_KEY_COLS).agg(
         packet_count=("packet_size", "count"),
         byte_count=("packet_size", "sum"),
         avg_packet_size=("packet_size", "mean"),
@@ -77,52 +151,328 @@ def extract_all_pcap_data(pcap_file, ml_only=False, label=None):
         first_packet_index=("packet_index", "min"),
         last_packet_index=("packet_index", "max")
     ).reset_index()
+    df_flows = finish_flows(df_flows)
+
+    # --- Processing ML Features ---
+    ml_df = compute_ml_features(list(ml_flow_ids), ml_packets)
+    return df_flows, ml_frame(ml_df, label)
+
+# Compute the ML features of every flow in one columnar pass
+# keys: flow 5-tuples indexed by flow id
+# packets: "flow", "ts", "size" and "is_outbound" columns in capture order
+def compute_ml_features(keys, packets):
+    if not keys:
+        return []
+
+    flow = np.asarray(packets["flow"], dtype=np.int64)
+    # Group packets by flow while keeping capture order inside each flow
+    order = np.argsort(flow, kind="stable")
+    ts = np.asarray(packets["ts"], dtype=np.float64)[order]
+    size = np.asarray(packets["size"], dtype=np.int64)[order]
+    outbound = np.asarray(packets["is_outbound"], dtype=np.int64)[order]
+
+    n = np.bincount(flow, minlength=len(keys))
+    starts = np.concatenate(([0], np.cumsum(n)[:-1]))
+
+    # Inter-arrival times restart at 0 on the first packet of each flow
+    iat = np.diff(ts, prepend=ts[0])
+    iat[starts] = 0.0
+
+    duration = np.maximum.reduceat(ts, starts) - np.minimum.reduceat(ts, starts)
+    total_bytes = np.add.reduceat(size, starts)
+    out_pkts = np.add.reduceat(outbound, starts)
+    out_bytes = np.add.reduceat(size * outbound, starts)
+    in_pkts = n - out_pkts
+    in_bytes = total_bytes - out_bytes
+
+    # Divisions guarded the same way as the per-flow formulas, 0 where they don't apply
+    with np.errstate(divide="ignore", invalid="ignore"):
+        throughput = np.where(duration > 0, total_bytes / duration, 0.0)
+        pk_count_ratio = np.where(in_pkts > 0, out_pkts / in_pkts, out_pkts)
+        avg_inbound_size = np.where(in_pkts > 0, in_bytes / in_pkts, 0.0)
+        avg_outbound_size = np.where(out_pkts > 0, out_bytes / out_pkts, 0.0)
+
+    ml_df = pd.DataFrame({
+        # 5-tuple for merging with validated_data in main.py
+        "src_ip": [key[0] for key in keys],
+        "dst_ip": [key[1] for key in keys],
+        "src_port": [key[2] for key in keys],
+        "dst_port": [key[3] for key in keys],
+        "protocol": [key[4] for key in keys],
+
+        # ML features matching training data
+        "duration": duration,
+        "std_iat": segment_std(iat, starts, n),
+        "avg_iat": np.add.reduceat(iat, starts) / n,
+        "pk_count": n,
+        "avg_packet_size": total_bytes / n,
+        "throughput": throughput,
+        "max_pkt_size": np.maximum.reduceat(size, starts),
+        "pkt_burst_std": segment_std(size, starts, n),
+        "pk_count_ratio": pk_count_ratio,
+        "avg_inbound_size": avg_inbound_size,
+        "avg_outbound_size": avg_outbound_size,
+        "total_bytes": total_bytes,
+        "outbound_ratio": out_pkts / n
+    })
+    return ml_df
 
-    # Relative time calculation
+# Sample standard deviation of each contiguous segment, 0 for single packet segments
+# Two-pass like pandas' Series.std so the results agree to rounding
+def segment_std(values, starts, n):
+    mean = np.add.reduceat(values, starts) / n
+    dev = values - np.repeat(mean, n)
+    sq_sum = np.add.reduceat(dev * dev, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(n > 1, np.sqrt(sq_sum / (n - 1)), 0.0)
+
+# Relative times, duration, protocol names and the compact dtypes shared by both extraction modes
+def finish_flows(df_flows):
     p_start = df_flows["start_time"].min()
     df_flows["start_time"] -= p_start
     df_flows["end_time"] -= p_start
     df_flows["duration"] = df_flows["end_time"] - df_flows["start_time"]
-    
-    # Protocol naming
-    df_flows['protocol_name'] = df_flows['protocol'].map({6: 'TCP', 17: 'UDP'}).fillna(df_flows['protocol'])
 
-    # --- Processing ML Features ---
-    ml_features = []
-    for key, pkt_list in ml_flow_map.items():
-        m_df = pd.DataFrame(pkt_list)
-        m_df["iat"] = m_df["ts"].diff().fillna(0)
-        
-        in_pkts = len(m_df[m_df["is_outbound"] == 0])
-        out_pkts = len(m_df[m_df["is_outbound"] == 1])
-        
-        duration = m_df["ts"].max() - m_df["ts"].min()
-        total_bytes = m_df["size"].sum()
-
-        ml_features.append({
-            # 5-tuple for merging with validated_data in main.py
-            "src_ip": key[0],
-            "dst_ip": key[1],
-            "src_port": key[2],
-            "dst_port": key[3],
-            "protocol": key[4],
-
-            # ML features matching training data
-            "duration": m_df["ts"].max() - m_df["ts"].min(),
-            "std_iat": m_df["iat"].std() if len(m_df) > 1 else 0,
-            "avg_iat": m_df["iat"].mean(),
-            "pk_count": len(m_df),
-            "avg_packet_size": m_df["size"].mean(),
-            "throughput": total_bytes / duration if duration > 0 else 0,
-            "max_pkt_size": m_df["size"].max(),
-            "pkt_burst_std": m_df["size"].std() if len(m_df) > 1 else 0,
-            "pk_count_ratio": (out_pkts / in_pkts if in_pkts > 0 else out_pkts),
-            "avg_inbound_size": m_df[m_df["is_outbound"] == 0]["size"].mean() if in_pkts > 0 else 0,
-            "avg_outbound_size": m_df[m_df["is_outbound"] == 1]["size"].mean() if out_pkts > 0 else 0,
-            "total_bytes": m_df["size"].sum(),
-            "outbound_ratio": m_df["is_outbound"].mean()
-        })
-        if label:
-            ml_features["action"] = label
-
-    return df_flows, pd.DataFrame(ml_features)
\ No newline at end of file
+    # Protocol naming, other protocols keep their number (as text, so the column has one type)
+    df_flows['protocol_name'] = df_flows['protocol'].map({6: 'TCP', 17: 'UDP'}).fillna(df_flows['protocol']).astype(str)
+    return df_flows.astype(FLOW_DTYPES)
+
+# Build the ML feature dataframe, labelling every flow when generating training data
+def ml_frame(ml_features, label=None):
+    ml_df = ml_features if isinstance(ml_features, pd.DataFrame) else pd.DataFrame(ml_features)
+    if label and not ml_df.empty:
+        ml_df["action"] = label
+    return ml_df
+
+# Single pass over the packet rows (PcapReader handles both pcap and pcapng)
+# Only running per-flow totals are kept, never the packets themselves
+def aggregate_streaming(rows, ml_only=False, label=None):
+    flow_map = {}
+    ml_flow_map = {}
+    add_packet_rows(rows, flow_map, ml_flow_map, ml_only)
+    return streaming_frames(flow_map, ml_flow_map, label)
+
+def add_packet_rows(rows, flow_map, ml_flow_map, ml_only=False):
+    for i, src_ip, dst_ip, sport, dport, protocol_num, size, ts in rows:
+        flow_key = (src_ip, dst_ip, sport, dport, protocol_num)
+
+        # Flows without ports are dropped by the groupby in the default mode
+        if not ml_only and sport is not None:
+            add_flow_packet(flow_map, flow_key, size, ts, i)
+
+        if is_ml_packet(src_ip, dst_ip, sport):
+            add_ml_packet(ml_flow_map, flow_key, size, ts, is_outbound_port(dport))
+
+# Build df_flows and the ML feature frame from the running flow states
+def streaming_frames(flow_map, ml_flow_map, label=None):
+    rows = [list(key) + flow_row(state) for key, state in flow_map.items()]
+    df_flows = pd.DataFrame(rows, columns=FLOW_COLS)
+    # groupby returns flows sorted by their 5-tuple
+    df_flows = df_flows.sort_values(FLOW_KEY_COLS, kind="mergesort").reset_index(drop=True)
+    df_flows = finish_flows(df_flows)
+
+    ml_features = [ml_feature_row(key, state) for key, state in ml_flow_map.items()]
+    return df_flows, ml_frame(ml_features, label)
+
+# Running flow state: [packet_count, byte_count, start_time, end_time, first_index, last_index]
+def add_flow_packet(flow_map, flow_key, size, ts, index):
+    state = flow_map.get(flow_key)
+    if state is None:
+        flow_map[flow_key] = [1, size, ts, ts, index, index]
+        return
+    state[0] += 1
+    state[1] += size
+    if ts < state[2]:
+        state[2] = ts
+    if ts > state[3]:
+        state[3] = ts
+    state[5] = index
+
+def flow_row(state):
+    count, total, start, end, first, last = state
+    return [count, total, total / count, start, end, first, last]
+
+# Running ML state, updated per packet in capture order:
+# [pk_count, first_ts, last_ts, min_ts, max_ts, iat_count, iat_mean, iat_m2,
+#  byte_sum, byte_sq_sum, max_size, out_count, out_bytes]
+# Inter-arrival times use Welford's online mean/variance, packet sizes are
+# integers so their sums (and sums of squares) stay exact
+def add_ml_packet(ml_flow_map, flow_key, size, ts, is_outbound):
+    state = ml_flow_map.get(flow_key)
+    if state is None:
+        ml_flow_map[flow_key] = [1, ts, ts, ts, ts, 0, 0.0, 0.0,
+                                 size, size * size, size, is_outbound, size * is_outbound]
+        return
+    iat = ts - state[2]
+    state[5] += 1
+    delta = iat - state[6]
+    state[6] += delta / state[5]
+    state[7] += delta * (iat - state[6])
+
+    state[0] += 1
+    state[2] = ts
+    if ts < state[3]:
+        state[3] = ts
+    if ts > state[4]:
+        state[4] = ts
+    state[8] += size
+    state[9] += size * size
+    if size > state[10]:
+        state[10] = size
+    state[11] += is_outbound
+    state[12] += size * is_outbound
+
+# Fold the state of a flow from a later shard into its state from the earlier shards
+def merge_flow_state(state, other, base):
+    state[0] += other[0]
+    state[1] += other[1]
+    state[2] = min(state[2], other[2])
+    state[3] = max(state[3], other[3])
+    state[5] = other[5] + base
+
+def merge_ml_state(state, other):
+    # The inter-arrival time across the shard edge is one extra sample
+    moments = combine_moments(state[5], state[6], state[7], 1, other[1] - state[2], 0.0)
+    state[5], state[6], state[7] = combine_moments(*moments, other[5], other[6], other[7])
+
+    state[0] += other[0]
+    state[2] = other[2]
+    state[3] = min(state[3], other[3])
+    state[4] = max(state[4], other[4])
+    state[8] += other[8]
+    state[9] += other[9]
+    state[10] = max(state[10], other[10])
+    state[11] += other[11]
+    state[12] += other[12]
+
+# Chan et al.'s pairwise update: merge two (count, mean, M2) summaries
+def combine_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    n = n_a + n_b
+    if n == 0:
+        return 0, 0.0, 0.0
+    delta = mean_b - mean_a
+    return n, mean_a + delta * n_b / n, m2_a + m2_b + delta * delta * n_a * n_b / n
+
+# Read one shard of a capture into running flow states, runs in a worker process
+# Packet indexes are relative to the start of the shard. Errors are returned rather than raised,
+# a shard that started at a wrongly guessed boundary can fail on data that isn't a record
+def extract_shard(pcap_file, shard, ml_only=False, engine="fast", progress=None):
+    start = dict(shard["cursor"])
+    cursor = dict(start)
+    flow_map = {}
+    ml_flow_map = {}
+    error = None
+    try:
+        rows = packet_parser.iter_packet_fields(pcap_file, cursor=cursor, end=shard["end"],
+                                                scapy_only=engine == "scapy")
+        if progress is not None:
+            rows = progress_rows(rows, cursor, shard_end(pcap_file, shard), progress)
+        add_packet_rows(rows, flow_map, ml_flow_map, ml_only)
+    except Exception as e:
+        error = e
+    # True when a Simple Packet Block was given a made-up time, see packet_parser.shard_follows
+    needs_ts = cursor.pop("needs_ts", False)
+    return {"start": start, "cursor": cursor, "needs_ts": needs_ts, "flows": flow_map, "ml_flows": ml_flow_map,
+            "error": error}
+
+# Byte offset where a shard stops reading
+def shard_end(pcap_file, shard):
+    return shard["end"] if shard["end"] is not None else os.path.getsize(pcap_file)
+
+# Pass rows through, calling progress(fraction of the shard read) every PROGRESS_PACKETS packets
+# The fraction comes from the cursor, which the reader keeps at the next record's offset
+def progress_rows(rows, cursor, end, progress):
+    start = cursor["pos"]
+    total = max(end - start, 1)
+    for n, row in enumerate(rows, 1):
+        if n % PROGRESS_PACKETS == 0:
+            progress(min((cursor["pos"] - start) / total, 1.0))
+        yield row
+
+# Parse the shards in a process pool and merge their flow states in capture order
+# A shard that doesn't start exactly where the previous one stopped is read again here from the
+# right position, so the frames are the same as a streaming run over the whole capture
+def aggregate_shards(pcap_file, shards, ml_only=False, label=None, engine="fast", progress=None):
+    if len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [pool.submit(extract_shard, pcap_file, shard, ml_only, engine) for shard in shards]
+            if progress is not None:
+                # Reported as each shard finishes, by the bytes of the shards done so far
+                sizes = {future: shard_end(pcap_file, shard) - shard["cursor"]["pos"]
+                         for future, shard in zip(futures, shards)}
+                total = max(sum(sizes.values()), 1)
+                done = 0
+                for future in as_completed(futures):
+                    done += sizes[future]
+                    progress(done / total)
+            results = [future.result() for future in futures]
+    else:
+        results = [extract_shard(pcap_file, shards[0], ml_only, engine, progress)]
+
+    flow_map = {}
+    ml_flow_map = {}
+    cursor = shards[0]["cursor"]
+    # Index of the first packet of the current shard in the whole capture
+    base = 0
+    for shard, result in zip(shards, results):
+        if not packet_parser.shard_follows(result["start"], cursor) or result["needs_ts"]:
+            retry = {"cursor": dict(cursor, count=0), "end": shard["end"]}
+            result = extract_shard(pcap_file, retry, ml_only, engine)
+        if result["error"] is not None:
+            raise result["error"]
+
+        for key, state in result["flows"].items():
+            if key in flow_map:
+                merge_flow_state(flow_map[key], state, base)
+            else:
+                flow_map[key] = state[:4] + [state[4] + base, state[5] + base]
+        for key, state in result["ml_flows"].items():
+            if key in ml_flow_map:
+                merge_ml_state(ml_flow_map[key], state)
+            else:
+                ml_flow_map[key] = state
+
+        if result["cursor"].get("ts", 0.0) is None:
+            # No timestamped packet in the shard, the time is still the previous shard's
+            result["cursor"]["ts"] = cursor["ts"]
+        cursor = result["cursor"]
+        base += cursor["count"]
+        if cursor["done"]:
+            break
+
+    return streaming_frames(flow_map, ml_flow_map, label)
+
+# Turn a running ML state into the same feature row the default mode builds
+def ml_feature_row(key, state):
+    (n, _, _, min_ts, max_ts, iat_count, iat_mean, iat_m2,
+     total_bytes, byte_sq_sum, max_size, out_pkts, out_bytes) = state
+    in_pkts = n - out_pkts
+    in_bytes = total_bytes - out_bytes
+    duration = max_ts - min_ts
+
+    # The first packet of a flow has an inter-arrival time of 0
+    avg_iat = iat_mean * iat_count / n
+    iat_m2 = iat_m2 + iat_mean * iat_mean * iat_count / n
+    size_var = (n * byte_sq_sum - total_bytes * total_bytes) / (n * (n - 1)) if n > 1 else 0
+
+    return {
+        "src_ip": key[0],
+        "dst_ip": key[1],
+        "src_port": key[2],
+        "dst_port": key[3],
+        "protocol": key[4],
+
+        "duration": duration,
+        "std_iat": math.sqrt(iat_m2 / (n - 1)) if n > 1 else 0,
+        "avg_iat": avg_iat,
+        "pk_count": n,
+        "avg_packet_size": total_bytes / n,
+        "throughput": total_bytes / duration if duration > 0 else 0,
+        "max_pkt_size": max_size,
+        "pkt_burst_std": math.sqrt(size_var) if n > 1 else 0,
+        "pk_count_ratio": (out_pkts / in_pkts if in_pkts > 0 else out_pkts),
+        "avg_inbound_size": in_bytes / in_pkts if in_pkts > 0 else 0,
+        "avg_outbound_size": out_bytes / out_pkts if out_pkts > 0 else 0,
+        "total_bytes": total_bytes,
+        "outbound_ratio": out_pkts / n
+    }
@@ -0,0 +1,165 @@
+# On-disk cache of extracted feature frames, keyed by the content hash of the capture
+# Each entry is a directory holding one parquet file per frame plus meta.json.
+# Entries are evicted least recently used first once the cache grows past its size limit.
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from extract_features_unified import extract_all_pcap_data, ml_frame
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feature_cache")
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+# Bump whenever extract_all_pcap_data's output changes so stale entries are never read back
+EXTRACTOR_VERSION = 2
+
+
+# SHA-256 of a file's content, read in chunks so large captures aren't loaded into memory
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+
+    # Cache key for a content digest and the options that change the cached frames
+    def key(self, digest, **options):
+        source = json.dumps({"digest": digest, "version": EXTRACTOR_VERSION, "options": options},
+                            sort_keys=True)
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    # Returns {name: DataFrame} for a cached entry, or None on a miss
+    # columns: {name: column list} to read only those columns of a frame, an empty list skips the frame
+    # Columns a frame doesn't have (e.g. an empty ML frame) come back filled with NaN
+    def get(self, key, columns=None):
+        path = self.entry_path(key)
+        columns = columns or {}
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            frames = {}
+            for name, file_format in meta["frames"].items():
+                frame_path = os.path.join(path, f"{name}.{file_format}")
+                wanted = columns.get(name)
+                if wanted is not None and len(wanted) == 0:
+                    frames[name] = pd.DataFrame()
+                elif file_format == "parquet" and wanted is not None:
+                    stored = pq.read_schema(frame_path).names
+                    frames[name] = pd.read_parquet(frame_path, columns=[c for c in wanted if c in stored]).reindex(columns=wanted)
+                elif file_format == "parquet":
+                    frames[name] = pd.read_parquet(frame_path)
+                else:
+                    frames[name] = pd.read_pickle(frame_path)
+                    if wanted is not None:
+                        frames[name] = frames[name].reindex(columns=wanted)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Reading an entry makes it the most recently used
+        try:
+            os.utime(os.path.join(path, "meta.json"))
+        except OSError:
+            pass
+        return frames
+
+    # Store {name: DataFrame} under key, then evict old entries if the cache is too big
+    def put(self, key, frames, meta=None):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Written to a temporary directory and renamed, so readers never see half an entry
+        tmp_path = os.path.join(self.cache_dir, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_path)
+        formats = {}
+        for name, frame in frames.items():
+            parquet_path = os.path.join(tmp_path, f"{name}.parquet")
+            try:
+                frame.to_parquet(parquet_path)
+                formats[name] = "parquet"
+            except (TypeError, ValueError):
+                # Object columns mixing types (protocol_name holds names and raw protocol numbers)
+                # can't be stored as parquet
+                if os.path.exists(parquet_path):
+                    os.remove(parquet_path)
+                frame.to_pickle(os.path.join(tmp_path, f"{name}.pkl"))
+                formats[name] = "pkl"
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"frames": formats, "created": time.time(), **(meta or {})}, f, default=str)
+
+        try:
+            os.replace(tmp_path, self.entry_path(key))
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.evict()
+
+    # (last used time, size in bytes, path) of every entry
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        result = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(path, "meta.json")
+            if name.startswith(".") or not os.path.isfile(meta_path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            result.append((os.path.getmtime(meta_path), size, path))
+        return result
+
+    # Remove least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+# Cached extract_all_pcap_data: captures with the same content are only parsed once
+# The label is applied after reading from the cache so one entry serves every label
+# The engine and the aggregation mode are part of the key, the engines can disagree on unusual packets
+# and streaming keeps running statistics. workers and progress are not: a sharded run gives the same
+# frames as a streaming pass, so it shares its entries
+# columns: {"flows"/"ml": column list} returns only those columns, see FeatureCache.get
+# digest: the capture's file_digest when the caller already has it (e.g. hashed while uploading)
+def extract_cached(pcap_file, ml_only=False, label=None, cache=None, columns=None, digest=None, **options):
+    if not os.path.exists(pcap_file):
+        return None, None
+    if cache is None:
+        cache = FeatureCache()
+
+    streaming = options.get("streaming", False) or (options.get("workers") or 1) > 1 \
+        or options.get("progress") is not None
+    key = cache.key(digest or file_digest(pcap_file), ml_only=ml_only, engine=options.get("engine", "scapy"),
+                    streaming=streaming)
+    frames = cache.get(key, columns)
+    if frames is None:
+        df_flows, ml_df = extract_all_pcap_data(pcap_file, ml_only, **options)
+        frames = {"flows": df_flows, "ml": ml_frame(ml_df)}
+        cache.put(key, frames, meta={"source": os.path.basename(pcap_file)})
+        for name, wanted in (columns or {}).items():
+            if wanted is not None:
+                frames[name] = frames[name].reindex(columns=wanted) if len(wanted) else pd.DataFrame()
+
+    return frames["flows"], ml_frame(frames["ml"], label)
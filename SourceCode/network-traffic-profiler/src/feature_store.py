@@ -0,0 +1,97 @@
+# Memory-mapped store of scaled feature matrices
+# Each matrix is an .npy file in npy_output/ next to a JSON sidecar holding its column schema.
+# Matrices are written a chunk at a time and read back with mmap_mode="r", so training,
+# anomaly scoring and the dashboard page in only the rows they touch instead of rebuilding
+# the matrix from the raw flows.
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+NPY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "npy_output")
+
+# Bump whenever the sidecar layout changes
+SCHEMA_VERSION = 1
+
+
+# (.npy path, sidecar path) of a stored matrix, name is e.g. "<capture>_scaled"
+def matrix_paths(name, npy_dir=None):
+    base = os.path.join(npy_dir or NPY_DIR, name)
+    return base + ".npy", base + ".json"
+
+
+# Creates an on-disk matrix of rows x len(columns) and yields it for the caller to fill in
+# The .npy and its sidecar only appear once the block finishes, so readers never see half a matrix
+# info: extra sidecar fields (scaler parameters, source capture, ...)
+@contextmanager
+def open_writer(name, rows, columns, npy_dir=None, dtype=np.float64, **info):
+    npy_path, schema_path = matrix_paths(name, npy_dir)
+    os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+    partial = npy_path + ".partial"
+    matrix = np.lib.format.open_memmap(partial, mode="w+", dtype=dtype, shape=(rows, len(columns)))
+    try:
+        yield matrix
+        matrix.flush()
+    except BaseException:
+        del matrix
+        os.remove(partial)
+        raise
+    del matrix
+
+    schema = {
+        "version": SCHEMA_VERSION,
+        "columns": list(columns),
+        "shape": [rows, len(columns)],
+        "dtype": np.dtype(dtype).name,
+        "created": time.time(),
+        **info,
+    }
+    with open(schema_path + ".partial", "w") as f:
+        json.dump(schema, f, indent=2, default=str)
+    os.replace(partial, npy_path)
+    os.replace(schema_path + ".partial", schema_path)
+
+
+# Writes a whole in-memory matrix, e.g. one built outside build_dataset
+def save_matrix(name, values, columns, npy_dir=None, **info):
+    values = np.asarray(values)
+    with open_writer(name, len(values), columns, npy_dir, dtype=values.dtype, **info) as matrix:
+        matrix[:] = values
+    return matrix_paths(name, npy_dir)[0]
+
+
+# Opens a stored matrix, memory-mapped read only by default, returns (matrix, schema)
+# name_or_path: the name given when saving, or the path of its .npy file
+def load_matrix(name_or_path, npy_dir=None, mmap_mode="r"):
+    if name_or_path.endswith(".npy"):
+        npy_path, schema_path = name_or_path, name_or_path[:-len(".npy")] + ".json"
+    else:
+        npy_path, schema_path = matrix_paths(name_or_path, npy_dir)
+    with open(schema_path) as f:
+        schema = json.load(f)
+    if schema.get("version") != SCHEMA_VERSION:
+        raise ValueError(f"{schema_path} has schema version {schema.get('version')}, expected {SCHEMA_VERSION}")
+
+    matrix = np.load(npy_path, mmap_mode=mmap_mode)
+    if list(matrix.shape) != schema["shape"]:
+        raise ValueError(f"{npy_path} has shape {matrix.shape}, its schema says {tuple(schema['shape'])}")
+    return matrix, schema
+
+
+# A stored matrix as a DataFrame with its schema's column names, sharing the mapped memory
+def load_frame(name_or_path, npy_dir=None, mmap_mode="r"):
+    matrix, schema = load_matrix(name_or_path, npy_dir, mmap_mode)
+    return pd.DataFrame(matrix, columns=schema["columns"], copy=False)
+
+
+# Names of the stored matrices that have a sidecar
+def list_matrices(npy_dir=None):
+    npy_dir = npy_dir or NPY_DIR
+    if not os.path.isdir(npy_dir):
+        return []
+    return sorted(name[:-len(".json")] for name in os.listdir(npy_dir)
+                  if name.endswith(".json") and os.path.exists(os.path.join(npy_dir, name[:-len(".json")] + ".npy")))
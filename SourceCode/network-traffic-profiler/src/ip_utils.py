@@ -0,0 +1,209 @@
+# Shared IP address helpers used across the pipeline
+# Addresses are classified in packed form (see PACKED_DTYPE): each distinct address is parsed
+# once, after that multicast/loopback/broadcast checks and CIDR matching are NumPy
+# operations over whole columns. Strings are only formatted back for display (format_ips).
+# The parser and the flow tables keep src_ip/dst_ip as (categorical) strings, the validated CSV,
+# the ML merge and the dashboard filters key on them, so packing happens per distinct address
+# when a stage needs to classify or group them.
+
+import bisect
+import ipaddress
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Packed address record: IPv4 is the 32-bit address in lo (hi = 0), IPv6 is split into two
+# 64-bit halves. version is 0 for missing values and anything that isn't an address.
+# Sorting packed records orders IPv4 before IPv6, each numerically.
+PACKED_DTYPE = np.dtype([("version", np.uint8), ("hi", np.uint64), ("lo", np.uint64)])
+LOW_64 = (1 << 64) - 1
+
+# Known Google/YouTube CIDR blocks used to pick out YouTube flows for the ML model
+YOUTUBE_RANGES = [
+    "172.217.0.0/16", "142.250.0.0/15", "104.237.160.0/19",
+    "208.117.224.0/19", "64.15.112.0/20", "216.58.192.0/19", "74.125.0.0/16"
+]
+
+
+# (version, hi, lo) of one address, (0, 0, 0) when it isn't one
+def pack_ip(ip):
+    try:
+        ip_obj = ipaddress.ip_address(ip)
+    except (TypeError, ValueError):
+        return 0, 0, 0
+    value = int(ip_obj)
+    return ip_obj.version, value >> 64, value & LOW_64
+
+
+# Distinct addresses of a column, parsed once each
+# Returns (codes, packed) with the column equal to packed[codes], missing values have code -1
+# A categorical column (the extractor's compact schema) already holds its distinct addresses
+def pack_distinct(values):
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.array
+    if isinstance(values, pd.Categorical):
+        codes, uniques = np.asarray(values.codes), values.categories
+    else:
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return codes, np.array([pack_ip(ip) for ip in uniques], dtype=PACKED_DTYPE)
+
+
+# Packed record of every value of a column
+def pack_ips(values):
+    codes, packed = pack_distinct(values)
+    # code -1 picks the trailing (0, 0, 0) record
+    return np.append(packed, np.zeros(1, dtype=PACKED_DTYPE))[codes]
+
+
+# Address strings of packed records, None for records that aren't addresses
+def format_ips(packed):
+    uniques, inverse = np.unique(packed, return_inverse=True)
+    text = np.array([format_ip(record) for record in uniques.tolist()] + [None], dtype=object)
+    return text[inverse.reshape(-1)]
+
+
+def format_ip(record):
+    version, hi, lo = record
+    if version == 4:
+        return str(ipaddress.IPv4Address(int(lo)))
+    if version == 6:
+        return str(ipaddress.IPv6Address((int(hi) << 64) | int(lo)))
+    return None
+
+
+# IPv4-mapped IPv6 addresses (::ffff:a.b.c.d) as the IPv4 address they carry, other records unchanged
+def unmap_ipv4(packed):
+    mapped = (packed["version"] == 6) & (packed["hi"] == 0) & ((packed["lo"] >> np.uint64(32)) == 0xFFFF)
+    if not mapped.any():
+        return packed
+    packed = packed.copy()
+    packed["version"][mapped] = 4
+    packed["lo"][mapped] &= np.uint64(0xFFFFFFFF)
+    return packed
+
+
+# Vectorised equivalents of ipaddress' is_multicast / is_loopback, and the IPv4 limited broadcast
+# address validate_row() checks for. Each returns a boolean array aligned with packed.
+# An IPv4-mapped IPv6 address is classified by its IPv4 address, as validate_row() does.
+def is_multicast(packed):
+    packed = unmap_ipv4(packed)
+    v4 = (packed["version"] == 4) & ((packed["lo"] >> np.uint64(28)) == 0xE)
+    v6 = (packed["version"] == 6) & ((packed["hi"] >> np.uint64(56)) == 0xFF)
+    return v4 | v6
+
+
+def is_loopback(packed):
+    packed = unmap_ipv4(packed)
+    v4 = (packed["version"] == 4) & ((packed["lo"] >> np.uint64(24)) == 127)
+    v6 = (packed["version"] == 6) & (packed["hi"] == 0) & (packed["lo"] == 1)
+    return v4 | v6
+
+
+def is_broadcast(packed):
+    packed = unmap_ipv4(packed)
+    return (packed["version"] == 4) & (packed["lo"] == 0xFFFFFFFF)
+
+
+# Rank of every address among the sorted distinct addresses of all the columns, so addresses
+# can be ordered and grouped as integers (e.g. both directions of a conversation)
+# Returns (packed distinct addresses, one rank array per column), missing values rank -1
+def rank_ips(*columns):
+    parts = [pack_distinct(column) for column in columns]
+    uniques, inverse = np.unique(np.concatenate([packed for _, packed in parts]), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    ranks = []
+    offset = 0
+    for codes, packed in parts:
+        lookup = np.append(inverse[offset:offset + len(packed)], -1)
+        ranks.append(lookup[codes])
+        offset += len(packed)
+    return uniques, ranks
+
+
+# Matches addresses against a fixed list of CIDR blocks
+# The blocks are compiled once into sorted, merged integer ranges per IP version,
+# so a lookup is a bisect instead of a scan over ip_network objects
+class CidrMatcher:
+
+    def __init__(self, cidrs, cache_size=65536):
+        self.cidrs = list(cidrs)
+        ranges = {4: [], 6: []}
+        for cidr in self.cidrs:
+            network = ipaddress.ip_network(cidr)
+            ranges[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        # Merge overlapping/adjacent blocks so the ranges are disjoint and sorted
+        self.starts = {}
+        self.ends = {}
+        for version, blocks in ranges.items():
+            merged = []
+            for start, end in sorted(blocks):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.starts[version] = [start for start, _ in merged]
+            self.ends[version] = [end for _, end in merged]
+
+        # The same ranges as packed records, for matching packed columns
+        bounds = [(version, start, end) for version in (4, 6)
+                  for start, end in zip(self.starts[version], self.ends[version])]
+        self.packed_starts = np.array([(v, s >> 64, s & LOW_64) for v, s, _ in bounds], dtype=PACKED_DTYPE)
+        self.packed_ends = np.array([(v, e >> 64, e & LOW_64) for v, _, e in bounds], dtype=PACKED_DTYPE)
+
+        # Per-address memo, captures reuse the same few thousand addresses
+        self.contains = lru_cache(maxsize=cache_size)(self._contains)
+
+    # True if a packed address of the given IP version falls in one of the blocks
+    def contains_int(self, value, version=4):
+        starts = self.starts[version]
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= self.ends[version][i]
+
+    # True if the address (string or int) falls in one of the blocks, False for invalid addresses
+    def _contains(self, ip):
+        try:
+            ip_obj = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return self.contains_int(int(ip_obj), ip_obj.version)
+
+    # Classify a whole column at once, returns a boolean NumPy array
+    # Packed records and integer arrays (packed IPv4 addresses) are matched with searchsorted,
+    # anything else is packed and matched once per distinct value
+    def contains_many(self, values):
+        if isinstance(values, (pd.Series, pd.Index)):
+            values = values.array
+        if not isinstance(values, pd.Categorical):
+            array = np.asarray(values)
+            if array.dtype == PACKED_DTYPE:
+                return self.contains_packed(array)
+            if array.dtype.kind in "iu":
+                return self._contains_packed_v4(array)
+
+        codes, packed = pack_distinct(values)
+        # Missing values have code -1, which picks the trailing False
+        return np.append(self.contains_packed(packed), False)[codes]
+
+    # True for the packed records (PACKED_DTYPE) that fall in one of the blocks
+    def contains_packed(self, packed):
+        if len(self.packed_starts) == 0:
+            return np.zeros(len(packed), dtype=bool)
+        # Last block starting at or before each address, a match if the address is not past its end
+        i = np.searchsorted(self.packed_starts, packed, side="right") - 1
+        end = self.packed_ends[np.maximum(i, 0)]
+        within = (packed["hi"] < end["hi"]) | ((packed["hi"] == end["hi"]) & (packed["lo"] <= end["lo"]))
+        return (i >= 0) & (packed["version"] == end["version"]) & within
+
+    def _contains_packed_v4(self, packed):
+        packed = packed.astype(np.int64)
+        starts = np.asarray(self.starts[4], dtype=np.int64)
+        ends = np.asarray(self.ends[4], dtype=np.int64)
+        if len(starts) == 0:
+            return np.zeros(len(packed), dtype=bool)
+        i = np.searchsorted(starts, packed, side="right") - 1
+        return (i >= 0) & (packed <= ends[np.maximum(i, 0)])
+
+
+YOUTUBE_MATCHER = CidrMatcher(YOUTUBE_RANGES)
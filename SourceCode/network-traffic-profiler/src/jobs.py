@@ -0,0 +1,223 @@
+# Background pipeline runs for the dashboard
+# run_pipeline used to run in the Streamlit script thread, so a long capture blocked the session
+# and a browser refresh lost the run. JobManager runs pipelines in a process pool instead. Every
+# job has an id and a record in JOBS_DIR that its worker keeps up to date (state, percentage, the
+# step it is on) and the dashboard polls. Results go to the ResultCache, with the rollup tables
+# the dashboard charts are drawn from, so a refreshed page, or another session, picks a job up
+# again by its id.
+# At most MAX_RUNNING_JOBS pipelines run at once, later submissions wait in the pool's queue, and
+# the extraction cores are split between the running ones.
+#
+# One JobManager per server: on start it marks jobs left unfinished in JOBS_DIR as interrupted.
+
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+from result_cache import ResultCache, remove_upload
+from rollups import build_rollups
+
+JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs")
+MAX_RUNNING_JOBS = 2
+# Records of finished jobs are removed after this long
+JOB_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job_path(job_id, jobs_dir=None):
+    return os.path.join(jobs_dir or JOBS_DIR, f"{job_id}.json")
+
+
+# Created by JobManager.cancel, the worker stops at its next progress report once it exists
+def cancel_path(job_id, jobs_dir=None):
+    return os.path.join(jobs_dir or JOBS_DIR, f"{job_id}.cancel")
+
+
+# The job's record, or None if there is no such job
+def read_job(job_id, jobs_dir=None):
+    try:
+        with open(job_path(job_id, jobs_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Written to a temporary file and renamed, so a poll never reads half a record
+def write_job(job, jobs_dir=None):
+    path = job_path(job["id"], jobs_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(job, f, default=str)
+    os.replace(tmp_path, path)
+
+
+# Passed to run_pipeline as its status, records the step and percentage in the job's record
+class JobStatus:
+
+    def __init__(self, job, jobs_dir=None):
+        self.job = job
+        self.jobs_dir = jobs_dir
+
+    def check_cancelled(self):
+        if os.path.exists(cancel_path(self.job["id"], self.jobs_dir)):
+            raise JobCancelled()
+
+    # Same call as st.status, run_pipeline writes the step it is starting
+    def write(self, message):
+        self.check_cancelled()
+        self.job["message"] = message
+        self.save()
+
+    def progress(self, fraction):
+        self.check_cancelled()
+        percent = int(fraction * 100)
+        if percent != self.job["progress"]:
+            self.job["progress"] = percent
+            self.save()
+
+    def save(self):
+        self.job["updated"] = time.time()
+        write_job(self.job, self.jobs_dir)
+
+
+# Runs a job's pipeline and stores the result, in a pool worker
+# The uploaded capture is removed once the job has finished, whatever the outcome
+def run_job(job_id, jobs_dir=None, cache_dir=None, workers=None):
+    job = read_job(job_id, jobs_dir)
+    status = JobStatus(job, jobs_dir)
+    try:
+        status.check_cancelled()
+        job.update(state="running", started=time.time(), message="Starting")
+        status.save()
+        results = main.run_pipeline(job["path"], status, profile=job["profile"], digest=job["digest"],
+                                    progress=status.progress, workers=workers)
+        status.write("5. Summarising flows for the charts")
+        # The models may have been retrained since the job was queued, the result is stored
+        # under the key of the models it was predicted with
+        cache = ResultCache(cache_dir)
+        job["result_key"] = cache.key(job["digest"], profile=job["profile"])
+        cache.put(job["result_key"], results, build_rollups(results[0]))
+        job.update(state="done", progress=100, message="Complete")
+    except JobCancelled:
+        job.update(state="cancelled", message="Cancelled")
+    except Exception as e:
+        job.update(state="failed", error=str(e), message="Failed")
+    finally:
+        job["finished"] = time.time()
+        status.save()
+        remove_upload(job["path"])
+        if os.path.exists(cancel_path(job_id, jobs_dir)):
+            os.remove(cancel_path(job_id, jobs_dir))
+    return job["state"]
+
+
+class JobManager:
+
+    def __init__(self, jobs_dir=None, cache=None, max_jobs=MAX_RUNNING_JOBS):
+        self.jobs_dir = jobs_dir or JOBS_DIR
+        self.cache = cache or ResultCache()
+        self.max_jobs = max_jobs
+        # Workers are spawned rather than forked from the multithreaded Streamlit server
+        self.pool = ProcessPoolExecutor(max_workers=max_jobs, mp_context=multiprocessing.get_context("spawn"))
+        self.futures = {}
+        self.recover()
+
+    # Jobs a previous server left queued or running will never finish, old records are dropped
+    def recover(self):
+        now = time.time()
+        for job in self.jobs():
+            if job["state"] not in FINISHED_STATES:
+                job.update(state="failed", message="Failed", finished=now,
+                           error="Interrupted: the dashboard was restarted before the job finished")
+                write_job(job, self.jobs_dir)
+                remove_upload(job["path"])
+            elif now - (job["finished"] or now) > JOB_RETENTION_SECONDS:
+                os.remove(job_path(job["id"], self.jobs_dir))
+
+    # Extraction processes per job, so running jobs don't compete for the same cores
+    def workers(self):
+        return max(1, (os.cpu_count() or 1) // self.max_jobs)
+
+    # Queues a pipeline run over an upload written by result_cache.write_upload, returns the job id
+    # A capture whose result is already cached finishes straight away without running
+    def submit(self, path, digest, name, profile=False):
+        job = {
+            "id": uuid.uuid4().hex[:12], "name": name, "path": path, "digest": digest, "profile": profile,
+            "result_key": self.cache.key(digest, profile=profile),
+            "state": "queued", "progress": 0, "message": "Queued", "error": None,
+            "created": time.time(), "started": None, "finished": None,
+        }
+        if self.cache.get(job["result_key"]) is not None:
+            job.update(state="done", progress=100, message="Loaded from cache", finished=time.time())
+            write_job(job, self.jobs_dir)
+            remove_upload(path)
+            return job["id"]
+
+        write_job(job, self.jobs_dir)
+        self.futures[job["id"]] = self.pool.submit(run_job, job["id"], self.jobs_dir, self.cache.store.cache_dir,
+                                                   self.workers())
+        return job["id"]
+
+    # The job's record, or None for an unknown id
+    def status(self, job_id):
+        job = read_job(job_id, self.jobs_dir)
+        future = self.futures.get(job_id)
+        if job is not None and job["state"] not in FINISHED_STATES and future is not None \
+                and future.done() and not future.cancelled():
+            # The worker died before it could record the outcome (e.g. killed for running out of memory)
+            job.update(state="failed", message="Failed", finished=time.time(),
+                       error=f"The job stopped unexpectedly: {future.exception()!r}")
+            write_job(job, self.jobs_dir)
+            remove_upload(job["path"])
+        return job
+
+    # (flows, numeric_df, anomaly_info, perf_report) of a finished job, None otherwise
+    def result(self, job_id):
+        job = self.status(job_id)
+        if job is None or job["state"] != "done":
+            return None
+        return self.cache.get(job["result_key"])
+
+    # Rollup tables of a finished job (see rollups.py), None otherwise
+    def rollups(self, job_id):
+        job = self.status(job_id)
+        if job is None or job["state"] != "done":
+            return None
+        return self.cache.rollups(job["result_key"])
+
+    # Returns False if the job had already finished
+    def cancel(self, job_id):
+        job = read_job(job_id, self.jobs_dir)
+        if job is None or job["state"] in FINISHED_STATES:
+            return False
+        future = self.futures.get(job_id)
+        if future is not None and future.cancel():
+            # Still waiting in the pool, no worker will see it
+            job.update(state="cancelled", message="Cancelled", finished=time.time())
+            write_job(job, self.jobs_dir)
+            remove_upload(job["path"])
+            return True
+        # Running: the worker stops at its next progress report
+        with open(cancel_path(job_id, self.jobs_dir), "w"):
+            pass
+        return True
+
+    # Every job's record, oldest first
+    def jobs(self):
+        if not os.path.isdir(self.jobs_dir):
+            return []
+        records = [read_job(name[:-5], self.jobs_dir) for name in os.listdir(self.jobs_dir) if name.endswith(".json")]
+        return sorted((job for job in records if job is not None), key=lambda job: job["created"])
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -8,18 +8,52 @@ import pandas as pd
 
 # Import ML prediction function
 from ML.model_training.predict import predict_action_type
-# Import ML feature extraction
-from extract_features_unified import extract_all_pcap_data
+# Import ML feature extraction, cached by capture content
+from feature_cache import extract_cached
+from pipeline_profiler import PipelineProfiler, save_report
+# Baseline anomaly model, when one has been trained with anomaly_baseline.py
+from anomaly_baseline import current_baseline
 
+# Fraction of a run done once each stage has finished, reading the capture takes most of it
+STAGE_PROGRESS = {"extraction": 0.8, "validation": 0.9, "prediction": 0.95, "anomaly_detection": 1.0}
 
-def run_pipeline(pcap_path, status=None):
+
+# Returns (flows, numeric_df, anomaly_info, perf_report)
+# perf_report holds per-stage timings, it is also written to perf_output/<capture>_perf.json (or perf_dir)
+# when profiling or when perf_dir is given
+# profile=True adds cProfile/tracemalloc figures to every stage
+# save_scaled=True also writes the scaled feature matrix to npy_output/<capture>_scaled.npy (or npy_dir),
+# see feature_store. Off by default: nothing reads it back and the files would pile up with every upload
+# digest: SHA-256 of the capture if already known, saves reading it again for the feature cache
+# progress: called with the fraction of the run done, see STAGE_PROGRESS
+# workers: extraction processes, all cores by default
+def run_pipeline(pcap_path, status=None, profile=False, perf_dir=None, npy_dir=None, digest=None,
+                 progress=None, workers=None, save_scaled=False):
     pcap_basename = os.path.splitext(os.path.basename(pcap_path))[0]
+    profiler = PipelineProfiler(profile=profile)
+    # Extraction reports its own progress as the capture is read
+    extraction_progress = None
+    if progress:
+        extraction_progress = lambda done: progress(done * STAGE_PROGRESS["extraction"])
     if status: status.write("1. Extracting network flows")
-    pcap_extraction_results = extract_all_pcap_data(pcap_path)
-    # Extract data and identify flows
-    flows = pcap_extraction_results[0]
+    with profiler.stage("extraction") as stage:
+        # Stream the capture so large uploads don't have to fit in memory,
+        # decoding headers directly instead of dissecting every packet with Scapy.
+        # Large captures are split across all cores, small ones stay a single shard
+        # Captures that were already processed are read back from the feature cache
+        pcap_extraction_results = extract_cached(pcap_path, streaming=True, engine="fast",
+                                                 workers=workers or os.cpu_count(), digest=digest,
+                                                 progress=extraction_progress)
+        # Extract data and identify flows
+        flows = pcap_extraction_results[0]
+        stage["flows"] = len(flows)
+        stage["packets"] = int(flows["packet_count"].sum()) if "packet_count" in flows.columns else 0
+    if progress: progress(STAGE_PROGRESS["extraction"])
     if status: status.write("2. Validating network flows")
-    validated_data = validate_dataset(flows)
+    with profiler.stage("validation") as stage:
+        validated_data = validate_dataset(flows)
+        stage["flows"] = len(validated_data)
+    if progress: progress(STAGE_PROGRESS["validation"])
 
     # Assign flow_id to each flow
     
@@ -39,23 +73,30 @@ def run_pipeline(pcap_path, status=None):
         if status: status.write("3. Predicting user actions")
         print("Predicting actions for flows...")
         try:
-            significant_flows = ml_features_df[ml_features_df['total_bytes'] > 1000] 
-            # Predict action type for each flow
-            if not significant_flows.empty:
-                ml_features_df = predict_action_type(significant_flows)
+            with profiler.stage("prediction") as stage:
+                significant_flows = ml_features_df[ml_features_df['total_bytes'] > 1000] 
+                # Predict action type for each flow
+                if not significant_flows.empty:
+                    ml_features_df = predict_action_type(significant_flows)
+                stage["flows"] = len(significant_flows)
             
-            # define columns to be merged
-            merge_cols = ["src_ip", "dst_ip", "src_port", "dst_port", "protocol"]
+            with profiler.stage("merge") as stage:
+                # define columns to be merged
+                merge_cols = ["src_ip", "dst_ip", "src_port", "dst_port", "protocol"]
 
-            # merge the data
-            validated_data = validated_data.merge(
-                ml_features_df[merge_cols + ["action_type"]],
-                on=merge_cols,
-                how="left"
-            )
-            
-            # Fill non youtube related flows
-            validated_data['action_type'] = validated_data['action_type'].fillna('Background')
+                # merge the data, with the ML keys in the flow table's compact dtypes
+                # (a category merged with plain strings would turn the address columns back into objects)
+                ml_keys = ml_features_df[merge_cols + ["action_type"]].astype(
+                    {col: validated_data[col].dtype for col in merge_cols})
+                validated_data = validated_data.merge(
+                    ml_keys,
+                    on=merge_cols,
+                    how="left"
+                )
+                
+                # Fill non youtube related flows
+                validated_data['action_type'] = validated_data['action_type'].fillna('Background')
+                stage["flows"] = len(validated_data)
         except Exception as e:
             print("FULL ERROR:", repr(e)) # print detailed error
             raise
@@ -65,9 +106,32 @@ def run_pipeline(pcap_path, status=None):
         print("Warning: No ML features extracted.")
         validated_data['action_type'] = "Unknown / No IP Traffic"
 
+    if progress: progress(STAGE_PROGRESS["prediction"])
+
     # Build dataset for ML
     if status: status.write("4. Detecting anomolies in the data")
-    numeric_df, anomaly_info = build_dataset(validated_data, pcap_basename)
+    with profiler.stage("anomaly_detection") as stage:
+        # Score against the trained baseline if there is one, otherwise fit on this capture
+        baseline = current_baseline()
+        try:
+            numeric_df, anomaly_info = build_dataset(validated_data, pcap_basename, reference=baseline,
+                                                     save_scaled=save_scaled, npy_dir=npy_dir)
+        except ValueError as e:
+            if baseline is None:
+                raise
+            print(f"Warning: baseline anomaly model not usable ({e}), fitting on this capture instead")
+            numeric_df, anomaly_info = build_dataset(validated_data, pcap_basename, save_scaled=save_scaled,
+                                                     npy_dir=npy_dir)
+        stage["flows"] = len(numeric_df)
+    if progress: progress(STAGE_PROGRESS["anomaly_detection"])
+
+    perf_report = profiler.report(capture=os.path.basename(pcap_path),
+                                  capture_bytes=os.path.getsize(pcap_path))
+    if profile or perf_dir:
+        report_path = save_report(perf_report, pcap_basename, perf_dir)
+        print(f"Performance report saved to {report_path}")
+        # lets the dashboard say where the file went, absent when nothing was written
+        perf_report["saved_to"] = report_path
     # Return to dashboard
     print("Pipeline complete")
-    return validated_data, numeric_df, anomaly_info
\ No newline at end of file
+    return validated_data, numeric_df, anomaly_info, perf_report
@@ -0,0 +1,506 @@
+# Lightweight pcap/pcapng reader and packet header decoder for the "fast" extraction engine
+# Reads capture records straight from the file and decodes Ethernet, VLAN, IPv4, IPv6, TCP and UDP
+# headers with struct, without building Scapy packet objects.
+# Anything unusual (tunnels, PPPoE, unknown link types...) is handed to Scapy one packet at a time,
+# so the rows always match what the Scapy engine would produce.
+
+import gzip
+import ipaddress
+import os
+import socket
+import struct
+
+# Scapy cuts every record to its MTU, so packet sizes are capped the same way
+MTU = 0xFFFF
+
+PCAP_MAGIC = {
+    b"\xa1\xb2\xc3\xd4": (">", 10 ** 6),
+    b"\xd4\xc3\xb2\xa1": ("<", 10 ** 6),
+    b"\xa1\xb2\x3c\x4d": (">", 10 ** 9),  # nanosecond timestamps
+    b"\x4d\x3c\xb2\xa1": ("<", 10 ** 9),
+}
+PCAPNG_MAGIC = b"\x0a\x0d\x0d\x0a"
+
+# Block types a shard boundary may start at: packet blocks, interface descriptions/statistics
+# and name resolution
+PCAPNG_BLOCK_TYPES = (1, 2, 3, 4, 5, 6)
+
+# Sharding: smallest shard worth reading in its own process, how many bytes to search for
+# a record boundary, and how many consecutive records must line up to accept one
+MIN_SHARD_BYTES = 32 * 1024 * 1024
+SYNC_WINDOW = 4 * 1024 * 1024
+SYNC_RECORDS = 8
+# Largest snap length used by libpcap, records claiming more are not real records
+MAX_CAPLEN = 262144
+
+# Link types decoded here, anything else is decoded by Scapy
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW_ALT = 12
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETH_IPV4 = 0x0800
+ETH_IPV6 = 0x86DD
+ETH_ARP = 0x0806
+ETH_VLAN = (0x8100, 0x88A8)
+
+# IPv6 extension headers that are skipped to reach the transport header
+IPV6_EXT_HEADERS = (0, 43, 60)
+
+# IP protocols and UDP ports Scapy dissects further into tunnelled IP/TCP layers
+TUNNEL_PROTOCOLS = (4, 41, 47)
+TUNNEL_UDP_PORTS = frozenset((434, 1701, 4754, 4789, 4790, 6633, 8472, 48879))
+
+# Result of decode_packet when a packet has to be decoded by Scapy
+NEEDS_SCAPY = object()
+
+
+class CaptureFormatError(Exception):
+    pass
+
+
+# Open a capture (optionally gzip compressed) and return the file object and its magic number
+def open_capture(pcap_file):
+    f = open(pcap_file, "rb")
+    magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        f.seek(0)
+        f = gzip.GzipFile(fileobj=f)
+        magic = f.read(2)
+    return f, magic + f.read(2)
+
+
+# Yield (data, linktype, timestamp) for every packet record in a pcap or pcapng file
+# Reading a single shard (see plan_shards) starts from its cursor and stops at the first record
+# at or after `end`. The cursor is updated as records are read, so afterwards it describes
+# where the next record starts and whether the capture ended ("done")
+def iter_records(pcap_file, cursor=None, end=None):
+    f, magic = open_capture(pcap_file)
+    with f:
+        if cursor is None:
+            cursor = start_cursor(f, magic)
+        else:
+            f.seek(cursor["pos"])
+        if cursor["format"] == "pcap":
+            yield from _iter_pcap(f, cursor, end)
+        else:
+            yield from _iter_pcapng(f, cursor, end)
+
+
+# Read the file header and return the cursor of the first record
+# pcap cursors carry the file header fields, pcapng cursors the current section's byte order,
+# its interfaces and the last timestamp (Simple Packet Blocks reuse it)
+def start_cursor(f, magic):
+    if magic in PCAP_MAGIC:
+        endian, resolution = PCAP_MAGIC[magic]
+        header = f.read(20)
+        if len(header) < 20:
+            raise CaptureFormatError("Invalid pcap file (too short)")
+        linktype = struct.unpack(endian + "HHIIII", header)[5]
+        return {"format": "pcap", "pos": 24, "count": 0, "done": False,
+                "endian": endian, "resolution": resolution, "linktype": linktype}
+    if magic == PCAPNG_MAGIC:
+        endian, block_len = _read_shb(f)
+        return {"format": "pcapng", "pos": block_len, "count": 0, "done": False,
+                "endian": endian, "interfaces": [], "ts": 0.0}
+    if not magic:
+        raise CaptureFormatError("No data could be read!")
+    raise CaptureFormatError("Not a supported capture file (bad magic: %r)" % magic)
+
+
+def _iter_pcap(f, cursor, end):
+    record = struct.Struct(cursor["endian"] + "IIII")
+    resolution, linktype = cursor["resolution"], cursor["linktype"]
+    pos, count = cursor["pos"], cursor["count"]
+    read = f.read
+    try:
+        while end is None or pos < end:
+            hdr = read(16)
+            if len(hdr) < 16:
+                cursor["done"] = True
+                return
+            sec, frac, caplen, _ = record.unpack(hdr)
+            pos += 16 + caplen
+            count += 1
+            # kept current while reading so progress can be followed through the cursor
+            cursor["pos"] = pos
+            # Integer division gives the same correctly rounded float as Scapy's Decimal timestamps
+            yield read(caplen)[:MTU], linktype, (sec * resolution + frac) / resolution
+    finally:
+        cursor["pos"], cursor["count"] = pos, count
+
+
+def _iter_pcapng(f, cursor, end):
+    endian, ts = cursor["endian"], cursor["ts"]
+    # (linktype, tsresol) for each Interface Description Block in the section
+    interfaces = list(cursor["interfaces"])
+    pos, count = cursor["pos"], cursor["count"]
+    try:
+        while end is None or pos < end:
+            hdr = f.read(8)
+            if len(hdr) < 8:
+                cursor["done"] = True
+                return
+            if hdr[:4] == PCAPNG_MAGIC:
+                # New section: byte order and interfaces start over
+                endian, block_len = _read_shb(f, hdr[4:])
+                interfaces = []
+                pos += block_len
+                continue
+
+            block_type, block_len = struct.unpack(endian + "II", hdr)
+            if block_len < 12:
+                cursor["done"] = True
+                return
+            body = f.read(block_len - 12 + (-block_len % 4))
+            f.read(4)
+            if len(body) < block_len - 12:
+                raise CaptureFormatError("PcapNg: Invalid Block body length (too short)")
+            pos += 12 + len(body)
+            cursor["pos"] = pos
+
+            if block_type == 6:
+                # Enhanced Packet Block
+                intid, tshigh, tslow, caplen = struct.unpack_from(endian + "4I", body)
+                if intid >= len(interfaces):
+                    cursor["done"] = True
+                    return
+                linktype, tsresol = interfaces[intid]
+                ts = ((tshigh << 32) + tslow) / tsresol
+                count += 1
+                yield body[20:20 + caplen][:MTU], linktype, ts
+            elif block_type == 1:
+                interfaces.append(_read_idb(body, endian))
+            elif block_type == 3:
+                # Simple Packet Blocks carry no timestamp, keep the previous packet's time
+                if not interfaces:
+                    cursor["done"] = True
+                    return
+                if ts is None:
+                    # A shard can't know the time of the packet before it
+                    cursor["needs_ts"] = True
+                    ts = 0.0
+                linktype = interfaces[0][0]
+                wirelen = struct.unpack_from(endian + "I", body)[0]
+                count += 1
+                yield body[4:4 + wirelen][:MTU], linktype, ts
+            elif block_type == 2:
+                # Obsolete Packet Block
+                intid, _, tshigh, tslow, caplen = struct.unpack_from(endian + "HH3I", body)
+                if intid >= len(interfaces):
+                    cursor["done"] = True
+                    return
+                linktype, tsresol = interfaces[intid]
+                ts = ((tshigh << 32) + tslow) / tsresol
+                count += 1
+                yield body[20:20 + caplen][:MTU], linktype, ts
+    finally:
+        cursor.update(pos=pos, count=count, endian=endian, interfaces=interfaces, ts=ts)
+
+
+# Section Header Block, returns the byte order and length of the block
+def _read_shb(f, length_bytes=None):
+    if length_bytes is None:
+        length_bytes = f.read(4)
+    byte_order = f.read(4)
+    if byte_order == b"\x1a\x2b\x3c\x4d":
+        endian = ">"
+    elif byte_order == b"\x4d\x3c\x2b\x1a":
+        endian = "<"
+    else:
+        raise CaptureFormatError("PcapNg: Bad magic in Section Header Block")
+    block_len = struct.unpack(endian + "I", length_bytes)[0]
+    if block_len < 28:
+        raise CaptureFormatError("PcapNg: Invalid Section Header Block length (%d)" % block_len)
+    # Skip the versions, section length, options and trailing length
+    f.read(block_len - 12)
+    return endian, block_len
+
+
+# Split a capture into up to `count` byte ranges that can be read in parallel
+# Returns a list of {"cursor", "end"} shards, the last one reads to the end of the file.
+# Boundaries are guessed by looking for a run of plausible record headers near evenly spaced
+# offsets, so a guess can be wrong: whoever merges the shards has to check that each one starts
+# where the previous one stopped, with the same reader state (see shard_follows)
+# Gzip captures can't be seeked cheaply and are always read as a single shard
+def plan_shards(pcap_file, count, min_bytes=None):
+    if min_bytes is None:
+        min_bytes = MIN_SHARD_BYTES
+    f, magic = open_capture(pcap_file)
+    with f:
+        cursor = start_cursor(f, magic)
+        shards = [{"cursor": cursor, "end": None}]
+        size = os.path.getsize(pcap_file)
+        count = min(count, (size - cursor["pos"]) // max(min_bytes, 1))
+        if isinstance(f, gzip.GzipFile) or count < 2:
+            return shards
+
+        # Later shards assume the interfaces seen before the first packet of the section
+        template = dict(cursor)
+        if cursor["format"] == "pcapng":
+            records = _iter_pcapng(f, template, None)
+            next(records, None)
+            records.close()
+            template["ts"] = None
+
+        last = cursor["pos"]
+        for k in range(1, count):
+            target = cursor["pos"] + (size - cursor["pos"]) * k // count
+            pos = _find_boundary(f, max(target, last + 1), template)
+            if pos is None:
+                break
+            shards[-1]["end"] = pos
+            shards.append({"cursor": dict(template, pos=pos, count=0, done=False), "end": None})
+            last = pos
+        return shards
+
+
+# True if `cursor` (where a shard started reading) is exactly where the previous shard stopped
+# A shard that read a Simple Packet Block before any timestamp also has to be read again, with the
+# previous shard's last timestamp: the reader sets needs_ts on the cursor it finished with
+def shard_follows(cursor, previous):
+    return all(cursor.get(key) == previous.get(key) for key in ("pos", "endian", "interfaces"))
+
+
+# Find the first offset at or after `target` where SYNC_RECORDS record headers line up
+def _find_boundary(f, target, cursor):
+    f.seek(target)
+    data = f.read(SYNC_WINDOW)
+    if cursor["format"] == "pcap":
+        check = _pcap_records_line_up
+    else:
+        check = _pcapng_blocks_line_up
+    endian = cursor["endian"]
+    for i in range(len(data) - 16):
+        if check(data, i, endian, cursor):
+            return target + i
+    return None
+
+
+def _pcap_records_line_up(data, i, endian, cursor):
+    header = endian + "IIII"
+    previous = None
+    for _ in range(SYNC_RECORDS):
+        if i + 16 > len(data):
+            return previous is not None
+        sec, frac, caplen, wirelen = struct.unpack_from(header, data, i)
+        if frac >= cursor["resolution"] or not 0 < caplen <= wirelen or caplen > MAX_CAPLEN:
+            return False
+        # Neighbouring packets are captured close together
+        if previous is not None and abs(sec - previous) > 86400:
+            return False
+        previous = sec
+        i += 16 + caplen
+    return True
+
+
+def _pcapng_blocks_line_up(data, i, endian, cursor):
+    header = endian + "II"
+    matched = 0
+    for _ in range(SYNC_RECORDS):
+        if i + 8 > len(data):
+            return matched > 0
+        block_type, block_len = struct.unpack_from(header, data, i)
+        if block_len < 12 or block_len % 4 or block_type not in PCAPNG_BLOCK_TYPES:
+            return False
+        if i + block_len > len(data):
+            return matched > 0
+        # Every block repeats its length at the end
+        if struct.unpack_from(header, data, i + block_len - 8)[1] != block_len:
+            return False
+        matched += 1
+        i += block_len
+    return True
+
+
+# Interface Description Block, returns (linktype, tsresol)
+def _read_idb(body, endian):
+    linktype = struct.unpack_from(endian + "H", body)[0]
+    tsresol = 10 ** 6
+    options = body[8:]
+    while len(options) >= 4:
+        code, length = struct.unpack_from(endian + "HH", options)
+        if code == 0:
+            break
+        # if_tsresol: power of 10, or power of 2 when the high bit is set
+        if code == 9 and length == 1 and 4 + length < len(options):
+            value = options[4]
+            tsresol = (2 if value & 128 else 10) ** (value & 127)
+        options = options[4 + length + (-length % 4):]
+    return linktype, tsresol
+
+
+# Cached address formatting, captures reuse a small set of addresses
+_ipv4_strings = {}
+_ipv6_strings = {}
+
+
+def ipv4_str(raw):
+    text = _ipv4_strings.get(raw)
+    if text is None:
+        text = _ipv4_strings[raw] = socket.inet_ntoa(raw)
+    return text
+
+
+def ipv6_str(raw):
+    text = _ipv6_strings.get(raw)
+    if text is None:
+        text = _ipv6_strings[raw] = str(ipaddress.IPv6Address(raw))
+    return text
+
+
+# Find the network layer of a record
+# Returns (offset, ethertype), None when there is no IP layer, or NEEDS_SCAPY
+def _network_layer(data, linktype):
+    if linktype == LINKTYPE_ETHERNET:
+        offset, ethertype = 14, None
+        if len(data) >= 14:
+            ethertype = (data[12] << 8) | data[13]
+    elif linktype == LINKTYPE_LINUX_SLL:
+        offset, ethertype = 16, None
+        if len(data) >= 16:
+            ethertype = (data[14] << 8) | data[15]
+        if ethertype == 0x88A8:
+            return NEEDS_SCAPY
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_RAW_ALT):
+        if not data:
+            return None
+        version = data[0] >> 4
+        if version == 4:
+            return 0, ETH_IPV4
+        if version == 6:
+            return 0, ETH_IPV6
+        return NEEDS_SCAPY
+    elif linktype == LINKTYPE_IPV4:
+        return 0, ETH_IPV4
+    elif linktype == LINKTYPE_IPV6:
+        return 0, ETH_IPV6
+    elif linktype == LINKTYPE_NULL:
+        # Scapy reads the address family as a little-endian integer
+        if len(data) >= 4 and struct.unpack_from("<I", data)[0] == socket.AF_INET:
+            return 4, ETH_IPV4
+        return NEEDS_SCAPY
+    else:
+        return NEEDS_SCAPY
+
+    if ethertype is None:
+        return None
+    # 802.1Q / 802.1ad tags, possibly stacked
+    while ethertype in ETH_VLAN:
+        if len(data) < offset + 4:
+            return None
+        ethertype = (data[offset + 2] << 8) | data[offset + 3]
+        offset += 4
+    if ethertype in (ETH_IPV4, ETH_IPV6):
+        return offset, ethertype
+    if ethertype == ETH_ARP:
+        return None
+    # 802.3 frames, PPPoE, and other payloads Scapy may still dissect down to IP
+    return NEEDS_SCAPY
+
+
+# Decode one record into (version, src_ip, dst_ip, protocol, sport, dport)
+# Returns None for packets without an IP layer, or NEEDS_SCAPY
+def decode_packet(data, linktype):
+    layer = _network_layer(data, linktype)
+    if layer is None or layer is NEEDS_SCAPY:
+        return layer
+    o, ethertype = layer
+    end = len(data)
+
+    if ethertype == ETH_IPV4:
+        # Scapy needs the full 20 byte header to dissect an IP layer
+        if end - o < 20:
+            return None
+        ihl = (data[o] & 0x0F) * 4
+        proto = data[o + 9]
+        frag = ((data[o + 6] << 8) | data[o + 7]) & 0x1FFF
+        total_len = (data[o + 2] << 8) | data[o + 3]
+        src = ipv4_str(data[o + 12:o + 16])
+        dst = ipv4_str(data[o + 16:o + 20])
+
+        if frag or ihl < 20:
+            return 4, src, dst, proto, None, None
+        if proto in TUNNEL_PROTOCOLS:
+            return NEEDS_SCAPY
+        # Trailing bytes beyond the IP total length are link-layer padding
+        if total_len >= ihl:
+            end = min(end, o + total_len)
+        o += ihl
+    else:
+        if end - o < 40:
+            return None
+        proto = data[o + 6]
+        src = ipv6_str(data[o + 8:o + 24])
+        dst = ipv6_str(data[o + 24:o + 40])
+        o += 40
+        while proto in IPV6_EXT_HEADERS and end - o >= 8:
+            proto, o = data[o], o + (data[o + 1] + 1) * 8
+        if proto == 44 and end - o >= 8:
+            # Only the first fragment carries the transport header
+            if ((data[o + 2] << 8) | data[o + 3]) & 0xFFF8:
+                return 6, src, dst, proto, None, None
+            proto, o = data[o], o + 8
+        if proto in TUNNEL_PROTOCOLS:
+            return NEEDS_SCAPY
+
+    if proto == 6 and end - o >= 20:
+        return (4 if ethertype == ETH_IPV4 else 6), src, dst, proto, \
+            (data[o] << 8) | data[o + 1], (data[o + 2] << 8) | data[o + 3]
+    if proto == 17 and end - o >= 8:
+        sport = (data[o] << 8) | data[o + 1]
+        dport = (data[o + 2] << 8) | data[o + 3]
+        if sport in TUNNEL_UDP_PORTS or dport in TUNNEL_UDP_PORTS:
+            return NEEDS_SCAPY
+        return (4 if ethertype == ETH_IPV4 else 6), src, dst, proto, sport, dport
+    return (4 if ethertype == ETH_IPV4 else 6), src, dst, proto, None, None
+
+
+# Decode a record with Scapy, used for the packets decode_packet can't handle itself
+def scapy_decode(data, linktype):
+    from scapy.all import conf
+
+    cls = conf.l2types.num2layer.get(linktype, conf.raw_layer)
+    try:
+        pkt = cls(data)
+    except Exception:
+        pkt = conf.raw_layer(data)
+
+    if "IP" in pkt:
+        version, ip = 4, pkt["IP"]
+        proto = ip.proto
+    elif "IPv6" in pkt:
+        version, ip = 6, pkt["IPv6"]
+        proto = ip.nh
+    else:
+        return None
+
+    if pkt.haslayer("TCP"):
+        sport, dport = pkt["TCP"].sport, pkt["TCP"].dport
+    elif pkt.haslayer("UDP"):
+        sport, dport = pkt["UDP"].sport, pkt["UDP"].dport
+    else:
+        sport, dport = None, None
+    return version, ip.src, ip.dst, proto, sport, dport
+
+
+# Yield (index, src_ip, dst_ip, sport, dport, protocol, size, timestamp) for every IP packet,
+# the same fields extract_features_unified.packet_fields reads from Scapy packets.
+# Like Scapy's "IP" layer check, only IPv4 packets are returned unless ipv6=True
+# cursor/end read a single shard, indexes then count from the start of the shard
+# scapy_only=True dissects every record with Scapy instead of decoding the headers here
+def iter_packet_fields(pcap_file, ipv6=False, cursor=None, end=None, scapy_only=False):
+    records = iter_records(pcap_file, cursor, end)
+    for index, (data, linktype, ts) in enumerate(records):
+        decoded = NEEDS_SCAPY if scapy_only else decode_packet(data, linktype)
+        if decoded is NEEDS_SCAPY:
+            decoded = scapy_decode(data, linktype)
+        if decoded is None:
+            continue
+        version, src_ip, dst_ip, proto, sport, dport = decoded
+        if version == 6 and not ipv6:
+            continue
+        yield index, src_ip, dst_ip, sport, dport, proto, len(data), ts
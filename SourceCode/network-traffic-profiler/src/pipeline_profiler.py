@@ -0,0 +1,132 @@
+# Per-stage timing and resource figures for a pipeline run
+# Each stage records wall time, CPU time (including finished worker processes), the process's
+# peak RSS and, when the stage reports them, packets/sec and flows/sec.
+# With profile=True every stage is also run under cProfile and tracemalloc, which slows it down.
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PERF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perf_output")
+
+# Functions / allocation sites kept per stage when profiling
+PROFILE_TOP = 15
+
+
+# Highest resident set size of this process (and of its finished children, e.g. shard workers) so far
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return max(own, children)
+
+
+# CPU seconds used by this process and its finished children
+def cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+# Most expensive functions of a cProfile run, by cumulative time
+def top_functions(profiler, limit=PROFILE_TOP):
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({function})",
+            "calls": calls,
+            "own_seconds": round(own, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        })
+    rows.sort(key=lambda row: row["cumulative_seconds"], reverse=True)
+    return rows[:limit]
+
+
+# Lines that allocated the most memory still held at the end of a stage
+def top_allocations(snapshot, limit=PROFILE_TOP):
+    return [
+        {"location": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+         "bytes": stat.size, "blocks": stat.count}
+        for stat in snapshot.statistics("lineno")[:limit]
+    ]
+
+
+class PipelineProfiler:
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.stages = []
+        self.started = time.perf_counter()
+
+    # Times the body of a with block as one stage
+    # The yielded dict can be given "packets" and "flows" counts, which become per-second rates
+    @contextmanager
+    def stage(self, name):
+        record = {"stage": name}
+        peak_before = peak_rss_bytes()
+        cpu_before = cpu_seconds()
+        profiler = None
+        started_tracing = False
+        if self.profile:
+            profiler = cProfile.Profile()
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            profiler.enable()
+        wall_before = time.perf_counter()
+
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - wall_before
+            if profiler is not None:
+                profiler.disable()
+                record["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                record["top_allocations"] = top_allocations(tracemalloc.take_snapshot())
+                record["top_functions"] = top_functions(profiler)
+                if started_tracing:
+                    tracemalloc.stop()
+
+            peak_after = peak_rss_bytes()
+            record["wall_seconds"] = wall
+            record["cpu_seconds"] = cpu_seconds() - cpu_before
+            record["peak_rss_bytes"] = peak_after
+            # The peak only ever grows, so this is how far the stage pushed it
+            record["peak_rss_growth_bytes"] = None if peak_after is None else peak_after - peak_before
+            for count in ("packets", "flows"):
+                if count in record:
+                    record[f"{count}_per_sec"] = record[count] / wall if wall > 0 else None
+            self.stages.append(record)
+
+    def report(self, **info):
+        return {
+            "created": time.time(),
+            "total_wall_seconds": time.perf_counter() - self.started,
+            "profiled": self.profile,
+            **info,
+            "stages": self.stages,
+        }
+
+
+# Writes a report to perf_output/<name>_perf.json and returns the path
+def save_report(report, name, perf_dir=None):
+    perf_dir = perf_dir or PERF_DIR
+    os.makedirs(perf_dir, exist_ok=True)
+    path = os.path.join(perf_dir, f"{name}_perf.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
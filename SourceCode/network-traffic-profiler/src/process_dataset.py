@@ -1,9 +1,12 @@
 # step 2: validate extracted features against rules
 
 import os
+import time
+from string import Formatter
 import pandas as pd
 import ipaddress
 import numpy as np
+from ip_utils import is_broadcast, is_loopback, is_multicast, pack_distinct
 
 # =========================
 # FIELD SCHEMA & IANA_PROTOCOLS
@@ -121,6 +124,8 @@ def validate_row(row):
     # updated
     if validate_ip(row["src_ip"]):
         ip_obj = ipaddress.ip_address(row["src_ip"])
+        # an IPv4-mapped IPv6 address (::ffff:a.b.c.d) is checked as its IPv4 address
+        ip_obj = getattr(ip_obj, "ipv4_mapped", None) or ip_obj
         if ip_obj.is_multicast:
             errors.append("src_ip is a multicast address")
         if ip_obj.is_loopback:
@@ -133,6 +138,8 @@ def validate_row(row):
     # updated
     if validate_ip(row["dst_ip"]):
         ip_obj = ipaddress.ip_address(row["dst_ip"])
+        # an IPv4-mapped IPv6 address (::ffff:a.b.c.d) is checked as its IPv4 address
+        ip_obj = getattr(ip_obj, "ipv4_mapped", None) or ip_obj
         if ip_obj.is_multicast:
             errors.append("dst_ip is a multicast address")
         if ip_obj.is_loopback:
@@ -227,41 +234,355 @@ def validate_row(row):
 
     return errors
 
+# =====================================================================
+# Validation rule registry
+#  - Each rule is an expression over flow columns, compiled once and evaluated on whole
+#    columns at a time. "when" is an optional precondition: a rule whose precondition holds
+#    for no row of the batch is skipped without evaluating its expression
+#  - Messages are format strings filled from the flagged row ("{protocol}" is the original
+#    cell, derived values like "{expected_avg:.2f}" are available too)
+#  - "error" rules make a flow invalid, "warning" rules only add their message to error_reason
+#  - Rules run in registry order, which is the order messages appear in error_reason
+#  - The built-in rules are validate_row()'s checks, run on the rows whose cells the masks
+#    can reproduce exactly. Other rows (missing values, non-numeric or non-string cells,
+#    infinities, integers too large for a float) still go through validate_row()
+# =====================================================================
+NUMERIC_FIELDS = [field for field, rules in FIELD_SCHEMA.items() if rules["type"] in (int, float)]
+STRING_FIELDS = [field for field, rules in FIELD_SCHEMA.items() if rules["type"] is str]
+# Integers below 2**53 are exact as float64, so NumPy comparisons match Python's
+EXACT_FLOAT_LIMIT = 2 ** 53
+SEVERITIES = ("error", "warning")
+
+# validate_row()'s checks as rules. FIELD_SCHEMA's bounds come first (see schema_rules()),
+# int fields only as validate_row() skips the bounds of float fields.
+# The TCP/UDP missing-port check has no rule: numeric ports are never None, so it can only
+# fire for rows that go through validate_row()
+BUILTIN_RULES = [
+    # IP address validation
+    {"name": "src_ip_invalid", "expr": "~src_valid", "message": "src_ip: invalid IPv4/IPv6 address"},
+    {"name": "dst_ip_invalid", "expr": "~dst_valid", "message": "dst_ip: invalid IPv4/IPv6 address"},
+    {"name": "same_ip", "expr": "src_ip == dst_ip", "message": "src_ip and dst_ip must not be identical"},
+    {"name": "src_ip_multicast", "expr": "src_multicast", "message": "src_ip is a multicast address"},
+    {"name": "src_ip_loopback", "expr": "src_loopback", "message": "src_ip is a loopback address"},
+    {"name": "src_ip_broadcast", "expr": "src_broadcast", "message": "src_ip is a broadcast address"},
+    {"name": "dst_ip_multicast", "expr": "dst_multicast", "message": "dst_ip is a multicast address"},
+    {"name": "dst_ip_loopback", "expr": "dst_loopback", "message": "dst_ip is a loopback address"},
+    {"name": "dst_ip_broadcast", "expr": "dst_broadcast", "message": "dst_ip is a broadcast address"},
+    # Protocol & port validation
+    {"name": "unknown_protocol", "expr": "~isin(protocol, IANA_NUMBERS)",
+     "message": "Unknown protocol number: {protocol}"},
+    {"name": "protocol_mismatch", "expr": "protocol_name_upper != expected_protocol_name",
+     "message": "Protocol mismatch: protocol={protocol} but protocol_name={protocol_name}"},
+    {"name": "icmp_ports", "when": "protocol == 1", "expr": "(src_port != 0) | (dst_port != 0)",
+     "message": "ICMP should not use ports (should be 0)"},
+    # Packet, byte, average packet size validation
+    {"name": "bytes_without_packets", "when": "packet_count == 0", "expr": "byte_count != 0",
+     "message": "packet_count=0 but byte_count > 0"},
+    {"name": "bytes_below_packets", "expr": "byte_count < packet_count",
+     "message": "byte_count < packet_count (impossible)"},
+    {"name": "avg_size_inconsistent", "when": "packet_count > 0", "expr": "abs(avg_packet_size - expected_avg) > 5",
+     "message": "avg_packet_size inconsistent (expected ~{expected_avg:.2f}, got {avg_packet_size})"},
+    {"name": "avg_size_range", "expr": "(avg_packet_size > 1500) | (avg_packet_size < 20)",
+     "message": "avg_packet_size outside typical Ethernet range (20-1500 bytes)"},
+    # Packet index validation
+    {"name": "packet_index_order", "expr": "last_packet_index < first_packet_index",
+     "message": "last_packet_index < first_packet_index"},
+    # Duration validation
+    {"name": "negative_duration", "expr": "duration < 0", "message": "duration < 0"},
+    {"name": "single_packet_duration", "when": "packet_count == 1", "expr": "duration > 0.001",
+     "message": "duration > 0 for packet_count=1"},
+    {"name": "multi_packet_zero_duration", "when": "packet_count > 1", "expr": "duration == 0",
+     "message": "duration=0 but multiple packets exist"},
+    {"name": "long_duration", "expr": "duration > 3600", "message": "flow duration unusually long (>1 hour)"},
+    # Protocol-port sanity rules
+    {"name": "dns_duration", "when": "(src_port == 53) | (dst_port == 53)", "expr": "duration > 10",
+     "message": "DNS traffic duration unusually long"},
+    {"name": "https_packet_count", "when": "(src_port == 443) | (dst_port == 443)", "expr": "packet_count < 2",
+     "message": "HTTPS flow has suspiciously low packet count"},
+]
+
+# Rules added with register_rule(), run after the built-in ones on every row
+CUSTOM_RULES = []
+
+# Names available to rule expressions besides the flow columns and derived values
+RULE_HELPERS = {
+    "__builtins__": {}, "np": np, "abs": np.abs, "isin": np.isin, "trunc": np.trunc,
+    "IANA_NUMBERS": list(IANA_PROTOCOLS),
+}
+
+_compiled_rules = None
+
+# Bounds checks generated from FIELD_SCHEMA
+def schema_rules():
+    rules = []
+    for field, schema in FIELD_SCHEMA.items():
+        if schema["type"] is not int:
+            continue
+        if "min" in schema:
+            rules.append({"name": f"{field}_min", "expr": f"{field}_int < {schema['min']}",
+                          "message": f"{field}: {{{field}_int}} < minimum {schema['min']}"})
+        if "max" in schema:
+            rules.append({"name": f"{field}_max", "expr": f"{field}_int > {schema['max']}",
+                          "message": f"{field}: {{{field}_int}} > maximum {schema['max']}"})
+    return rules
+
+# Compile one rule definition, raises ValueError/SyntaxError for bad definitions
+def compile_rule(rule, builtin=False):
+    severity = rule.get("severity", "error")
+    if severity not in SEVERITIES:
+        raise ValueError(f"Rule {rule['name']}: unknown severity {severity!r} (expected one of {SEVERITIES})")
+    when = rule.get("when")
+    return {
+        "name": rule["name"],
+        "severity": severity,
+        "message": rule["message"],
+        # Names of the fields the message is filled from
+        "fields": sorted({field for _, field, _, _ in Formatter().parse(rule["message"]) if field}),
+        "expr": compile(rule["expr"], f"<rule {rule['name']}>", "eval"),
+        "when": compile(when, f"<rule {rule['name']} when>", "eval") if when else None,
+        "builtin": builtin,
+    }
+
+def compiled_rules():
+    global _compiled_rules
+    if _compiled_rules is None:
+        builtin = [compile_rule(rule, builtin=True) for rule in schema_rules() + BUILTIN_RULES]
+        _compiled_rules = builtin + [compile_rule(rule) for rule in CUSTOM_RULES]
+    return _compiled_rules
+
+# Add a site-specific rule, e.g.
+#   register_rule("telnet", "(dst_port == 23) | (src_port == 23)", "Telnet traffic", severity="warning")
+def register_rule(name, expr, message, severity="error", when=None):
+    global _compiled_rules
+    if any(rule["name"] == name for rule in schema_rules() + BUILTIN_RULES + CUSTOM_RULES):
+        raise ValueError(f"A validation rule named {name!r} already exists")
+    rule = {"name": name, "expr": expr, "message": message, "severity": severity, "when": when}
+    # Compiling straight away reports syntax errors at registration
+    compile_rule(rule)
+    CUSTOM_RULES.append(rule)
+    _compiled_rules = None
+
+def unregister_rule(name):
+    global _compiled_rules
+    CUSTOM_RULES[:] = [rule for rule in CUSTOM_RULES if rule["name"] != name]
+    _compiled_rules = None
+
+# Returns (values, ok): numeric columns as float64, other columns as objects,
+# ok marks the cells the built-in rules handle exactly
+def column_values(series, numeric):
+    if numeric:
+        if series.dtype.kind in "iuf":
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            is_number = True
+        else:
+            cells = series.to_numpy(dtype=object)
+            is_number = np.fromiter(
+                (isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, (bool, np.bool_))
+                 for v in cells), dtype=bool, count=len(cells))
+            values = np.full(len(cells), np.nan)
+            values[is_number] = cells[is_number].astype(np.float64)
+        with np.errstate(invalid="ignore"):
+            ok = np.isfinite(values) & (np.abs(values) < EXACT_FLOAT_LIMIT) & is_number
+        return values, ok
+
+    cells = series.to_numpy(dtype=object)
+    ok = np.fromiter((isinstance(v, str) for v in cells), dtype=bool, count=len(cells))
+    return cells, ok
+
+# IP properties checked by validate_row, from the packed distinct addresses (see ip_utils)
+# Returns arrays (valid, multicast, loopback, broadcast) aligned with ips
+def ip_properties(ips):
+    codes, packed = pack_distinct(ips)
+    props = np.stack([packed["version"] != 0, is_multicast(packed), is_loopback(packed), is_broadcast(packed)], axis=1)
+    # Missing values have code -1, which picks the trailing all-False row
+    props = np.vstack([props, np.zeros((1, 4), dtype=bool)])
+    return props[codes].T
+
+def _ip_property(prefix, index):
+    def compute(columns):
+        key = f"_{prefix}_ip_properties"
+        if key not in columns:
+            series = columns.df[f"{prefix}_ip"]
+            ips = series if isinstance(series.dtype, pd.CategoricalDtype) else columns[f"{prefix}_ip"]
+            columns[key] = ip_properties(ips)
+        return columns[key][index]
+    return compute
+
+def _protocol_name_upper(columns):
+    codes, names = pd.factorize(columns["protocol_name"])
+    upper = np.array([name.upper() if isinstance(name, str) else name for name in names] + [None], dtype=object)
+    return upper[codes]
+
+def _expected_protocol_name(columns):
+    protocol = columns["protocol"]
+    expected = np.full(len(protocol), "", dtype=object)
+    for number, name in IANA_PROTOCOLS.items():
+        expected[protocol == number] = name.upper()
+    return expected
+
+def _expected_avg(columns):
+    packet_count, byte_count = columns["packet_count"], columns["byte_count"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(packet_count > 0, byte_count / packet_count, 0.0)
+
+# Values computed from the columns when a rule first asks for them
+DERIVED_VALUES = {
+    "src_valid": _ip_property("src", 0), "src_multicast": _ip_property("src", 1),
+    "src_loopback": _ip_property("src", 2), "src_broadcast": _ip_property("src", 3),
+    "dst_valid": _ip_property("dst", 0), "dst_multicast": _ip_property("dst", 1),
+    "dst_loopback": _ip_property("dst", 2), "dst_broadcast": _ip_property("dst", 3),
+    "protocol_name_upper": _protocol_name_upper,
+    "expected_protocol_name": _expected_protocol_name,
+    "expected_avg": _expected_avg,
+}
+
+# Column arrays for rule expressions, converted or derived on first use
+# "<column>_int" is a numeric column truncated like int() does
+class RuleColumns(dict):
+
+    def __init__(self, df):
+        super().__init__()
+        self.df = df
+
+    def __missing__(self, name):
+        if name in DERIVED_VALUES:
+            value = DERIVED_VALUES[name](self)
+        elif name.endswith("_int") and name[:-4] in self.df.columns:
+            value = np.trunc(self[name[:-4]])
+        elif name in FIELD_SCHEMA:
+            value = column_values(self.df[name], name in NUMERIC_FIELDS)[0]
+        elif name in self.df.columns:
+            value = self.df[name].to_numpy()
+        else:
+            raise KeyError(name)
+        self[name] = value
+        return value
+
+    # Message field values at the given positions: original cells for columns (the same
+    # objects iterrows() hands to validate_row()), Python scalars for derived values
+    def message_values(self, name, positions):
+        if name in self.df.columns:
+            key = f"_{name}_cells"
+            if key not in self:
+                self[key] = self.df[name].to_numpy(dtype=object)
+            return self[key][positions]
+        values = self[name][positions]
+        if name.endswith("_int"):
+            return values.astype(np.int64).tolist()
+        return values.tolist()
+
+# Messages of a rule for the flagged positions
+def rule_messages(rule, columns, hits):
+    if not rule["fields"]:
+        return [rule["message"]] * len(hits)
+    values = {name: columns.message_values(name, hits) for name in rule["fields"]}
+    return [rule["message"].format(**{name: values[name][i] for name in values}) for i in range(len(hits))]
+
+# Evaluate compiled rules over the rows in mask
+# Adds messages to errors ({position: [messages]}) and flagged error positions to invalid,
+# returns one report entry per rule
+def evaluate_rules(rules, columns, mask, errors, invalid):
+    report = []
+    for rule in rules:
+        started = time.perf_counter()
+        entry = {"rule": rule["name"], "severity": rule["severity"], "hits": 0, "status": "evaluated"}
+        try:
+            active = mask
+            if rule["when"] is not None:
+                active = active & eval(rule["when"], RULE_HELPERS, columns)
+            if not active.any():
+                # Short-circuit: the rule doesn't apply to any row of this batch
+                entry["status"] = "not applicable"
+            else:
+                hits = np.flatnonzero(active & eval(rule["expr"], RULE_HELPERS, columns))
+                entry["hits"] = len(hits)
+                for pos, message in zip(hits, rule_messages(rule, columns, hits)):
+                    errors.setdefault(pos, []).append(message)
+                if rule["severity"] == "error":
+                    invalid.update(hits.tolist())
+        except NameError as e:
+            # Custom rules naming columns this batch doesn't have
+            entry["status"] = f"skipped ({e})"
+        entry["seconds"] = time.perf_counter() - started
+        report.append(entry)
+    return report
+
 # =====================================================================
 # Dataset-level validation
 #  - Detects duplicates (based on key columns)
-#  - Validates each row using validate_row()
+#  - Runs the rule registry over whole columns, falling back to validate_row()
 #  - Adds validation columns to csv ('is_valid' and 'error_reason')
+#  - return_report=True also returns the per-rule hit counts and timings
 # =====================================================================
-def validate_dataset(df, make_csv=False, pcap_basename=None):
+def validate_dataset(df, make_csv=False, pcap_basename=None, return_report=False):
     #df = pd.read_csv(input_file)
-    all_errors = {}
-    
+
     # Column existence check
     for field in FIELD_SCHEMA.keys():
         if field not in df.columns:
             raise ValueError(f"Missing required column: {field}")
 
+    # Errors are collected per row position
+    all_errors = {}
+    invalid = set()
+
     # Duplicate detection
     duplicate_keys = ["src_ip","dst_ip","src_port","dst_port","protocol","first_packet_index"]
-    dupes = df[df.duplicated(duplicate_keys, keep=False)]
-    for idx in dupes.index:
-        all_errors[idx] = ["Duplicate flow detected"]
+    for pos in np.flatnonzero(df.duplicated(duplicate_keys, keep=False).to_numpy()):
+        all_errors[pos] = ["Duplicate flow detected"]
+
+    rules = compiled_rules()
+    columns = RuleColumns(df)
+    exact = np.ones(len(df), dtype=bool)
+    for field in FIELD_SCHEMA:
+        values, ok = column_values(df[field], field in NUMERIC_FIELDS)
+        columns[field] = values
+        exact &= ok
+    # Errors are keyed by index label in validate_row(), so repeated labels keep the row loop
+    if not df.index.is_unique:
+        exact[:] = False
 
     # Row validation (run all checks for each row)
-    for idx, row in df.iterrows():
-        row_errors = validate_row(row)
-        if row_errors:
-            all_errors.setdefault(idx,[]).extend(row_errors)
+    report = evaluate_rules([rule for rule in rules if rule["builtin"]], columns, exact, all_errors, invalid)
+    if not exact.all():
+        all_errors = validate_rows(df, ~exact, all_errors)
+    invalid.update(all_errors)
+    report += evaluate_rules([rule for rule in rules if not rule["builtin"]], columns,
+                             np.ones(len(df), dtype=bool), all_errors, invalid)
 
     # Add validation columns & results to dataset)
     df["is_valid"] = True
     df["error_reason"] = ""
-    for idx, errs in all_errors.items():
-        df.at[idx, "is_valid"] = False
-        df.at[idx, "error_reason"] = "; ".join(errs)
-        
+    if all_errors:
+        positions = np.fromiter(all_errors, dtype=np.int64, count=len(all_errors))
+        is_valid = np.ones(len(df), dtype=bool)
+        is_valid[np.fromiter(invalid, dtype=np.int64, count=len(invalid))] = False
+        error_reason = np.full(len(df), "", dtype=object)
+        error_reason[positions] = ["; ".join(errs) for errs in all_errors.values()]
+        df["is_valid"] = is_valid
+        df["error_reason"] = error_reason
+
     print("Validated dataset")
-    
+
+    if return_report:
+        return df, pd.DataFrame(report, columns=["rule", "severity", "status", "hits", "seconds"])
     return df
 
+# Run validate_row() over the rows in mask, errors keyed by index label like the original loop
+# Returns the errors keyed by row position
+def validate_rows(df, mask, all_errors):
+    labels = df.index
+    by_label = {}
+    for pos, errs in all_errors.items():
+        by_label.setdefault(labels[pos], list(errs))
+    for idx, row in df[mask].iterrows():
+        row_errors = validate_row(row)
+        if row_errors:
+            by_label.setdefault(idx,[]).extend(row_errors)
+
+    # Every row with a label in by_label gets that label's errors
+    positions = {}
+    for pos, label in enumerate(labels):
+        if label in by_label:
+            positions[pos] = by_label[label]
+    return positions
@@ -0,0 +1,152 @@
+# Cache of run_pipeline results for the dashboard, keyed by the content hash of the capture
+# Uploads are written to a temporary file with a new name every time, so caching on the path
+# (st.cache_data on load_dataset) never hit and every re-upload ran the whole pipeline again.
+# Results are kept in memory for the last few captures and on disk in a FeatureCache directory
+# (flow and numeric frames, with the anomaly info and performance report in meta.json), both
+# evicted least recently used first. The key also covers the model files, so retraining the
+# action model or the anomaly baseline makes old results miss. In a process that has loaded the
+# models (a job's pool worker) it covers the files they were loaded from.
+# An entry can also hold the capture's chart rollups (see rollups.py), read back with rollups().
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+from anomaly_baseline import registry as baseline_registry
+from feature_cache import FeatureCache
+from rollups import ROLLUP_TABLES
+from ML.model_training.predict import registry as model_registry
+
+RESULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_cache")
+MAX_RESULT_BYTES = 1024 ** 3
+# Results held in memory, each holds a capture's flow and numeric frames
+MEMORY_ENTRIES = 4
+
+# Bump whenever run_pipeline's results change so stale entries are never read back
+RESULT_VERSION = 3
+
+# Uploads are written under here, one directory per upload
+UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "network-traffic-profiler-uploads")
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+# Upload directories older than this are left over from runs that never finished
+STALE_UPLOAD_SECONDS = 6 * 60 * 60
+
+
+# (path, modification time) of every model file a pipeline result depends on,
+# as loaded by this process or else as on disk
+def model_stamps():
+    stamps = list(model_registry.stamps().values()) + list(baseline_registry.stamps().values())
+    return [list(stamp) for stamp in stamps]
+
+
+class ResultCache:
+
+    def __init__(self, cache_dir=None, max_bytes=None, memory_entries=MEMORY_ENTRIES):
+        self.store = FeatureCache(cache_dir or RESULT_CACHE_DIR,
+                                  MAX_RESULT_BYTES if max_bytes is None else max_bytes)
+        self.memory = OrderedDict()
+        self.memory_entries = memory_entries
+
+    # Cache key for a capture's content digest and the run_pipeline options that change the result
+    def key(self, digest, **options):
+        return self.store.key(digest, result_version=RESULT_VERSION, models=model_stamps(), **options)
+
+    # (flows, numeric_df, anomaly_info, perf_report) for a cached result, or None on a miss
+    # The frames are shared with the cache, copy before modifying them
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+
+        # Rollup tables are only read when asked for
+        frames = self.store.get(key, columns={name: [] for name in ROLLUP_TABLES})
+        if frames is None:
+            return None
+        try:
+            with open(os.path.join(self.store.entry_path(key), "meta.json")) as f:
+                meta = json.load(f)
+            result = (frames["flows"], frames["numeric"], meta["anomaly_info"], meta["perf_report"])
+        except (OSError, ValueError, KeyError):
+            return None
+        self.remember(key, result)
+        return result
+
+    # rollups: the result's tables from rollups.build_rollups, stored in the same entry
+    def put(self, key, result, rollups=None):
+        flows, numeric_df, anomaly_info, perf_report = result
+        self.store.put(key, {"flows": flows, "numeric": numeric_df, **(rollups or {})},
+                       meta={"anomaly_info": anomaly_info, "perf_report": perf_report})
+        self.remember(key, result)
+
+    # {name: DataFrame} rollup tables stored with a result, or None when there are none
+    def rollups(self, key):
+        frames = self.store.get(key, columns={"flows": [], "numeric": []})
+        if frames is None or any(name not in frames for name in ROLLUP_TABLES):
+            return None
+        return {name: frames[name] for name in ROLLUP_TABLES}
+
+    def remember(self, key, result):
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    # Drop one result from memory and disk
+    def evict(self, key):
+        self.memory.pop(key, None)
+        shutil.rmtree(self.store.entry_path(key), ignore_errors=True)
+
+    def clear(self):
+        self.memory.clear()
+        self.store.clear()
+
+
+# Copies an upload (a Streamlit UploadedFile or any binary file object) to
+# <UPLOAD_DIR>/<new directory>/<digest>.pcap in chunks, hashing each chunk on the way
+# Returns (path, SHA-256 hex digest). Only one chunk is copied in memory at a time, and the
+# digest can be passed on to run_pipeline so the capture isn't read again to hash it.
+# The capture is named by its digest, so the pipeline's per-capture outputs (perf_output,
+# npy_output) are overwritten by a re-upload instead of piling up under random names
+def write_upload(uploaded_file, upload_dir=None, chunk_size=UPLOAD_CHUNK_BYTES):
+    upload_dir = upload_dir or UPLOAD_DIR
+    os.makedirs(upload_dir, exist_ok=True)
+    directory = tempfile.mkdtemp(dir=upload_dir)
+    partial_path = os.path.join(directory, "upload.partial")
+    digest = hashlib.sha256()
+    try:
+        uploaded_file.seek(0)
+        with open(partial_path, "wb") as f:
+            for chunk in iter(lambda: uploaded_file.read(chunk_size), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        digest = digest.hexdigest()
+        path = os.path.join(directory, f"{digest[:16]}.pcap")
+        os.replace(partial_path, path)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return path, digest
+
+
+# Removes an upload written by write_upload
+def remove_upload(path):
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+# Removes upload directories left behind by runs that crashed or were interrupted
+def cleanup_uploads(upload_dir=None, max_age=STALE_UPLOAD_SECONDS):
+    upload_dir = upload_dir or UPLOAD_DIR
+    if not os.path.isdir(upload_dir):
+        return 0
+    removed = 0
+    now = time.time()
+    for entry in os.scandir(upload_dir):
+        if entry.is_dir() and now - entry.stat().st_mtime > max_age:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
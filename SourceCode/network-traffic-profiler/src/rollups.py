@@ -0,0 +1,266 @@
+# Pre-aggregated tables behind the dashboard charts
+# The dashboard grouped the whole flow table again on every filter change (traffic per action,
+# traffic over time, top endpoints, top conversations), with the conversation key built row by row.
+# build_rollups runs once per capture, in the pipeline job, and reduces the valid flows to integers:
+#   keys           one row per valid flow, in flow table order: a code for every filter dimension
+#                  (protocol, addresses, ports) and every chart group (action, endpoint,
+#                  conversation, time bucket), with the flow's byte and packet counts
+#   <group> tables one row per code with the values behind it and the totals of the whole capture,
+#                  so the unfiltered dashboard shows them as they are
+# Under a filter, flow_mask turns the selection into a row mask over the codes and chart_tables sums
+# each group with np.bincount, a few passes over integer arrays instead of hashing strings and tuples.
+#
+# Traffic over time is bucketed by the flows' start_time (seconds into the capture). The timeline
+# table holds the finest buckets the capture gets, at most FINE_BUCKETS of them; time_series sums
+# them into wider buckets for the window shown, so a chart never has more than MAX_POINTS points
+# whatever the size of the capture, and zooming in gets finer buckets down to the finest ones.
+
+import numpy as np
+import pandas as pd
+
+from ip_utils import rank_ips
+
+# Frames returned by build_rollups, stored next to the pipeline result in the ResultCache
+ROLLUP_TABLES = ("keys", "protocols", "addresses", "actions", "endpoints", "conversations", "timeline")
+
+# Filter dimension -> (keys column, table holding its values or None when the code is the value)
+FILTER_KEYS = {
+    "protocol_name": ("protocol", "protocols"),
+    "src_ip": ("src", "addresses"),
+    "dst_ip": ("dst", "addresses"),
+    "src_port": ("src_port", None),
+    "dst_port": ("dst_port", None),
+}
+
+# Widths of the timeline's buckets in seconds, each a whole multiple of the ones before it
+BUCKET_SECONDS = (0.001, 0.01, 0.1, 1, 5, 10, 30, 60, 5 * 60, 15 * 60, 60 * 60, 6 * 60 * 60, 24 * 60 * 60)
+# Most buckets of the finest width a capture gets, zooming in stops at that width
+FINE_BUCKETS = 100_000
+# Most points of a traffic series drawn by the dashboard
+MAX_POINTS = 2000
+
+
+# Codes and distinct values of a column, missing values get their own code
+def _factorize(values, sort=False):
+    codes, uniques = pd.factorize(values, sort=sort, use_na_sentinel=False)
+    return codes.astype(np.int32), uniques
+
+
+# Integer code for every distinct (a, b) pair of two code arrays
+def _pair_codes(a, b, size):
+    codes, uniques = _factorize(a.astype(np.int64) * size + b)
+    return codes, uniques // size, uniques % size
+
+
+def _port_codes(ports):
+    return ports.astype("Int32").fillna(-1).to_numpy(dtype=np.int32)
+
+
+# Narrowest bucket width that covers span seconds in at most buckets buckets
+# Falls back to the widest one for spans that would need more
+def bucket_width(span, buckets):
+    for width in BUCKET_SECONDS:
+        if span / width < buckets:
+            return width
+    return BUCKET_SECONDS[-1]
+
+
+# Finest bucket of every start time and the bucket width, missing times get bucket -1
+def _time_buckets(start_time):
+    times = np.asarray(start_time, dtype=np.float64)
+    known = ~np.isnan(times)
+    span = max(float(times[known].max()), 0.0) if known.any() else 0.0
+    width = bucket_width(span, FINE_BUCKETS)
+    buckets = np.full(len(times), -1, dtype=np.int32)
+    # Start times are relative to the capture, negative ones can only come from a bad clock
+    buckets[known] = np.floor(np.maximum(times[known], 0.0) / width)
+    return buckets, width
+
+
+# Rollup tables of a flow table (the pipeline's validated flows), see the top of the file
+def build_rollups(flows):
+    valid = flows[flows["is_valid"] == True]
+    byte_count = valid["byte_count"].to_numpy(dtype=np.int64)
+    packet_count = valid["packet_count"].to_numpy(dtype=np.int64)
+    avg_packet_size = valid["avg_packet_size"].to_numpy(dtype=np.float64)
+
+    # Addresses are ranked by their packed value, so the lower rank is the lower address
+    addresses, (src, dst) = rank_ips(valid["src_ip"], valid["dst_ip"])
+    names = np.full(len(addresses), None, dtype=object)
+    for column, ranks in ((valid["src_ip"], src), (valid["dst_ip"], dst)):
+        seen = ranks >= 0
+        names[ranks[seen]] = column.to_numpy(dtype=object)[seen]
+    size = len(addresses) + 1
+    # Missing addresses (rank -1) are shifted to 0 for the pair codes
+    src_shift, dst_shift = src + 1, dst + 1
+
+    protocol, protocol_names = _factorize(valid["protocol_name"].to_numpy(dtype=object))
+    action, action_types = _factorize(valid["action_type"].to_numpy(dtype=object))
+    bucket, width = _time_buckets(valid["start_time"])
+    endpoint, endpoint_src, endpoint_dst = _pair_codes(src_shift, dst_shift, size)
+    conversation, conversation_a, conversation_b = _pair_codes(
+        np.minimum(src_shift, dst_shift), np.maximum(src_shift, dst_shift), size)
+
+    keys = pd.DataFrame({
+        "protocol": protocol, "src": src.astype(np.int32), "dst": dst.astype(np.int32),
+        "src_port": _port_codes(valid["src_port"]), "dst_port": _port_codes(valid["dst_port"]),
+        "action": action, "endpoint": endpoint, "conversation": conversation, "bucket": bucket,
+        "byte_count": byte_count, "packet_count": packet_count, "avg_packet_size": avg_packet_size,
+    })
+    # Pair codes hold rank + 1, so -1 indexes the trailing missing address
+    address_names = np.append(names, None)
+    rollups = {
+        "keys": keys,
+        "protocols": pd.DataFrame({"protocol_name": protocol_names}),
+        "addresses": pd.DataFrame({"ip": names}),
+        "actions": pd.DataFrame({"action_type": action_types}),
+        "endpoints": pd.DataFrame({"src_ip": address_names[endpoint_src - 1],
+                                   "dst_ip": address_names[endpoint_dst - 1]}),
+        "conversations": pd.DataFrame({"a": address_names[conversation_a - 1],
+                                       "b": address_names[conversation_b - 1]}),
+        # Every bucket up to the last start time, empty ones included, with its width alongside
+        "timeline": pd.DataFrame({"start": np.arange(int(bucket.max(initial=-1)) + 1) * width,
+                                  "seconds": width}),
+    }
+    # Totals of the whole capture, what the dashboard shows without a filter
+    for name, columns in _group_totals(rollups, None).items():
+        for column, values in columns.items():
+            rollups[name][column] = values
+    return rollups
+
+
+# Group of every chart table: (keys column, measure columns summed per group)
+GROUPS = {
+    "actions": ("action", {"byte_count": "byte_count"}),
+    "endpoints": ("endpoint", {"byte_count": "byte_count"}),
+    "conversations": ("conversation", {"total_bytes": "byte_count", "total_packets": "packet_count"}),
+    "timeline": ("bucket", {"byte_count": "byte_count", "packet_count": "packet_count"}),
+}
+
+
+# Per-group flow counts and totals of the flows under mask (every flow when mask is None)
+# names: the GROUPS to total, all of them by default
+def _group_totals(rollups, mask, names=None):
+    keys = rollups["keys"]
+    # Each column is only masked once
+    selected = {}
+    def column(name):
+        if name not in selected:
+            values = keys[name].to_numpy()
+            selected[name] = values if mask is None else values[mask]
+        return selected[name]
+    result = {}
+    for name in names or GROUPS:
+        group, measures = GROUPS[name]
+        # Shifted by one so missing codes (-1) count in a first group that is dropped
+        codes = column(group) + 1
+        size = len(rollups[name]) + 1
+        columns = {"flow_count": np.bincount(codes, minlength=size)[1:]}
+        for total, measure in measures.items():
+            columns[total] = np.bincount(codes, weights=column(measure), minlength=size)[1:].astype(np.int64)
+        result[name] = columns
+    if "conversations" not in result:
+        return result
+    # Mean of the flows' average packet sizes, as the conversations table always showed
+    counts = result["conversations"]["flow_count"]
+    sizes = np.bincount(column("conversation"), weights=column("avg_packet_size"), minlength=len(counts))
+    result["conversations"]["avg_packet_size"] = np.divide(sizes, counts, out=np.full(len(counts), np.nan),
+                                                           where=counts > 0)
+    return result
+
+
+# Row mask over the flows (and keys) for the dashboard's filter selection, None when nothing is selected
+# filters: {dimension: selected values} for the dimensions in FILTER_KEYS
+def flow_mask(rollups, **filters):
+    keys = rollups["keys"]
+    mask = None
+    for dimension, selected in filters.items():
+        if selected is None or len(selected) == 0:
+            continue
+        column, table = FILTER_KEYS[dimension]
+        if table is None:
+            wanted = np.asarray(selected, dtype=np.int64)
+        else:
+            wanted = np.flatnonzero(rollups[table].iloc[:, 0].isin(selected).to_numpy())
+        # A lookup table over the codes, so each row costs one index instead of a search
+        codes = keys[column].to_numpy()
+        lookup = np.zeros(max(int(codes.max(initial=-1)), int(wanted.max(initial=-1))) + 2, dtype=bool)
+        lookup[wanted[wanted >= 0]] = True
+        # Missing values (-1) pick the last entry, which is never selected
+        selected_rows = lookup[codes]
+        mask = selected_rows if mask is None else mask & selected_rows
+    return mask
+
+
+# The rows with the highest values, highest first, only the first top of them when top is given
+# Equal values keep the order of rows
+def _top_rows(values, rows, top=None):
+    if top is not None and top < len(rows):
+        # Partial selection, no need to sort every pair for the few rows shown
+        rows = np.sort(rows[np.argpartition(-values[rows], top - 1)[:top]])
+    return rows[np.argsort(-values[rows], kind="stable")]
+
+
+# The chart tables for the flows under mask, leaving out groups without any of those flows
+# actions holds the bytes per action, in code order; endpoints and conversations only their top
+# rows (all of them when top is None), highest byte total first. See time_series for the timeline.
+def chart_tables(rollups, mask=None, top_endpoints=None, top_conversations=None):
+    names = ("actions", "endpoints", "conversations")
+    totals = None if mask is None else _group_totals(rollups, mask, names)
+    tops = {"endpoints": ("byte_count", top_endpoints), "conversations": ("total_bytes", top_conversations)}
+    tables = {}
+    for name in names:
+        table = rollups[name]
+        if totals is None:
+            columns = {column: table[column].to_numpy() for column in ["flow_count", *GROUPS[name][1]]}
+        else:
+            columns = totals[name]
+        rows = np.flatnonzero(columns["flow_count"] > 0)
+        if name in tops:
+            column, top = tops[name]
+            rows = _top_rows(columns[column], rows, top)
+        # Only the rows shown are taken from the tables
+        if len(rows) < len(table) or name in tops or totals is not None:
+            table = table.iloc[rows].reset_index(drop=True)
+        if totals is not None:
+            for column, values in totals[name].items():
+                table[column] = values[rows]
+        tables[name] = table
+    return tables
+
+
+# Traffic of the flows under mask over the window from start to end seconds into the capture (the
+# whole capture by default). Returns (series, width): a frame with the start, byte_count,
+# packet_count and flow_count of every bucket over the window, empty ones included, and the bucket
+# width in seconds, the narrowest of BUCKET_SECONDS (but no finer than the timeline's) that keeps
+# the series to max_points buckets. Flows without a start time are left out.
+def time_series(rollups, mask=None, start=None, end=None, max_points=MAX_POINTS):
+    timeline = rollups["timeline"]
+    measures = ("byte_count", "packet_count", "flow_count")
+    if len(timeline) == 0:
+        return pd.DataFrame({"start": [], **{column: [] for column in measures}}), None
+    fine = float(timeline["seconds"].iloc[0])
+    if mask is None:
+        totals = {column: timeline[column].to_numpy() for column in measures}
+    else:
+        totals = _group_totals(rollups, mask, ["timeline"])["timeline"]
+
+    # The window in whole buckets of the timeline
+    first = 0 if start is None else int(np.clip(np.floor(start / fine), 0, len(timeline) - 1))
+    last = len(timeline) if end is None else int(np.clip(np.ceil(end / fine), first + 1, len(timeline)))
+    # One bucket short, the window's ends can each fall part way into a bucket
+    width = max(bucket_width((last - first) * fine, max_points - 1), fine)
+    factor = int(round(width / fine))
+
+    # Buckets line up with whole multiples of the width from the start of the capture, the window
+    # is widened to whole buckets so the ones at its ends aren't cut short
+    first = first // factor * factor
+    last = min(-(-last // factor) * factor, len(timeline))
+    groups = np.arange(first, last) // factor
+    offset = groups[0]
+    groups -= offset
+    size = int(groups[-1]) + 1
+    series = {"start": (np.arange(size) + offset) * width}
+    for column in measures:
+        series[column] = np.bincount(groups, weights=totals[column][first:last], minlength=size).astype(np.int64)
+    return pd.DataFrame(series), width
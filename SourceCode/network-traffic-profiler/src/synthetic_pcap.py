@@ -0,0 +1,164 @@
+# Synthetic capture generator for benchmarks and tests
+# Writes Ethernet/IPv4 traffic straight to a pcap or pcapng file with struct, so captures
+# with millions of packets take seconds rather than the minutes Scapy would need.
+#
+# Every flow is one direction of traffic (the 5-tuple the extractor groups by). The streaming
+# extractor skips packets without ports, so it reports the TCP and UDP flows ("port_flows"
+# in the summary) and leaves the ICMP ones out. YouTube flows go between a local client and an
+# address in ip_utils.YOUTUBE_RANGES, half of them towards port 443 and half back from it.
+
+import ipaddress
+import struct
+
+import numpy as np
+
+from ip_utils import YOUTUBE_RANGES
+
+PROTOCOLS = {"tcp": 6, "udp": 17, "icmp": 1}
+DEFAULT_MIX = {"tcp": 0.7, "udp": 0.25, "icmp": 0.05}
+
+ETH_HEADER = b"\x00\x11\x22\x33\x44\x55" + b"\x66\x77\x88\x99\xaa\xbb" + b"\x08\x00"
+IP_HEADER_LEN = 20
+L4_HEADER_LEN = {6: 20, 17: 8, 1: 8}
+
+# Servers outside the YouTube ranges
+OTHER_SERVERS = ["93.184.216.0/24", "151.101.0.0/16", "104.16.0.0/16", "13.32.0.0/15"]
+CLIENTS = "192.168.1.0/24"
+OTHER_PORTS = [53, 80, 123, 443, 993, 5222, 8080]
+
+# Bytes buffered before each write
+WRITE_CHUNK = 4 * 1024 * 1024
+
+
+# Random host addresses inside the given networks
+def random_addresses(rng, cidrs, count):
+    networks = [ipaddress.ip_network(cidr) for cidr in cidrs]
+    picks = rng.integers(0, len(networks), count)
+    addresses = []
+    for pick in picks:
+        network = networks[pick]
+        offset = int(rng.integers(1, network.num_addresses - 1))
+        addresses.append(int(network.network_address) + offset)
+    return addresses
+
+
+# One row per flow: protocol, addresses, ports, typical packet size
+def make_flows(rng, flows, protocol_mix, youtube_share):
+    names = list(protocol_mix)
+    shares = np.array([protocol_mix[name] for name in names], dtype=float)
+    protocols = np.array([PROTOCOLS[name] for name in names])[rng.choice(len(names), flows, p=shares / shares.sum())]
+
+    youtube = rng.random(flows) < youtube_share
+    # ICMP flows have no ports, so they never count as YouTube traffic
+    youtube &= protocols != PROTOCOLS["icmp"]
+    servers = np.where(youtube,
+                       random_addresses(rng, YOUTUBE_RANGES, flows),
+                       random_addresses(rng, OTHER_SERVERS, flows))
+    clients = np.array(random_addresses(rng, [CLIENTS], flows))
+    client_ports = rng.integers(1024, 65535, flows)
+    server_ports = np.where(youtube, 443, rng.choice(OTHER_PORTS, flows))
+    outbound = rng.random(flows) < 0.5
+
+    # Mostly small packets, a share of bulk-transfer flows near the MTU
+    sizes = np.where(rng.random(flows) < 0.3, rng.integers(1000, 1515, flows), rng.integers(60, 400, flows))
+
+    return {
+        "protocol": protocols,
+        "src": np.where(outbound, clients, servers),
+        "dst": np.where(outbound, servers, clients),
+        "sport": np.where(outbound, client_ports, server_ports),
+        "dport": np.where(outbound, server_ports, client_ports),
+        "size": sizes,
+        "youtube": youtube,
+    }
+
+
+# Ethernet + IPv4 + transport header for one packet of a flow, with the lengths filled in
+def packet_bytes(protocol, src, dst, sport, dport, frame_size):
+    header_len = len(ETH_HEADER) + IP_HEADER_LEN + L4_HEADER_LEN[protocol]
+    frame_size = max(frame_size, header_len)
+    ip_len = frame_size - len(ETH_HEADER)
+    ip = struct.pack(">BBHHHBBHII", 0x45, 0, ip_len, 0, 0x4000, 64, protocol, 0, src, dst)
+    if protocol == 6:
+        l4 = struct.pack(">HHIIBBHHH", sport, dport, 0, 0, 0x50, 0x18, 65535, 0, 0)
+    elif protocol == 17:
+        l4 = struct.pack(">HHHH", sport, dport, ip_len - IP_HEADER_LEN, 0)
+    else:
+        l4 = struct.pack(">BBHHH", 8, 0, 0, 0, 0)
+    return ETH_HEADER + ip + l4 + bytes(frame_size - header_len)
+
+
+def pcap_header():
+    return struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)
+
+
+def pcap_record(ts, data):
+    seconds = int(ts)
+    return struct.pack("<IIII", seconds, int(round((ts - seconds) * 1e6)), len(data), len(data)) + data
+
+
+def pcapng_header():
+    shb = struct.pack("<IIIHHqI", 0x0A0D0D0A, 28, 0x1A2B3C4D, 1, 0, -1, 28)
+    idb = struct.pack("<IIHHII", 1, 20, 1, 0, 65535, 20)
+    return shb + idb
+
+
+def pcapng_record(ts, data):
+    # Default interface resolution is microseconds
+    micros = int(round(ts * 1e6))
+    padded = data + bytes(-len(data) % 4)
+    block_len = 32 + len(padded)
+    return (struct.pack("<IIIIIII", 6, block_len, 0, micros >> 32, micros & 0xFFFFFFFF, len(data), len(data))
+            + padded + struct.pack("<I", block_len))
+
+
+# Writes a capture and returns a summary of what was generated
+# packets: total packets, flows: distinct 5-tuples (every flow gets at least one packet)
+# protocol_mix: {"tcp"/"udp"/"icmp": share}, youtube_share: share of flows to/from YouTube addresses
+def generate_capture(path, packets=10_000, flows=200, protocol_mix=None, youtube_share=0.3,
+                     file_format="pcap", duration=60.0, seed=0):
+    if flows < 1 or packets < flows:
+        raise ValueError("Need at least one flow and at least one packet per flow")
+    if file_format not in ("pcap", "pcapng"):
+        raise ValueError(f"Unknown capture format: {file_format}")
+
+    rng = np.random.default_rng(seed)
+    flow_table = make_flows(rng, flows, protocol_mix or DEFAULT_MIX, youtube_share)
+
+    # Every flow appears once, the rest of the packets favour a few busy flows
+    weights = rng.pareto(1.5, flows) + 1
+    packet_flows = np.concatenate([np.arange(flows), rng.choice(flows, packets - flows, p=weights / weights.sum())])
+    rng.shuffle(packet_flows)
+    timestamps = 1_700_000_000 + np.sort(rng.random(packets)) * duration
+    jitter = rng.integers(-40, 41, packets)
+
+    header, record = (pcap_header, pcap_record) if file_format == "pcap" else (pcapng_header, pcapng_record)
+    # Flow columns as Python lists, indexing NumPy scalars per packet is slow
+    columns = {name: values.tolist() for name, values in flow_table.items()}
+    total_bytes = 0
+    with open(path, "wb") as f:
+        buffer = bytearray(header())
+        for flow, ts, delta in zip(packet_flows.tolist(), timestamps.tolist(), jitter.tolist()):
+            data = packet_bytes(columns["protocol"][flow], columns["src"][flow], columns["dst"][flow],
+                                columns["sport"][flow], columns["dport"][flow],
+                                min(columns["size"][flow] + delta, 1514))
+            total_bytes += len(data)
+            buffer += record(ts, data)
+            if len(buffer) >= WRITE_CHUNK:
+                f.write(buffer)
+                buffer.clear()
+        f.write(buffer)
+
+    protocol_names = {number: name for name, number in PROTOCOLS.items()}
+    return {
+        "path": str(path),
+        "format": file_format,
+        "packets": packets,
+        "flows": flows,
+        "port_flows": int((flow_table["protocol"] != PROTOCOLS["icmp"]).sum()),
+        "youtube_flows": int(flow_table["youtube"].sum()),
+        "protocol_flows": {protocol_names[p]: int((flow_table["protocol"] == p).sum())
+                           for p in np.unique(flow_table["protocol"])},
+        "packet_bytes": total_bytes,
+        "seed": seed,
+    }
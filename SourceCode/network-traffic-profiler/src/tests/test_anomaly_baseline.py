@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import anomaly_baseline
+from anomaly_baseline import current_baseline, train_baseline
+from build_dataset import build_dataset, load_anomaly_model
+from ML.model_training.model_registry import ModelRegistry
+
+
+def write_flows(path, rows, seed):
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        "src_ip": "10.0.0.1",
+        "packet_count": rng.integers(1, 500, rows),
+        "byte_count": rng.lognormal(8, 2, rows),
+        "duration": rng.exponential(5, rows),
+        "protocol": 6,
+        "is_valid": rng.random(rows) > 0.1,
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_train_on_corpus_and_score_captures(tmp_path):
+    paths = [write_flows(tmp_path / f"day{i}_validated.csv", 400, i) for i in range(3)]
+    out = str(tmp_path / "baseline.joblib")
+    assert anomaly_baseline.main(paths + ["--out", out, "--max-fit-rows", "500"]) == 0
+
+    baseline = load_anomaly_model(out)
+    assert baseline["columns"] == ["packet_count", "byte_count", "duration"]
+    assert baseline["dropped_columns"] == ["protocol"]
+    assert baseline["fit_rows"] == 500
+    assert baseline["corpus"] == [f"day{i}_validated.csv" for i in range(3)]
+
+    # The same flows get the same score whichever capture they arrive in
+    capture = pd.read_csv(paths[0])
+    alone, info = build_dataset(capture.copy(), "day0", reference=baseline)
+    combined, _ = build_dataset(pd.concat([capture, pd.read_csv(paths[1])]), "both", reference=baseline)
+    assert info["baseline"] is True
+    assert info["fit_rows"] == 500
+    assert "protocol" not in alone.columns
+    assert np.array_equal(alone["anomaly_score"].to_numpy(), combined["anomaly_score"].to_numpy()[:len(alone)])
+
+
+def test_only_columns_shared_by_every_file_are_used(tmp_path):
+    first = write_flows(tmp_path / "a.csv", 200, 0)
+    second = tmp_path / "b.csv"
+    pd.read_csv(write_flows(second, 200, 1)).drop(columns=["duration"]).to_csv(second, index=False)
+
+    assert train_baseline([first, str(second)])["columns"] == ["packet_count", "byte_count"]
+
+
+def test_rejects_files_that_are_not_validated_flows(tmp_path):
+    path = tmp_path / "raw.csv"
+    pd.DataFrame({"packet_count": [1, 2]}).to_csv(path, index=False)
+    with pytest.raises(ValueError, match="is_valid"):
+        train_baseline([str(path)])
+
+
+def test_current_baseline_is_loaded_once_when_present(tmp_path, monkeypatch):
+    path = tmp_path / "baseline.joblib"
+    monkeypatch.setattr(anomaly_baseline, "registry", ModelRegistry({"baseline": str(path)}))
+    assert current_baseline() is None
+
+    anomaly_baseline.main([write_flows(tmp_path / "a.csv", 200, 0), "--out", str(path)])
+    assert current_baseline()["corpus"] == ["a.csv"]
+    assert current_baseline() is current_baseline()
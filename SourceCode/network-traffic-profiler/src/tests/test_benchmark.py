@@ -0,0 +1,49 @@
+import json
+
+import benchmark
+
+
+def test_run_benchmarks_writes_comparable_results(tmp_path):
+    scenarios = {"tiny": {"packets": 1500, "flows": 60}}
+    out_path, results = benchmark.run_benchmarks(scenarios, stages=["extract", "validate", "build"],
+                                                 repeat=2, out_path=str(tmp_path / "run.json"),
+                                                 capture_dir=str(tmp_path / "captures"))
+
+    with open(out_path) as f:
+        saved = json.load(f)
+    assert saved["scenarios"]["tiny"]["packets"] == 1500
+    assert [row["stage"] for row in saved["results"]] == ["extract", "validate", "build"]
+    for row in saved["results"]:
+        assert row["status"] == "ok"
+        assert len(row["runs"]) == 2
+        assert row["min_seconds"] <= row["median_seconds"]
+        assert row["packets_per_sec"] > 0
+    assert "commit" in saved["environment"]
+
+    # The generated capture is reused by the next run
+    captures = sorted(p.name for p in (tmp_path / "captures").iterdir())
+    benchmark.run_benchmarks(scenarios, stages=["extract"], repeat=1, out_path=str(tmp_path / "run2.json"),
+                             capture_dir=str(tmp_path / "captures"))
+    assert sorted(p.name for p in (tmp_path / "captures").iterdir()) == captures
+
+
+def test_compare_flags_regressions():
+    def results(extract, validate):
+        return {"results": [
+            {"scenario": "small", "stage": "extract", "median_seconds": extract},
+            {"scenario": "small", "stage": "validate", "median_seconds": validate},
+        ]}
+
+    rows = benchmark.compare_results(results(1.0, 0.5), results(1.5, 0.52))
+    assert [row["regression"] for row in rows] == [True, False]
+    assert rows[0]["change"] == 0.5
+
+
+def test_compare_command_exit_code(tmp_path):
+    old = {"environment": {"commit": "a"}, "results": [{"scenario": "s", "stage": "extract", "median_seconds": 1.0}]}
+    new = {"environment": {"commit": "b"}, "results": [{"scenario": "s", "stage": "extract", "median_seconds": 2.0}]}
+    (tmp_path / "old.json").write_text(json.dumps(old))
+    (tmp_path / "new.json").write_text(json.dumps(new))
+
+    assert benchmark.main(["compare", str(tmp_path / "old.json"), str(tmp_path / "new.json")]) == 1
+    assert benchmark.main(["compare", str(tmp_path / "new.json"), str(tmp_path / "old.json")]) == 0
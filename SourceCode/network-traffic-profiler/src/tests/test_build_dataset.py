@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import RobustScaler
+
+from build_dataset import build_dataset, fit_anomaly_model, save_anomaly_model, score_anomalies
+
+
+def make_flows(rows=600, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "src_ip": "10.0.0.1",
+        "packet_count": rng.integers(1, 500, rows),
+        "byte_count": rng.lognormal(8, 2, rows),
+        "duration": rng.exponential(5, rows),
+        "constant": 1,
+        "is_valid": True,
+    })
+    df.loc[0, "is_valid"] = False
+    return df
+
+
+def test_small_capture_matches_fitting_on_every_flow():
+    df = make_flows()
+    numeric_df, anomaly_info = build_dataset(df.copy(), "capture")
+
+    # what build_dataset did before sampling and chunking
+    features = df[df["is_valid"]][["packet_count", "byte_count", "duration"]]
+    scaled = RobustScaler().fit_transform(features)
+    preds = IsolationForest(n_estimators=200, contamination=0.1, random_state=42).fit(scaled).predict(scaled)
+
+    assert "constant" not in numeric_df.columns
+    assert numeric_df["anomaly"].dtype == bool
+    assert (numeric_df["anomaly"].to_numpy() == (preds == -1)).all()
+    assert anomaly_info["anomaly_count"] == int((preds == -1).sum())
+    assert anomaly_info["total_flows"] == len(features)
+    assert anomaly_info["fit_rows"] == len(features)
+
+
+def test_large_capture_is_fitted_on_a_sample():
+    df = make_flows(rows=2000)
+    numeric_df, anomaly_info = build_dataset(df, "capture", max_fit_rows=300)
+
+    assert anomaly_info["fit_rows"] == 300
+    assert anomaly_info["total_flows"] == len(numeric_df) == 1999
+    assert (numeric_df["anomaly"] == (numeric_df["anomaly_score"] > 0)).all()
+
+
+def test_chunk_size_does_not_change_scores():
+    numeric_df = make_flows(rows=1000)[["packet_count", "byte_count", "duration"]]
+    anomaly_model = fit_anomaly_model(numeric_df, max_fit_rows=400)
+
+    whole = score_anomalies(anomaly_model, numeric_df, chunk_size=len(numeric_df))
+    chunked = score_anomalies(anomaly_model, numeric_df, chunk_size=64)
+    assert np.array_equal(whole, chunked)
+
+
+def test_reference_model_scores_another_capture(tmp_path):
+    reference = make_flows(rows=800)
+    numeric_df, _ = build_dataset(reference, "baseline")
+    anomaly_model = fit_anomaly_model(numeric_df.drop(columns=["anomaly", "anomaly_score"]))
+    path = str(tmp_path / "baseline.joblib")
+    save_anomaly_model(anomaly_model, path)
+
+    # the reference decides the columns, even ones this capture has no variance in
+    other = make_flows(rows=300, seed=1).assign(duration=2.0)
+    scored, anomaly_info = build_dataset(other, "other", reference=path)
+    assert "duration" in scored.columns
+    assert anomaly_info["fit_rows"] == 799
+    expected = score_anomalies(anomaly_model, other[other["is_valid"]][["packet_count", "byte_count", "duration"]])
+    assert np.allclose(scored["anomaly_score"], expected)
+
+
+def test_reference_missing_columns_raises():
+    numeric_df = make_flows()[["packet_count", "byte_count", "duration"]]
+    anomaly_model = fit_anomaly_model(numeric_df)
+
+    with pytest.raises(ValueError, match="duration"):
+        build_dataset(make_flows().drop(columns=["duration"]), "other", reference=anomaly_model)
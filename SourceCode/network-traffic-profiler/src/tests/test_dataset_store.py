@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from dataset_store import apply_dtypes, first_existing, read_table, storage_format, write_table
+
+
+def training_rows():
+    return pd.DataFrame({
+        "file_source": ["Play_1.pcap", "Like_0.pcap", "Like_0.pcap", "Play_0.pcap", "Like_1.pcap"],
+        "src_ip": ["192.168.0.21", "142.250.140.94", "192.168.0.21", "192.168.0.21", "10.0.0.2"],
+        "src_port": [49627, 443, 37319, 50000, 443],
+        "protocol": [17, 6, 17, 6, 6],
+        "duration": [1.5, 0.25, 3.0, 0.125, 2.0],
+        "pk_count": [14, 6, 3, 20, 8],
+        "action": ["Play", "Background", "Like", "Background", "Like"],
+    })
+
+
+def test_dtypes():
+    df = apply_dtypes(training_rows())
+    assert isinstance(df["src_ip"].dtype, pd.CategoricalDtype)
+    assert isinstance(df["action"].dtype, pd.CategoricalDtype)
+    assert df["src_port"].dtype == np.uint16
+    assert df["protocol"].dtype == np.uint8
+    assert df["duration"].dtype == np.float32
+    assert df["pk_count"].dtype == np.int64
+
+    # values that don't fit stay as they are
+    odd = apply_dtypes(pd.DataFrame({"src_port": [443.0, np.nan], "dst_port": [70000, 1]}))
+    assert odd["src_port"].dtype == np.float64
+    assert odd["dst_port"].dtype == np.int64
+
+
+@pytest.mark.parametrize("name", ["data.parquet", "data.feather", "data.csv"])
+def test_round_trip_with_projection(tmp_path, name):
+    path = str(tmp_path / name)
+    write_table(training_rows(), path)
+
+    df = read_table(path, columns=["duration", "action"])
+    assert list(df.columns) == ["duration", "action"]
+    assert df["duration"].dtype == np.float32
+    expected = training_rows()[["duration", "action"]]
+    merged = df.astype({"action": str}).merge(expected, on=["duration", "action"])
+    assert len(merged) == len(expected)
+
+
+def test_csv_is_written_unchanged(tmp_path):
+    path = tmp_path / "data.csv"
+    write_table(training_rows(), str(path))
+    pd.testing.assert_frame_equal(pd.read_csv(path), training_rows())
+
+
+def test_parquet_row_groups_follow_action(tmp_path):
+    path = str(tmp_path / "data.parquet")
+    write_table(training_rows(), path, row_group_rows=1000)
+
+    parquet = pq.ParquetFile(path)
+    assert parquet.num_row_groups == 3
+    df = read_table(path)
+    assert list(df["action"]) == ["Background", "Background", "Like", "Like", "Play"]
+    assert list(df["file_source"][:2]) == ["Like_0.pcap", "Play_0.pcap"]
+
+    likes = read_table(path, columns=["file_source"], filters=[("action", "=", "Like")])
+    assert sorted(likes["file_source"]) == ["Like_0.pcap", "Like_1.pcap"]
+
+
+def test_filters_on_feather_and_csv(tmp_path):
+    for name in ["data.feather", "data.csv"]:
+        path = str(tmp_path / name)
+        write_table(training_rows(), path)
+        plays = read_table(path, filters=[("action", "in", ["Play"])])
+        assert list(plays["file_source"]) == ["Play_1.pcap"]
+
+
+def test_unknown_format_and_fallback(tmp_path):
+    with pytest.raises(ValueError):
+        storage_format("data.xlsx")
+    csv_path = tmp_path / "data.csv"
+    csv_path.write_text("a\n1\n")
+    assert first_existing(str(tmp_path / "data.parquet"), str(csv_path)) == str(csv_path)
+    with pytest.raises(FileNotFoundError):
+        first_existing(str(tmp_path / "missing.parquet"))
@@ -1,9 +1,13 @@
+import struct
+
 import pytest
+import numpy as np
 import pandas as pd
 from unittest.mock import patch, MagicMock
-from scapy.all import IP, TCP, UDP
+from scapy.all import Ether, IP, TCP, UDP, ICMP, wrpcap, wrpcapng
 # Assuming your merged function is in unified_extraction.py
-from extract_features_unified import extract_all_pcap_data, is_google_youtube_ip
+from extract_features_unified import extract_all_pcap_data, is_google_youtube_ip, compute_ml_features, aggregate_shards, FLOW_DTYPES
+import packet_parser
 
 # --- Shared Helpers ---
 
@@ -79,4 +83,209 @@ def test_ml_only_flag(mock_rdpcap, mock_exists):
     df_flows, df_ml = extract_all_pcap_data("dummy.pcap", ml_only=True)
 
     assert df_flows.empty  # General extraction skipped
-    assert not df_ml.empty # ML extraction performed
\ No newline at end of file
+    assert not df_ml.empty # ML extraction performed
+
+# --- Streaming Mode ---
+
+# Writes a small capture with YouTube, background and port-less traffic
+def write_capture(path, writer=wrpcap):
+    yt_ip = "172.217.0.1"
+    local_ip = "192.168.1.5"
+    packets = []
+    for n in range(6):
+        packets.append(Ether() / IP(src=local_ip, dst=yt_ip) / TCP(sport=12345, dport=443) / (b"x" * (40 + n * 7)))
+        packets.append(Ether() / IP(src=yt_ip, dst=local_ip) / TCP(sport=443, dport=12345) / (b"y" * (900 + n)))
+        packets.append(Ether() / IP(src=local_ip, dst="8.8.8.8") / UDP(sport=5353, dport=53) / b"q")
+    packets.append(Ether() / IP(src=local_ip, dst="8.8.8.8") / ICMP())
+    for n, pkt in enumerate(packets):
+        pkt.time = 1000.0 + n * 0.37 + (n % 4) * 0.011
+    writer(str(path), packets)
+    return str(path)
+
+@pytest.mark.parametrize("writer", [wrpcap, wrpcapng])
+# Streaming mode must return the same flows and ML features as the rdpcap mode
+def test_streaming_matches_default(tmp_path, writer):
+    path = write_capture(tmp_path / "capture.pcap", writer)
+
+    df_flows, df_ml = extract_all_pcap_data(path)
+    s_flows, s_ml = extract_all_pcap_data(path, streaming=True)
+
+    # both modes apply FLOW_DTYPES, so the flow tables match dtypes as well
+    pd.testing.assert_frame_equal(s_flows, df_flows)
+    pd.testing.assert_frame_equal(s_ml, df_ml, check_dtype=False)
+
+@pytest.mark.parametrize("options", [{}, {"streaming": True, "engine": "fast"}])
+# Every mode returns the compact flow schema
+def test_flows_use_compact_schema(tmp_path, options):
+    path = write_capture(tmp_path / "capture.pcap")
+    df_flows, _ = extract_all_pcap_data(path, **options)
+
+    assert df_flows.dtypes.astype(str).to_dict() == {col: str(pd.Series(dtype=dtype).dtype) for col, dtype in FLOW_DTYPES.items()}
+    assert set(df_flows["protocol_name"]) == {"TCP", "UDP"}
+    assert 443 in df_flows["src_port"].tolist()
+
+# Streaming mode labels every ML flow when a training label is given
+def test_streaming_label_and_ml_only(tmp_path):
+    path = write_capture(tmp_path / "capture.pcap")
+
+    df_flows, df_ml = extract_all_pcap_data(path, ml_only=True, label="Like", streaming=True)
+
+    assert df_flows.empty
+    assert len(df_ml) == 2
+    assert (df_ml["action"] == "Like").all()
+
+# --- Fast Engine ---
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("writer", [wrpcap, wrpcapng])
+# The fast header parser must fill exactly the same rows as Scapy
+def test_fast_engine_matches_scapy(tmp_path, writer, streaming):
+    path = write_capture(tmp_path / "capture.pcap", writer)
+
+    df_flows, df_ml = extract_all_pcap_data(path, streaming=streaming)
+    f_flows, f_ml = extract_all_pcap_data(path, streaming=streaming, engine="fast")
+
+    pd.testing.assert_frame_equal(f_flows, df_flows)
+    pd.testing.assert_frame_equal(f_ml, df_ml)
+
+def test_unknown_engine_rejected():
+    with pytest.raises(ValueError):
+        extract_all_pcap_data("dummy.pcap", engine="tshark")
+
+# --- Parallel Shards ---
+
+# Writes a capture with several interleaved YouTube and background flows
+def write_large_capture(path, writer=wrpcap, n_packets=400):
+    rng = np.random.default_rng(3)
+    packets = []
+    for n in range(n_packets):
+        flow = int(rng.integers(0, 6))
+        size = int(rng.integers(0, 1200))
+        if flow < 3:
+            pkt = Ether() / IP(src="192.168.1.5", dst="172.217.0.%d" % (flow + 1)) / TCP(sport=40000 + flow, dport=443)
+        elif flow < 5:
+            pkt = Ether() / IP(src="142.250.0.9", dst="192.168.1.5") / UDP(sport=443, dport=50000 + flow)
+        else:
+            pkt = Ether() / IP(src="192.168.1.5", dst="8.8.8.8") / UDP(sport=5353, dport=53)
+        pkt = pkt / (b"z" * size)
+        pkt.time = 1000.0 + n * 0.05 + float(rng.random()) * 0.01
+        packets.append(pkt)
+    writer(str(path), packets)
+    return str(path)
+
+@pytest.mark.parametrize("writer", [wrpcap, wrpcapng])
+# Merging the shards must give the same frames as one streaming pass
+def test_parallel_shards_match_streaming(tmp_path, monkeypatch, writer):
+    path = write_large_capture(tmp_path / "capture.pcap", writer)
+    monkeypatch.setattr(packet_parser, "MIN_SHARD_BYTES", 4096)
+
+    s_flows, s_ml = extract_all_pcap_data(path, streaming=True, engine="fast")
+    p_flows, p_ml = extract_all_pcap_data(path, engine="fast", workers=4)
+
+    pd.testing.assert_frame_equal(p_flows, s_flows)
+    pd.testing.assert_frame_equal(p_ml, s_ml, check_exact=False, rtol=1e-9)
+
+@pytest.mark.parametrize("writer", [wrpcap, wrpcapng])
+# A shard boundary that isn't really a record start must not change the result
+def test_parallel_shards_recover_from_bad_boundary(tmp_path, writer):
+    path = write_large_capture(tmp_path / "capture.pcap", writer)
+    shards = packet_parser.plan_shards(path, 3, min_bytes=4096)
+    assert len(shards) == 3
+    shards[1]["cursor"]["pos"] += 6
+    shards[0]["end"] += 6
+
+    s_flows, s_ml = extract_all_pcap_data(path, streaming=True, engine="fast")
+    p_flows, p_ml = aggregate_shards(path, shards, engine="fast")
+
+    pd.testing.assert_frame_equal(p_flows, s_flows)
+    pd.testing.assert_frame_equal(p_ml, s_ml, check_exact=False, rtol=1e-9)
+
+# pcapng writer where only every tenth packet is an Enhanced Packet Block with a timestamp,
+# the rest are Simple Packet Blocks, which take the time of the packet before them
+def write_pcapng_simple_blocks(path, packets):
+    def block(block_type, body):
+        body += b"\0" * (-len(body) % 4)
+        length = 12 + len(body)
+        return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+    blocks = [block(0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1)),
+              block(1, struct.pack("<HHI", 1, 0, 0))]
+    for n, pkt in enumerate(packets):
+        data = bytes(pkt)
+        if n % 10 == 0:
+            ts = int(pkt.time * 1_000_000)
+            blocks.append(block(6, struct.pack("<5I", 0, ts >> 32, ts & 0xFFFFFFFF, len(data), len(data)) + data))
+        else:
+            blocks.append(block(3, struct.pack("<I", len(data)) + data))
+    with open(path, "wb") as f:
+        f.write(b"".join(blocks))
+
+# Shards starting on a Simple Packet Block take the time from the shard before them
+def test_parallel_shards_keep_simple_packet_block_times(tmp_path, monkeypatch):
+    path = write_large_capture(tmp_path / "capture.pcapng", write_pcapng_simple_blocks)
+    monkeypatch.setattr(packet_parser, "MIN_SHARD_BYTES", 4096)
+    assert len(packet_parser.plan_shards(path, 4)) == 4
+
+    s_flows, s_ml = extract_all_pcap_data(path, streaming=True, engine="fast")
+    p_flows, p_ml = extract_all_pcap_data(path, engine="fast", workers=4)
+
+    assert s_flows["packet_count"].sum() == 400
+    pd.testing.assert_frame_equal(p_flows, s_flows)
+    pd.testing.assert_frame_equal(p_ml, s_ml, check_exact=False, rtol=1e-9)
+
+# --- Vectorised ML Features ---
+
+# Per-flow pandas computation the columnar version replaced
+def reference_ml_features(pkt_list):
+    m_df = pd.DataFrame(pkt_list)
+    m_df["iat"] = m_df["ts"].diff().fillna(0)
+    in_pkts = len(m_df[m_df["is_outbound"] == 0])
+    out_pkts = len(m_df[m_df["is_outbound"] == 1])
+    duration = m_df["ts"].max() - m_df["ts"].min()
+    total_bytes = m_df["size"].sum()
+    return {
+        "duration": duration,
+        "std_iat": m_df["iat"].std() if len(m_df) > 1 else 0,
+        "avg_iat": m_df["iat"].mean(),
+        "pk_count": len(m_df),
+        "avg_packet_size": m_df["size"].mean(),
+        "throughput": total_bytes / duration if duration > 0 else 0,
+        "max_pkt_size": m_df["size"].max(),
+        "pkt_burst_std": m_df["size"].std() if len(m_df) > 1 else 0,
+        "pk_count_ratio": (out_pkts / in_pkts if in_pkts > 0 else out_pkts),
+        "avg_inbound_size": m_df[m_df["is_outbound"] == 0]["size"].mean() if in_pkts > 0 else 0,
+        "avg_outbound_size": m_df[m_df["is_outbound"] == 1]["size"].mean() if out_pkts > 0 else 0,
+        "total_bytes": total_bytes,
+        "outbound_ratio": m_df["is_outbound"].mean()
+    }
+
+# The columnar pass must agree with the per-flow computation on interleaved flows,
+# including single packet flows, one-directional flows and out of order timestamps
+def test_compute_ml_features_matches_per_flow_reference():
+    rng = np.random.default_rng(7)
+    n_flows = 40
+    flows = rng.integers(0, n_flows, 3000)
+    flows[:n_flows] = np.arange(n_flows)
+    packets = {
+        "flow": flows.tolist(),
+        "ts": (1000 + np.cumsum(rng.exponential(0.01, len(flows))) - rng.random(len(flows)) * 0.005).tolist(),
+        "size": rng.integers(40, 1500, len(flows)).tolist(),
+        "is_outbound": (rng.random(len(flows)) < np.where(flows % 5 == 0, 0.0, 0.4)).astype(int).tolist(),
+    }
+    # Flow 1 only ever sees its first packet
+    keep = [i for i, f in enumerate(packets["flow"]) if f != 1 or i == 1]
+    packets = {col: [values[i] for i in keep] for col, values in packets.items()}
+    keys = [("10.0.0.1", "172.217.0.1", 1000 + f, 443, 6) for f in range(n_flows)]
+
+    result = compute_ml_features(keys, packets)
+
+    for flow_id, key in enumerate(keys):
+        pkt_list = [
+            {"ts": packets["ts"][i], "size": packets["size"][i], "is_outbound": packets["is_outbound"][i]}
+            for i, f in enumerate(packets["flow"]) if f == flow_id
+        ]
+        expected = reference_ml_features(pkt_list)
+        row = result.iloc[flow_id]
+        assert tuple(row[["src_ip", "dst_ip", "src_port", "dst_port", "protocol"]]) == key
+        for col, value in expected.items():
+            assert row[col] == pytest.approx(value, rel=1e-12, abs=1e-15), col
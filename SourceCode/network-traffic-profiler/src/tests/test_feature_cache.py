@@ -0,0 +1,130 @@
+import os
+import time
+
+import pandas as pd
+from unittest.mock import patch
+from scapy.all import Ether, IP, TCP, UDP, ICMP, wrpcap
+
+import feature_cache
+from feature_cache import FeatureCache, extract_cached, file_digest
+from extract_features_unified import extract_all_pcap_data
+
+
+# Capture with a YouTube flow, a background flow and an ICMP packet
+def write_capture(path, extra=b""):
+    packets = [
+        Ether() / IP(src="192.168.1.5", dst="172.217.0.1") / TCP(sport=40000, dport=443) / (b"x" * 300),
+        Ether() / IP(src="172.217.0.1", dst="192.168.1.5") / TCP(sport=443, dport=40000) / (b"y" * 900),
+        Ether() / IP(src="192.168.1.5", dst="8.8.8.8") / UDP(sport=5353, dport=53) / extra,
+        Ether() / IP(src="192.168.1.5", dst="8.8.8.8") / ICMP(),
+    ]
+    for n, pkt in enumerate(packets):
+        pkt.time = 1000.0 + n * 0.5
+    wrpcap(str(path), packets)
+    return str(path)
+
+
+def test_second_call_reads_from_cache(tmp_path):
+    path = write_capture(tmp_path / "a.pcap")
+    cache = FeatureCache(str(tmp_path / "cache"))
+
+    flows, ml = extract_cached(path, cache=cache)
+    with patch("feature_cache.extract_all_pcap_data") as mock_extract:
+        c_flows, c_ml = extract_cached(path, cache=cache)
+
+    mock_extract.assert_not_called()
+    expected_flows, expected_ml = extract_all_pcap_data(path)
+    pd.testing.assert_frame_equal(c_flows, expected_flows)
+    pd.testing.assert_frame_equal(c_ml, expected_ml)
+    pd.testing.assert_frame_equal(flows, expected_flows)
+
+
+def test_engine_and_mode_have_their_own_entries(tmp_path):
+    path = write_capture(tmp_path / "a.pcap")
+    cache = FeatureCache(str(tmp_path / "cache"))
+    extract_cached(path, cache=cache, engine="fast", streaming=True)
+
+    with patch("feature_cache.extract_all_pcap_data", wraps=extract_all_pcap_data) as mock_extract:
+        flows, _ = extract_cached(path, cache=cache, engine="scapy", streaming=True)
+        extract_cached(path, cache=cache, engine="fast")
+        assert mock_extract.call_count == 2
+        # a sharded run shares the streaming entry
+        extract_cached(path, cache=cache, engine="fast", workers=4)
+        assert mock_extract.call_count == 2
+
+    pd.testing.assert_frame_equal(flows, extract_all_pcap_data(path, streaming=True, engine="scapy")[0])
+
+
+def test_label_is_applied_after_the_cache(tmp_path):
+    path = write_capture(tmp_path / "a.pcap")
+    cache = FeatureCache(str(tmp_path / "cache"))
+
+    _, first = extract_cached(path, ml_only=True, label="Like", cache=cache)
+    _, second = extract_cached(path, ml_only=True, label="Play", cache=cache)
+
+    assert (first["action"] == "Like").all()
+    assert (second["action"] == "Play").all()
+
+
+def test_key_depends_on_content_options_and_version(tmp_path, monkeypatch):
+    cache = FeatureCache(str(tmp_path / "cache"))
+    a = file_digest(write_capture(tmp_path / "a.pcap"))
+    b = file_digest(write_capture(tmp_path / "b.pcap", extra=b"changed"))
+
+    assert a != b
+    assert cache.key(a, ml_only=False) != cache.key(a, ml_only=True)
+    key = cache.key(a, ml_only=False)
+    monkeypatch.setattr(feature_cache, "EXTRACTOR_VERSION", feature_cache.EXTRACTOR_VERSION + 1)
+    assert cache.key(a, ml_only=False) != key
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    frame = pd.DataFrame({"x": range(1000)})
+    cache = FeatureCache(str(tmp_path / "cache"))
+    cache.put("old", {"f": frame})
+    cache.put("new", {"f": frame})
+    # Entries differ by a few bytes (meta.json holds a timestamp), so leave room for two but not three
+    entry_size = max(size for _, size, _ in cache.entries())
+
+    # Make "old" the most recently read entry
+    past = time.time() - 100
+    os.utime(os.path.join(cache.entry_path("new"), "meta.json"), (past, past))
+    assert cache.get("old") is not None
+
+    cache.max_bytes = entry_size * 2 + entry_size // 2
+    cache.put("third", {"f": frame})
+
+    assert cache.get("new") is None
+    assert cache.get("old") is not None
+    assert cache.get("third") is not None
+
+
+def test_known_digest_is_not_recomputed(tmp_path):
+    path = write_capture(tmp_path / "a.pcap")
+    cache = FeatureCache(str(tmp_path / "cache"))
+    flows, _ = extract_cached(path, cache=cache)
+
+    with patch("feature_cache.file_digest") as mock_digest:
+        c_flows, _ = extract_cached(path, cache=cache, digest=file_digest(path))
+    mock_digest.assert_not_called()
+    pd.testing.assert_frame_equal(c_flows, flows)
+
+
+def test_missing_entry_is_a_miss(tmp_path):
+    assert FeatureCache(str(tmp_path / "cache")).get("nothing") is None
+
+
+def test_columns_are_projected_on_hits_and_misses(tmp_path):
+    path = write_capture(tmp_path / "a.pcap")
+    cache = FeatureCache(str(tmp_path / "cache"))
+    columns = {"flows": [], "ml": ["src_ip", "total_bytes"]}
+
+    miss_flows, miss_ml = extract_cached(path, cache=cache, columns=columns)
+    with patch("feature_cache.extract_all_pcap_data") as mock_extract:
+        hit_flows, hit_ml = extract_cached(path, cache=cache, columns=columns)
+
+    mock_extract.assert_not_called()
+    assert miss_flows.empty and hit_flows.empty
+    assert list(hit_ml.columns) == ["src_ip", "total_bytes"]
+    pd.testing.assert_frame_equal(hit_ml, miss_ml)
+    pd.testing.assert_frame_equal(hit_ml, extract_all_pcap_data(path)[1][["src_ip", "total_bytes"]])
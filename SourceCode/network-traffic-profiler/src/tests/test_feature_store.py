@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import feature_store
+from build_dataset import build_dataset, fit_anomaly_model, score_scaled
+from feature_store import list_matrices, load_frame, load_matrix, matrix_paths, open_writer, save_matrix
+
+
+def test_save_and_load_memory_mapped(tmp_path):
+    values = np.arange(12, dtype=np.float64).reshape(4, 3)
+    path = save_matrix("capture_scaled", values, ["a", "b", "c"], npy_dir=str(tmp_path), source="capture")
+
+    matrix, schema = load_matrix("capture_scaled", npy_dir=str(tmp_path))
+    assert isinstance(matrix, np.memmap)
+    assert not matrix.flags.writeable
+    assert np.array_equal(matrix, values)
+    assert schema["columns"] == ["a", "b", "c"]
+    assert schema["shape"] == [4, 3]
+    assert schema["source"] == "capture"
+
+    # by .npy path as well as by name, and as a frame over the same memory
+    frame = load_frame(path)
+    assert list(frame.columns) == ["a", "b", "c"]
+    assert frame["b"].tolist() == [1, 4, 7, 10]
+    base = frame["b"].to_numpy()
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    assert isinstance(base, np.memmap)
+    assert list_matrices(str(tmp_path)) == ["capture_scaled"]
+
+
+def test_failed_write_leaves_nothing_behind(tmp_path):
+    with pytest.raises(RuntimeError):
+        with open_writer("broken", 10, ["a"], npy_dir=str(tmp_path)) as matrix:
+            matrix[:5] = 1
+            raise RuntimeError("scaling failed")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_schema_mismatch_is_rejected(tmp_path):
+    save_matrix("m", np.zeros((2, 2)), ["a", "b"], npy_dir=str(tmp_path))
+    _, schema_path = matrix_paths("m", str(tmp_path))
+    with open(schema_path) as f:
+        schema = json.load(f)
+
+    with open(schema_path, "w") as f:
+        json.dump(dict(schema, shape=[3, 2]), f)
+    with pytest.raises(ValueError, match="shape"):
+        load_matrix("m", npy_dir=str(tmp_path))
+
+    with open(schema_path, "w") as f:
+        json.dump(dict(schema, version=feature_store.SCHEMA_VERSION + 1), f)
+    with pytest.raises(ValueError, match="version"):
+        load_matrix("m", npy_dir=str(tmp_path))
+
+
+def test_build_dataset_writes_scaled_matrix_in_chunks(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "packet_count": rng.integers(1, 500, 500),
+        "byte_count": rng.lognormal(8, 2, 500),
+        "duration": rng.exponential(5, 500),
+        "is_valid": True,
+    })
+    numeric_df, _ = build_dataset(df, "office", chunk_size=64, save_scaled=True, npy_dir=str(tmp_path))
+
+    matrix, schema = load_matrix("office_scaled", npy_dir=str(tmp_path))
+    assert schema["columns"] == ["packet_count", "byte_count", "duration"]
+    assert schema["fit_rows"] == 500
+    center, scale = np.array(schema["scaler"]["center"]), np.array(schema["scaler"]["scale"])
+    assert np.allclose(matrix, (df[schema["columns"]].to_numpy() - center) / scale)
+
+    # the stored matrix can be scored again without the raw flows
+    anomaly_model = fit_anomaly_model(df[schema["columns"]])
+    assert np.allclose(score_scaled(anomaly_model, matrix, chunk_size=100), numeric_df["anomaly_score"])
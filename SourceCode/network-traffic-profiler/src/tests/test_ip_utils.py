@@ -0,0 +1,125 @@
+import ipaddress
+
+import numpy as np
+import pandas as pd
+
+from ip_utils import (CidrMatcher, PACKED_DTYPE, YOUTUBE_MATCHER, YOUTUBE_RANGES, format_ips, is_broadcast,
+                      is_loopback, is_multicast, pack_ips, rank_ips, unmap_ipv4)
+
+SAMPLE_IPS = [
+    "172.217.0.1", "172.217.255.255", "172.218.0.0", "142.250.10.10", "142.251.255.255",
+    "142.252.0.0", "74.125.1.1", "64.15.127.255", "64.15.128.0", "8.8.8.8", "192.168.1.5",
+    "0.0.0.0", "255.255.255.255", "2001:db8::1",
+]
+
+
+# The old implementation, scanning every network for every address
+def reference_contains(ip):
+    try:
+        ip_obj = ipaddress.ip_address(ip)
+        return any(ip_obj in ipaddress.ip_network(r) for r in YOUTUBE_RANGES)
+    except Exception:
+        return False
+
+
+def test_contains_matches_ipaddress_scan():
+    for ip in SAMPLE_IPS:
+        assert YOUTUBE_MATCHER.contains(ip) == reference_contains(ip), ip
+
+
+def test_invalid_addresses_are_not_matched():
+    for ip in ["not-an-ip", "", "300.1.1.1", "172.217.0"]:
+        assert YOUTUBE_MATCHER.contains(ip) is False
+
+
+def test_overlapping_blocks_are_merged():
+    matcher = CidrMatcher(["10.0.0.0/8", "10.1.0.0/16", "11.0.0.0/8"])
+    assert matcher.starts[4] == [int(ipaddress.ip_address("10.0.0.0"))]
+    assert matcher.contains("11.255.255.255")
+    assert not matcher.contains("12.0.0.0")
+
+
+def test_ipv6_blocks():
+    matcher = CidrMatcher(["2001:db8::/32", "10.0.0.0/8"])
+    assert matcher.contains("2001:db8:ffff::1")
+    assert not matcher.contains("2001:db9::1")
+    assert matcher.contains("10.2.3.4")
+
+
+def test_contains_many_strings_and_categoricals():
+    expected = np.array([reference_contains(ip) for ip in SAMPLE_IPS])
+
+    assert (YOUTUBE_MATCHER.contains_many(SAMPLE_IPS) == expected).all()
+    assert (YOUTUBE_MATCHER.contains_many(pd.Series(SAMPLE_IPS)) == expected).all()
+    assert (YOUTUBE_MATCHER.contains_many(pd.Series(SAMPLE_IPS, dtype="category")) == expected).all()
+
+
+def test_contains_many_missing_values_are_false():
+    result = YOUTUBE_MATCHER.contains_many(pd.Series(["172.217.0.1", None, np.nan]))
+    assert result.tolist() == [True, False, False]
+
+
+def test_contains_many_packed_ipv4():
+    v4 = [ip for ip in SAMPLE_IPS if ":" not in ip]
+    packed = np.array([int(ipaddress.ip_address(ip)) for ip in v4], dtype=np.uint32)
+    expected = [reference_contains(ip) for ip in v4]
+
+    assert YOUTUBE_MATCHER.contains_many(packed).tolist() == expected
+
+
+CLASSIFY_IPS = SAMPLE_IPS + [
+    "224.0.0.1", "239.255.255.250", "127.0.0.1", "127.255.0.9", "10.1.2.3", "172.31.0.1", "169.254.1.1",
+    "ff02::1", "ff05::2", "::1", "::", "fe80::1", "fd12:3456::1", "2607:f8b0::200e", "::ffff:10.0.0.1",
+    "::ffff:127.0.0.1", "::ffff:224.0.0.1", "::ffff:255.255.255.255", "::ffff:7f00:1:0",
+]
+
+
+def test_pack_and_format_round_trip():
+    packed = pack_ips(CLASSIFY_IPS + ["not-an-ip", None])
+    assert packed.dtype == PACKED_DTYPE
+    assert packed["version"].tolist() == [6 if ":" in ip else 4 for ip in CLASSIFY_IPS] + [0, 0]
+    assert int(packed["lo"][0]) == int(ipaddress.ip_address("172.217.0.1"))
+    assert format_ips(packed).tolist() == [str(ipaddress.ip_address(ip)) for ip in CLASSIFY_IPS] + [None, None]
+
+    categorical = pd.Series(CLASSIFY_IPS * 2, dtype="category")
+    assert (pack_ips(categorical) == pack_ips(CLASSIFY_IPS * 2)).all()
+
+
+def test_classifiers_match_ipaddress():
+    packed = pack_ips(CLASSIFY_IPS)
+    # IPv4-mapped addresses are classified by their IPv4 address
+    addresses = [ipaddress.ip_address(ip) for ip in CLASSIFY_IPS]
+    addresses = [getattr(a, "ipv4_mapped", None) or a for a in addresses]
+
+    assert is_multicast(packed).tolist() == [a.is_multicast for a in addresses]
+    assert is_loopback(packed).tolist() == [a.is_loopback for a in addresses]
+    assert is_broadcast(packed).tolist() == [str(a) == "255.255.255.255" for a in addresses]
+
+
+def test_unmap_ipv4_leaves_other_records_alone():
+    packed = pack_ips(["::ffff:10.0.0.1", "10.0.0.1", "::a00:1", "2001:db8::1", None])
+    unmapped = unmap_ipv4(packed)
+
+    assert unmapped[0] == pack_ips(["10.0.0.1"])[0]
+    assert (unmapped[1:] == packed[1:]).all()
+    assert packed["version"][0] == 6
+
+
+def test_contains_packed_both_versions():
+    matcher = CidrMatcher(["2001:db8::/32", "10.0.0.0/8", "ff00::/8"])
+    ips = ["10.2.3.4", "11.0.0.0", "2001:db8:ffff::1", "2001:db9::1", "ff02::1", "::a00:1", "bad"]
+    expected = [matcher.contains(ip) for ip in ips]
+
+    assert matcher.contains_packed(pack_ips(ips)).tolist() == expected
+    assert matcher.contains_many(pack_ips(ips)).tolist() == expected
+    assert expected == [True, False, True, False, True, False, False]
+
+
+def test_rank_ips_orders_addresses_across_columns():
+    src = pd.Series(["10.0.0.2", "2001:db8::1", "10.0.0.10", None], dtype="category")
+    dst = ["10.0.0.10", "10.0.0.2", "9.0.0.1", "10.0.0.2"]
+    addresses, (src_rank, dst_rank) = rank_ips(src, dst)
+
+    assert format_ips(addresses).tolist() == ["9.0.0.1", "10.0.0.2", "10.0.0.10", "2001:db8::1"]
+    assert src_rank.tolist() == [1, 3, 2, -1]
+    assert dst_rank.tolist() == [2, 1, 0, 1]
@@ -0,0 +1,172 @@
+import io
+import os
+import time
+
+import pandas as pd
+import pytest
+from scapy.all import Ether, IP, TCP, UDP, wrpcap
+
+import extract_features_unified
+import feature_cache
+import feature_store
+import jobs
+import pipeline_profiler
+from jobs import JobManager, cancel_path, read_job, run_job, write_job
+from result_cache import ResultCache, write_upload
+
+
+# Background traffic only, so the run doesn't need the trained action model
+def capture_bytes(tmp_path):
+    packets = []
+    for i in range(60):
+        layer = TCP(sport=40000 + i, dport=443) if i % 2 else UDP(sport=40000 + i, dport=53)
+        for j in range(1 + i % 3):
+            pkt = Ether() / IP(src=f"10.0.{i % 7}.{i + 1}", dst=f"192.168.1.{i % 5 + 1}") / layer / (b"x" * (30 * (i % 9) + j))
+            pkt.time = i + j * 0.1
+            packets.append(pkt)
+    path = tmp_path / "capture.pcap"
+    wrpcap(str(path), packets)
+    return path.read_bytes()
+
+
+@pytest.fixture
+def outputs(tmp_path, monkeypatch):
+    monkeypatch.setattr(feature_cache, "CACHE_DIR", str(tmp_path / "feature_cache"))
+    monkeypatch.setattr(pipeline_profiler, "PERF_DIR", str(tmp_path / "perf"))
+    monkeypatch.setattr(feature_store, "NPY_DIR", str(tmp_path / "npy"))
+    return tmp_path
+
+
+def queued_job(tmp_path, data, job_id="job1"):
+    path, digest = write_upload(io.BytesIO(data), str(tmp_path / "uploads"))
+    cache = ResultCache(str(tmp_path / "results"))
+    job = {"id": job_id, "name": "capture.pcap", "path": path, "digest": digest, "profile": False,
+           "result_key": cache.key(digest, profile=False), "state": "queued", "progress": 0, "message": "Queued",
+           "error": None, "created": time.time(), "started": None, "finished": None}
+    write_job(job, str(tmp_path / "jobs"))
+    return job, cache
+
+
+def wait_for(manager, job_id, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.status(job_id)
+        if job["state"] in jobs.FINISHED_STATES:
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_run_job_records_progress_and_stores_the_result(outputs, monkeypatch):
+    job, cache = queued_job(outputs, capture_bytes(outputs))
+    jobs_dir = str(outputs / "jobs")
+    # report extraction progress often enough for a small capture
+    monkeypatch.setattr(extract_features_unified, "PROGRESS_PACKETS", 10)
+    seen = []
+    save = jobs.JobStatus.save
+    monkeypatch.setattr(jobs.JobStatus, "save", lambda self: (seen.append(dict(self.job)), save(self)))
+
+    assert run_job("job1", jobs_dir, str(outputs / "results"), workers=1) == "done"
+
+    done = read_job("job1", jobs_dir)
+    assert done["state"] == "done" and done["progress"] == 100 and done["error"] is None
+    assert done["started"] <= done["finished"]
+    progress = [record["progress"] for record in seen]
+    assert progress == sorted(progress) and progress[-1] == 100
+    assert any(0 < percent < 80 for percent in progress)
+    assert {80, 90, 95} <= set(progress)
+    assert "2. Validating network flows" in [record["message"] for record in seen]
+
+    flows, numeric_df, anomaly_info, _ = cache.get(job["result_key"])
+    assert len(flows) == 60 and anomaly_info["total_flows"] == len(numeric_df)
+    # the chart rollups are stored with the result
+    assert len(cache.rollups(job["result_key"])["keys"]) == flows["is_valid"].sum()
+    # the upload is removed once the job is done with it, and no scaled matrix or perf report is left behind
+    assert not os.path.exists(job["path"])
+    assert not os.path.exists(outputs / "npy")
+    assert not os.path.exists(outputs / "perf")
+
+
+def test_run_job_stops_when_cancelled(outputs):
+    job, cache = queued_job(outputs, capture_bytes(outputs))
+    jobs_dir = str(outputs / "jobs")
+    open(cancel_path("job1", jobs_dir), "w").close()
+
+    assert run_job("job1", jobs_dir, str(outputs / "results")) == "cancelled"
+    assert cache.get(job["result_key"]) is None
+    assert not os.path.exists(cancel_path("job1", jobs_dir))
+    assert not os.path.exists(job["path"])
+
+
+def test_result_is_stored_under_the_models_it_was_predicted_with(outputs, monkeypatch):
+    import ML.model_training.predict as predict_module
+
+    model = outputs / "action_model.pkl"
+    monkeypatch.setitem(predict_module.registry.paths, "model", str(model))
+    job, cache = queued_job(outputs, capture_bytes(outputs))
+    # retrained after the job was queued
+    model.write_bytes(b"model")
+
+    assert run_job("job1", str(outputs / "jobs"), str(outputs / "results"), workers=1) == "done"
+    done = read_job("job1", str(outputs / "jobs"))
+    assert done["result_key"] != job["result_key"]
+    assert done["result_key"] == cache.key(job["digest"], profile=False)
+    assert cache.get(done["result_key"]) is not None
+
+
+def test_run_job_records_failures(outputs):
+    job, _ = queued_job(outputs, b"not a capture")
+    assert run_job("job1", str(outputs / "jobs"), str(outputs / "results")) == "failed"
+    assert "Not a supported capture file" in read_job("job1", str(outputs / "jobs"))["error"]
+
+
+def test_manager_runs_jobs_in_the_pool(tmp_path):
+    cache = ResultCache(str(tmp_path / "results"))
+    manager = JobManager(str(tmp_path / "jobs"), cache, max_jobs=1)
+    try:
+        path, digest = write_upload(io.BytesIO(b"not a capture"), str(tmp_path / "uploads"))
+        first = manager.submit(path, digest, "broken.pcap")
+        path, digest = write_upload(io.BytesIO(b"also not a capture"), str(tmp_path / "uploads"))
+        second = manager.submit(path, digest, "queued.pcap")
+        assert manager.cancel(second)
+
+        failed = wait_for(manager, first)
+        assert failed["state"] == "failed" and "Not a supported capture file" in failed["error"]
+        assert manager.result(first) is None
+        assert wait_for(manager, second)["state"] == "cancelled"
+        assert not manager.cancel(second)
+        assert [job["id"] for job in manager.jobs()] == [first, second]
+        assert os.listdir(tmp_path / "uploads") == []
+    finally:
+        manager.shutdown()
+
+
+def test_cached_result_finishes_without_running(tmp_path):
+    cache = ResultCache(str(tmp_path / "results"))
+    path, digest = write_upload(io.BytesIO(b"capture"), str(tmp_path / "uploads"))
+    result = (pd.DataFrame({"byte_count": [1]}), pd.DataFrame({"anomaly": [False]}), {"total_flows": 1}, {"stages": []})
+    cache.put(cache.key(digest, profile=False), result)
+
+    manager = JobManager(str(tmp_path / "jobs"), cache)
+    try:
+        job_id = manager.submit(path, digest, "capture.pcap")
+        assert manager.status(job_id)["state"] == "done"
+        assert manager.result(job_id) is result
+        assert job_id not in manager.futures
+        assert not os.path.exists(path)
+    finally:
+        manager.shutdown()
+
+
+def test_unfinished_jobs_are_marked_interrupted_on_start(tmp_path):
+    job, cache = queued_job(tmp_path, b"capture")
+    job.update(state="running")
+    write_job(job, str(tmp_path / "jobs"))
+
+    manager = JobManager(str(tmp_path / "jobs"), cache)
+    try:
+        recovered = manager.status("job1")
+        assert recovered["state"] == "failed" and "Interrupted" in recovered["error"]
+        assert not os.path.exists(job["path"])
+    finally:
+        manager.shutdown()
@@ -0,0 +1,133 @@
+import pytest
+from scapy.all import (
+    Ether, Dot1Q, Dot1AD, CookedLinux, IP, IPv6, IPv6ExtHdrFragment, TCP, UDP, ICMP, ARP, VXLAN,
+    PcapReader, PcapWriter, wrpcap, wrpcapng
+)
+
+from packet_parser import iter_packet_fields, iter_records, decode_packet, plan_shards, CaptureFormatError
+from extract_features_unified import scapy_packet_rows
+
+YT_IP = "172.217.0.1"
+LOCAL_IP = "192.168.1.5"
+
+
+# Builds a capture exercising every header the fast parser decodes itself,
+# plus packets it has to hand over to Scapy
+def mixed_packets():
+    tcp = TCP(sport=50000, dport=443)
+    packets = [
+        Ether() / IP(src=LOCAL_IP, dst=YT_IP) / tcp / (b"a" * 100),
+        Ether() / IP(src=YT_IP, dst=LOCAL_IP) / TCP(sport=443, dport=50000) / (b"b" * 1200),
+        Ether() / Dot1Q(vlan=10) / IP(src=LOCAL_IP, dst="8.8.8.8") / UDP(sport=5353, dport=53) / b"q",
+        Ether(type=0x88A8) / Dot1AD(vlan=3) / Dot1Q(vlan=5) / IP(src="10.0.0.1", dst="10.0.0.2") / UDP(sport=1, dport=2),
+        Ether() / IP(src=LOCAL_IP, dst="8.8.8.8", options=b"\x01\x01\x01\x01") / TCP(sport=1234, dport=80),
+        Ether() / IP(src=LOCAL_IP, dst="8.8.4.4") / ICMP(),
+        Ether() / IP(src=LOCAL_IP, dst=YT_IP, frag=10) / (b"f" * 40),
+        Ether() / ARP(),
+        Ether() / IPv6(src="2001:db8::1", dst="2001:db8::2") / TCP(sport=5, dport=6),
+        Ether() / IPv6(src="2001:db8::1", dst="2001:db8::2") / IPv6ExtHdrFragment(offset=0) / UDP(sport=7, dport=8),
+        Ether() / IP(src="1.1.1.1", dst="2.2.2.2") / IP(src="3.3.3.3", dst="4.4.4.4") / TCP(sport=9, dport=10),
+        Ether() / IP(src="1.1.1.1", dst="2.2.2.2") / UDP(sport=1000, dport=4789) / VXLAN() /
+        Ether() / IP(src="5.5.5.5", dst="6.6.6.6") / TCP(sport=11, dport=12),
+    ]
+    # Truncated transport headers are not dissected as TCP/UDP by Scapy
+    truncated = Ether() / IP(src=LOCAL_IP, dst=YT_IP) / TCP(sport=1, dport=2)
+    packets.append(Ether(bytes(truncated)[:44]))
+    # IP total length shorter than the frame, the rest is padding
+    padded = Ether() / IP(src=LOCAL_IP, dst="9.9.9.9") / UDP(sport=3, dport=4) / b"x"
+    packets.append(Ether(bytes(padded) + b"\x00" * 20))
+
+    for n, pkt in enumerate(packets):
+        pkt.time = 1700000000.123456 + n * 0.25
+    return packets
+
+
+def scapy_rows(path):
+    with PcapReader(path) as packets:
+        return list(scapy_packet_rows(packets))
+
+
+# The fast parser must produce exactly the rows the Scapy engine reads
+@pytest.mark.parametrize("writer", [wrpcap, wrpcapng])
+def test_rows_match_scapy(tmp_path, writer):
+    path = str(tmp_path / "mixed.pcap")
+    writer(path, mixed_packets())
+
+    assert list(iter_packet_fields(path)) == scapy_rows(path)
+
+
+def test_nanosecond_timestamps_match_scapy(tmp_path):
+    path = str(tmp_path / "nano.pcap")
+    with PcapWriter(path, nano=True) as writer:
+        for n in range(5):
+            pkt = Ether() / IP(src=LOCAL_IP, dst=YT_IP) / TCP(sport=1, dport=443)
+            pkt.time = 1700000000.123456789 + n * 0.000000333
+            writer.write(pkt)
+
+    assert list(iter_packet_fields(path)) == scapy_rows(path)
+
+
+@pytest.mark.parametrize("linktype, packets", [
+    (113, [CookedLinux() / IP(src=LOCAL_IP, dst=YT_IP) / TCP(sport=1, dport=443)]),
+    (101, [IP(src=LOCAL_IP, dst=YT_IP) / UDP(sport=2, dport=443)]),
+])
+def test_other_link_types_match_scapy(tmp_path, linktype, packets):
+    path = str(tmp_path / "link.pcap")
+    wrpcap(path, packets, linktype=linktype)
+
+    rows = list(iter_packet_fields(path))
+    assert len(rows) == 1
+    assert rows == scapy_rows(path)
+
+
+def test_ipv6_rows_only_when_requested(tmp_path):
+    path = str(tmp_path / "v6.pcap")
+    wrpcap(path, [Ether() / IPv6(src="2001:db8::1", dst="2001:db8::2") / TCP(sport=5, dport=6)])
+
+    assert list(iter_packet_fields(path)) == []
+    rows = list(iter_packet_fields(path, ipv6=True))
+    assert rows[0][1:6] == ("2001:db8::1", "2001:db8::2", 5, 6, 6)
+
+
+def test_decode_packet_reads_vlan_tcp_header():
+    pkt = Ether() / Dot1Q(vlan=7) / IP(src=LOCAL_IP, dst=YT_IP) / TCP(sport=4000, dport=443)
+    assert decode_packet(bytes(pkt), 1) == (4, LOCAL_IP, YT_IP, 6, 4000, 443)
+
+
+def test_iter_records_rejects_non_capture_files(tmp_path):
+    path = tmp_path / "not_a_pcap.pcap"
+    path.write_bytes(b"this is not a capture file")
+    with pytest.raises(CaptureFormatError):
+        list(iter_records(str(path)))
+
+
+# Reading every shard in turn must give back exactly the records of the whole capture
+@pytest.mark.parametrize("writer", [wrpcap, wrpcapng])
+def test_shards_cover_every_record(tmp_path, writer):
+    path = str(tmp_path / "shards.pcap")
+    packets = []
+    for n in range(300):
+        pkt = Ether() / IP(src=LOCAL_IP, dst=YT_IP) / TCP(sport=n, dport=443) / (b"s" * (n * 7 % 900))
+        pkt.time = 1700000000 + n * 0.01
+        packets.append(pkt)
+    writer(path, packets)
+
+    shards = plan_shards(path, 4, min_bytes=1024)
+    assert len(shards) == 4
+
+    records = []
+    for shard in shards:
+        cursor = dict(shard["cursor"])
+        records.extend(iter_records(path, cursor, shard["end"]))
+        if shard["end"] is not None:
+            assert cursor["pos"] == shard["end"]
+    assert records == list(iter_records(path))
+
+
+def test_small_captures_are_one_shard(tmp_path):
+    path = str(tmp_path / "small.pcap")
+    wrpcap(path, mixed_packets())
+
+    shards = plan_shards(path, 8)
+    assert len(shards) == 1
+    assert shards[0]["end"] is None
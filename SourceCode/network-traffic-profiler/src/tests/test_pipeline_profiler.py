@@ -0,0 +1,92 @@
+import json
+import time
+
+import pytest
+from scapy.all import Ether, IP, TCP, UDP, wrpcap
+
+import feature_cache
+import pipeline_profiler
+from pipeline_profiler import PipelineProfiler, save_report
+
+
+def test_stage_records_times_and_rates():
+    profiler = PipelineProfiler()
+    with profiler.stage("extraction") as stage:
+        time.sleep(0.05)
+        stage["packets"] = 1000
+        stage["flows"] = 10
+
+    record = profiler.stages[0]
+    assert record["stage"] == "extraction"
+    assert record["wall_seconds"] >= 0.05
+    assert record["cpu_seconds"] >= 0
+    assert record["packets_per_sec"] == pytest.approx(1000 / record["wall_seconds"])
+    assert record["flows_per_sec"] == pytest.approx(10 / record["wall_seconds"])
+    if pipeline_profiler.resource is not None:
+        assert record["peak_rss_bytes"] > 0
+        assert record["peak_rss_growth_bytes"] >= 0
+    assert "top_functions" not in record
+
+
+def test_stage_is_recorded_when_it_raises():
+    profiler = PipelineProfiler()
+    with pytest.raises(ValueError):
+        with profiler.stage("validation"):
+            raise ValueError("bad flow")
+    assert [record["stage"] for record in profiler.stages] == ["validation"]
+
+
+def test_profile_mode_adds_cprofile_and_tracemalloc():
+    profiler = PipelineProfiler(profile=True)
+    with profiler.stage("prediction"):
+        data = [list(range(1000)) for _ in range(100)]
+
+    record = profiler.stages[0]
+    assert record["traced_peak_bytes"] > 0
+    assert record["top_functions"]
+    assert {"function", "calls", "own_seconds", "cumulative_seconds"} <= set(record["top_functions"][0])
+    assert record["top_allocations"][0]["bytes"] > 0
+    assert len(data) == 100
+
+
+def test_report_and_save(tmp_path):
+    profiler = PipelineProfiler()
+    with profiler.stage("merge"):
+        pass
+    report = profiler.report(capture="capture.pcap", capture_bytes=123)
+    path = save_report(report, "capture", perf_dir=str(tmp_path))
+
+    assert path == str(tmp_path / "capture_perf.json")
+    with open(path) as f:
+        saved = json.load(f)
+    assert saved["capture"] == "capture.pcap"
+    assert saved["total_wall_seconds"] >= saved["stages"][0]["wall_seconds"]
+    assert [stage["stage"] for stage in saved["stages"]] == ["merge"]
+
+
+def test_run_pipeline_returns_and_saves_report(tmp_path, monkeypatch):
+    import main
+
+    monkeypatch.setattr(feature_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    packets = []
+    for i in range(80):
+        layer = TCP(sport=40000 + i, dport=443) if i % 2 else UDP(sport=40000 + i, dport=53)
+        for j in range(1 + i % 4):
+            pkt = Ether() / IP(src=f"10.0.{i % 7}.{i + 1}", dst=f"192.168.1.{i % 5 + 1}") / layer / (b"x" * (20 * (i % 9) + j))
+            pkt.time = i + j * 0.1
+            packets.append(pkt)
+    pcap = tmp_path / "office.pcap"
+    wrpcap(str(pcap), packets)
+
+    flows, numeric_df, anomaly_info, report = main.run_pipeline(str(pcap), perf_dir=str(tmp_path / "perf"),
+                                                                npy_dir=str(tmp_path / "npy"), save_scaled=True)
+
+    stages = [stage["stage"] for stage in report["stages"]]
+    assert stages[:2] == ["extraction", "validation"]
+    assert stages[-1] == "anomaly_detection"
+    assert report["stages"][0]["packets"] == len(packets)
+    assert report["stages"][0]["flows"] == len(flows)
+    assert report["capture_bytes"] == pcap.stat().st_size
+    assert (tmp_path / "perf" / "office_perf.json").exists()
+    assert report["saved_to"] == str(tmp_path / "perf" / "office_perf.json")
+    assert (tmp_path / "npy" / "office_scaled.npy").exists()
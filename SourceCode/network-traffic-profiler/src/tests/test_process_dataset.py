@@ -142,3 +142,161 @@ def test_row17_multiple_errors():
     assert "src_ip and dst_ip must not be identical" in error_msg
     assert "src_port: 70000 > maximum 65535" in error_msg
 
+
+# --- Columnar validation ---
+import numpy as np
+from process_dataset import validate_row as reference_row
+
+# The row-by-row implementation the columnar checks replaced
+def reference_validate_dataset(df):
+    all_errors = {}
+    duplicate_keys = ["src_ip","dst_ip","src_port","dst_port","protocol","first_packet_index"]
+    dupes = df[df.duplicated(duplicate_keys, keep=False)]
+    for idx in dupes.index:
+        all_errors[idx] = ["Duplicate flow detected"]
+    for idx, row in df.iterrows():
+        row_errors = reference_row(row)
+        if row_errors:
+            all_errors.setdefault(idx,[]).extend(row_errors)
+    df["is_valid"] = True
+    df["error_reason"] = ""
+    for idx, errs in all_errors.items():
+        df.at[idx, "is_valid"] = False
+        df.at[idx, "error_reason"] = "; ".join(errs)
+    return df
+
+# Random flows hitting every rule, with float ports like the non-streaming extraction produces
+def random_flows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    ips = ["8.8.8.8", "1.1.1.1", "224.0.0.1", "127.0.0.1", "255.255.255.255", "192.168.1.300",
+           "2001:db8::1", "ff02::1", "::1", "not-an-ip", "142.250.117.119",
+           "::ffff:127.0.0.1", "::ffff:224.0.0.1", "::ffff:255.255.255.255", "::ffff:8.8.8.8"]
+    packet_count = rng.integers(0, 30, n)
+    byte_count = packet_count * rng.integers(10, 1600, n) + rng.integers(-20, 20, n)
+    df = pd.DataFrame({
+        "src_ip": rng.choice(ips, n),
+        "dst_ip": rng.choice(ips, n),
+        "src_port": rng.choice([0, 1, 53, 443, 5353, 70000, -1], n).astype(float),
+        "dst_port": rng.choice([0, 53, 443, 50000], n),
+        "protocol": rng.choice([1, 6, 17, 99], n),
+        "packet_count": packet_count,
+        "byte_count": byte_count,
+        "avg_packet_size": np.where(packet_count > 0, byte_count / np.maximum(packet_count, 1), 0) + rng.choice([0, 0, 7.5], n),
+        "first_packet_index": rng.integers(0, 50, n),
+        "last_packet_index": rng.integers(0, 50, n),
+        "duration": rng.choice([0.0, 0.0005, 0.5, 15.0, 4000.0, -1.0], n),
+        "protocol_name": rng.choice(["TCP", "udp", "ICMP", "UNKNOWN"], n),
+    })
+    # Some exact duplicates
+    return pd.concat([df, df.iloc[:n // 20]], ignore_index=True)
+
+def test_columnar_validation_matches_row_validation():
+    df = random_flows(3000)
+    result = validate_dataset(df.copy())
+    expected = reference_validate_dataset(df.copy())
+    pd.testing.assert_frame_equal(result, expected)
+
+def test_columnar_validation_matches_for_malformed_cells():
+    df = random_flows(300, seed=1)
+    df["src_port"] = df["src_port"].astype(object)
+    df.loc[3, "src_port"] = "abc"
+    df.loc[4, "src_port"] = np.nan
+    df["packet_count"] = df["packet_count"].astype(float)
+    df.loc[5, "packet_count"] = np.inf
+    df["byte_count"] = df["byte_count"].astype(float)
+    df.loc[6, "byte_count"] = np.nan
+    df.loc[8, "dst_ip"] = None
+    result = validate_dataset(df.copy())
+    expected = reference_validate_dataset(df.copy())
+    pd.testing.assert_frame_equal(result, expected)
+    assert "src_port: expected int, got str" in result.loc[3, "error_reason"]
+    assert "packet_count: expected int, got float" in result.loc[5, "error_reason"]
+
+def test_columnar_validation_matches_with_repeated_index_labels():
+    df = random_flows(200, seed=2)
+    df.index = [i // 2 for i in range(len(df))]
+    result = validate_dataset(df.copy())
+    expected = reference_validate_dataset(df.copy())
+    pd.testing.assert_frame_equal(result, expected)
+
+# --- Rule registry ---
+import pytest
+from process_dataset import register_rule, unregister_rule
+
+@pytest.fixture
+def custom_rules():
+    names = []
+    def add(name, *args, **kwargs):
+        register_rule(name, *args, **kwargs)
+        names.append(name)
+    yield add
+    for name in names:
+        unregister_rule(name)
+
+def valid_flows():
+    rows = [
+        ["142.250.117.119","192.168.0.21",443,49666,6,244,271560,1112.95,159,3563,1.333,"TCP"],
+        ["192.168.0.21","10.0.0.5",50000,23,6,10,1000,100.0,3,20,2.0,"TCP"],
+    ]
+    return pd.DataFrame(rows, columns=columns)
+
+def test_custom_error_rule_invalidates_flow(custom_rules):
+    custom_rules("telnet", "(src_port == 23) | (dst_port == 23)", "Telnet to port {dst_port} from {src_ip}")
+    result = validate_dataset(valid_flows())
+    assert result["is_valid"].tolist() == [True, False]
+    assert result["error_reason"].iloc[1] == "Telnet to port 23 from 192.168.0.21"
+
+def test_custom_warning_rule_keeps_flow_valid(custom_rules):
+    custom_rules("big_flow", "byte_count > 100000", "Large flow ({byte_count} bytes)", severity="warning")
+    result = validate_dataset(valid_flows())
+    assert result["is_valid"].tolist() == [True, True]
+    assert result["error_reason"].tolist() == ["Large flow (271560 bytes)", ""]
+
+def test_report_counts_hits_and_short_circuits(custom_rules):
+    custom_rules("udp_only", "byte_count > 0", "UDP flow", when="protocol == 17")
+    custom_rules("needs_column", "ttl < 2", "Low TTL")
+    df = random_flows(500)
+    result, report = validate_dataset(df, return_report=True)
+
+    report = report.set_index("rule")
+    assert report.loc["needs_column", "status"].startswith("skipped")
+    assert report.loc["udp_only", "status"] == "evaluated"
+    expected_icmp = ((df["protocol"] == 1) & ((df["src_port"] != 0) | (df["dst_port"] != 0))).sum()
+    assert report.loc["icmp_ports", "hits"] == expected_icmp
+    assert (report["seconds"] >= 0).all()
+
+    # No ICMP flows: the rule's precondition short-circuits
+    _, report = validate_dataset(valid_flows(), return_report=True)
+    report = report.set_index("rule")
+    assert report.loc["icmp_ports", "status"] == "not applicable"
+    assert report.loc["udp_only", "status"] == "not applicable"
+
+def test_bad_rule_definitions_are_rejected():
+    with pytest.raises(ValueError):
+        register_rule("duration_check", "duration > 1", "x", severity="fatal")
+    with pytest.raises(ValueError):
+        register_rule("icmp_ports", "duration > 1", "x")
+    with pytest.raises(SyntaxError):
+        register_rule("broken", "duration >", "x")
+
+# --- Compact flow schema ---
+from extract_features_unified import FLOW_DTYPES
+
+def test_compact_schema_gives_same_verdicts_and_is_kept():
+    df = random_flows(2000, seed=3)
+    # only rows whose values fit the compact dtypes (negative/oversized values can't be extracted)
+    df = df[(df["src_port"].between(0, 65535)) & (df["dst_port"].between(0, 65535))
+            & (df["packet_count"] >= 0) & (df["byte_count"] >= 0) & (df["first_packet_index"] >= 0)
+            & (df["last_packet_index"] >= 0) & (df["protocol"].between(0, 255))].reset_index(drop=True)
+    compact = df.astype({col: dtype for col, dtype in FLOW_DTYPES.items() if col in df.columns})
+
+    result = validate_dataset(compact.copy())
+    expected = validate_dataset(df.copy())
+    assert (result["is_valid"] == expected["is_valid"]).all()
+    for col in compact.columns:
+        assert result[col].dtype == compact[col].dtype
+
+    # float32 values print with more digits in the messages, everything else reads the same
+    exact = validate_dataset(df.astype({col: dtype for col, dtype in FLOW_DTYPES.items()
+                                        if col in df.columns and col not in ("avg_packet_size", "duration")}))
+    assert (exact["error_reason"] == expected["error_reason"]).all()
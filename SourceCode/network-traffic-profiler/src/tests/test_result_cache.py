@@ -0,0 +1,165 @@
+import hashlib
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import result_cache
+from extract_features_unified import FLOW_DTYPES
+from result_cache import ResultCache, cleanup_uploads, remove_upload, write_upload
+from rollups import ROLLUP_TABLES, build_rollups
+
+
+def pipeline_result(seed=0):
+    rng = np.random.default_rng(seed)
+    flows = pd.DataFrame({
+        "src_ip": ["192.168.1.5", "172.217.0.1", "192.168.1.5"],
+        "dst_ip": ["172.217.0.1", "192.168.1.5", "8.8.8.8"],
+        "src_port": [40000, 443, 5353],
+        "dst_port": [443, 40000, 53],
+        "protocol": [6, 6, 17],
+        "packet_count": rng.integers(1, 100, 3),
+        "byte_count": rng.integers(100, 10000, 3),
+        "avg_packet_size": rng.random(3),
+        "first_packet_index": [0, 1, 5],
+        "start_time": [0.0, 0.5, 2.0],
+        "protocol_name": ["TCP", "TCP", "UDP"],
+    }).astype({col: dtype for col, dtype in FLOW_DTYPES.items() if col in ("src_ip", "src_port", "protocol_name")})
+    flows["is_valid"] = True
+    flows["action_type"] = ["Play", "Play", "Background"]
+    numeric_df = pd.DataFrame({"byte_count": flows["byte_count"], "anomaly": [False, True, False],
+                               "anomaly_score": [-0.1, 0.2, -0.3]})
+    anomaly_info = {"anomaly_count": 1, "total_flows": 3, "anomaly_percentage": 100 / 3,
+                    "fit_rows": 3, "baseline": False}
+    perf_report = {"capture": "a.pcap", "stages": [{"name": "extraction", "seconds": 0.5}]}
+    return flows, numeric_df, anomaly_info, perf_report
+
+
+def digest_of(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def assert_same_result(result, expected):
+    pd.testing.assert_frame_equal(result[0], expected[0])
+    pd.testing.assert_frame_equal(result[1], expected[1])
+    assert result[2] == expected[2]
+    assert result[3] == expected[3]
+
+
+def test_results_come_back_from_memory_and_disk(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    key = cache.key(digest_of(b"capture"), profile=False)
+    assert cache.get(key) is None
+
+    expected = pipeline_result()
+    cache.put(key, expected)
+    assert cache.get(key) is expected
+
+    # a new process only has the disk store
+    restarted = ResultCache(str(tmp_path / "cache"))
+    assert_same_result(restarted.get(key), expected)
+    assert key in restarted.memory
+
+
+def test_key_follows_content_options_and_models(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache"))
+    key = cache.key(digest_of(b"capture"), profile=False)
+
+    assert key == cache.key(digest_of(b"capture"), profile=False)
+    assert key != cache.key(digest_of(b"other capture"), profile=False)
+    assert key != cache.key(digest_of(b"capture"), profile=True)
+
+    model = tmp_path / "anomaly_baseline.joblib"
+    monkeypatch.setitem(result_cache.baseline_registry.paths, "baseline", str(model))
+    missing = cache.key(digest_of(b"capture"), profile=False)
+    model.write_bytes(b"model")
+    assert cache.key(digest_of(b"capture"), profile=False) != missing
+
+
+def test_rollups_are_stored_with_the_result(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    key = cache.key(digest_of(b"capture"), profile=False)
+    expected = pipeline_result()
+    rollups = build_rollups(expected[0])
+    cache.put(key, expected, rollups)
+
+    stored = ResultCache(str(tmp_path / "cache")).rollups(key)
+    assert set(stored) == set(ROLLUP_TABLES)
+    for name in ROLLUP_TABLES:
+        pd.testing.assert_frame_equal(stored[name], rollups[name])
+    # the result itself comes back without them
+    assert_same_result(ResultCache(str(tmp_path / "cache")).get(key), expected)
+
+    # a result stored without rollups has none
+    other = cache.key(digest_of(b"other capture"), profile=False)
+    cache.put(other, expected)
+    assert cache.rollups(other) is None
+
+
+def test_memory_is_bounded_and_eviction_is_explicit(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), memory_entries=2)
+    keys = [cache.key(digest_of(bytes([n]))) for n in range(3)]
+    for n, key in enumerate(keys):
+        cache.put(key, pipeline_result(n))
+
+    assert list(cache.memory) == keys[1:]
+    # the oldest result is still on disk
+    assert_same_result(cache.get(keys[0]), pipeline_result(0))
+    assert list(cache.memory) == [keys[2], keys[0]]
+
+    cache.evict(keys[0])
+    assert cache.get(keys[0]) is None
+    cache.clear()
+    assert cache.get(keys[2]) is None
+    assert not os.path.exists(tmp_path / "cache")
+
+
+def test_disk_store_is_bounded(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1, memory_entries=0)
+    key = cache.key(digest_of(b"capture"))
+    cache.put(key, pipeline_result())
+    assert cache.get(key) is None
+
+
+def test_uploads_are_copied_in_chunks_and_cleaned_up(tmp_path):
+    upload_dir = str(tmp_path / "uploads")
+    data = os.urandom(10_000)
+    upload = io.BytesIO(data)
+    upload.read(100)
+    first, digest = write_upload(upload, upload_dir, chunk_size=4096)
+    second, second_digest = write_upload(io.BytesIO(data), upload_dir)
+
+    # the whole upload is copied whatever its read position, and hashed on the way
+    assert digest == second_digest == digest_of(data)
+    assert first != second
+    assert os.path.basename(first) == f"{digest[:16]}.pcap"
+    with open(first, "rb") as f:
+        assert f.read() == data
+
+    remove_upload(first)
+    assert not os.path.exists(os.path.dirname(first))
+
+    # only directories older than max_age are removed
+    assert cleanup_uploads(upload_dir, max_age=3600) == 0
+    old = time.time() - 7200
+    os.utime(os.path.dirname(second), (old, old))
+    assert cleanup_uploads(upload_dir, max_age=3600) == 1
+    assert os.listdir(upload_dir) == []
+
+
+class FailingUpload(io.BytesIO):
+
+    def read(self, size=-1):
+        if self.tell() > 0:
+            raise OSError("connection reset")
+        return super().read(size)
+
+
+def test_failed_copy_leaves_nothing_behind(tmp_path):
+    upload_dir = tmp_path / "uploads"
+    with pytest.raises(OSError):
+        write_upload(FailingUpload(b"x" * 100), str(upload_dir), chunk_size=10)
+    assert os.listdir(upload_dir) == []
@@ -0,0 +1,183 @@
+import ipaddress
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from extract_features_unified import FLOW_DTYPES
+import rollups
+from rollups import build_rollups, chart_tables, flow_mask, time_series
+
+
+def make_flows(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    hosts = ["192.168.1.5", "10.0.0.1", "8.8.8.8", "172.217.0.1", "2001:db8::1", "9.9.9.9"]
+    flows = pd.DataFrame({
+        "src_ip": rng.choice(hosts, n),
+        "dst_ip": rng.choice(hosts, n),
+        "src_port": rng.choice([53, 443, 40000, 51000], n),
+        "dst_port": rng.choice([53, 443, 40000], n),
+        "protocol_name": rng.choice(["TCP", "UDP", "ICMP"], n),
+        "packet_count": rng.integers(1, 50, n),
+        "byte_count": rng.integers(0, 5000, n),
+        "avg_packet_size": rng.random(n) * 1000,
+        "start_time": rng.random(n) * 3600,
+    }).astype({col: dtype for col, dtype in FLOW_DTYPES.items()
+               if col in ("src_ip", "dst_ip", "src_port", "dst_port", "protocol_name")})
+    flows.loc[flows["protocol_name"] == "ICMP", ["src_port", "dst_port"]] = pd.NA
+    flows["action_type"] = rng.choice(["Play", "Like", "Background", None], n)
+    flows["is_valid"] = rng.random(n) > 0.1
+    return flows
+
+
+# Packed order: IPv4 before IPv6, then by value
+def address_order(ip):
+    address = ipaddress.ip_address(ip)
+    return address.version, int(address)
+
+
+# What the dashboard computed from the filtered flow table before the rollups
+def expected_tables(filtered):
+    actions = filtered.groupby("action_type", dropna=False)["byte_count"].sum()
+    endpoints = filtered.groupby(["src_ip", "dst_ip"], observed=True)["byte_count"].sum()
+    pair = filtered.apply(lambda r: tuple(sorted([r["src_ip"], r["dst_ip"]], key=address_order)), axis=1)
+    conversations = filtered.groupby(pair).agg(
+        total_bytes=("byte_count", "sum"),
+        total_packets=("packet_count", "sum"),
+        avg_packet_size=("avg_packet_size", "mean"),
+        flow_count=("byte_count", "count"),
+    )
+    return actions, endpoints, conversations
+
+
+def assert_matches(tables, filtered):
+    actions, endpoints, conversations = expected_tables(filtered)
+
+    # missing actions are a group of their own
+    got = tables["actions"].fillna({"action_type": "-"}).set_index("action_type")["byte_count"]
+    assert got.to_dict() == actions.rename(index=lambda action: "-" if pd.isna(action) else action).to_dict()
+
+    got = tables["endpoints"]
+    assert got["byte_count"].is_monotonic_decreasing
+    assert {(r.src_ip, r.dst_ip): r.byte_count for r in got.itertuples()} == endpoints.to_dict()
+
+    got = tables["conversations"].set_index(["a", "b"])
+    assert tables["conversations"]["total_bytes"].is_monotonic_decreasing
+    expected = conversations.set_index(pd.MultiIndex.from_tuples(conversations.index))
+    pd.testing.assert_frame_equal(got.loc[expected.index, expected.columns], expected,
+                                  check_dtype=False, check_names=False)
+
+
+def test_unfiltered_tables_match_groupby():
+    flows = make_flows()
+    rollups = build_rollups(flows)
+    valid = flows[flows["is_valid"] == True]
+
+    assert len(rollups["keys"]) == len(valid)
+    assert flow_mask(rollups) is None
+    assert_matches(chart_tables(rollups), valid)
+
+
+@pytest.mark.parametrize("filters", [
+    {"protocol_name": ["TCP"]},
+    {"src_ip": ["192.168.1.5", "2001:db8::1"], "dst_port": [443]},
+    {"dst_ip": ["8.8.8.8"], "src_port": [53, 40000], "protocol_name": ["UDP", "TCP"]},
+    {"src_port": [53], "dst_port": [], "src_ip": None},
+])
+def test_filtered_tables_match_groupby(filters):
+    flows = make_flows(seed=1)
+    rollups = build_rollups(flows)
+    valid = flows[flows["is_valid"] == True]
+    mask = flow_mask(rollups, **filters)
+
+    filtered = valid
+    for column, selected in filters.items():
+        if selected:
+            filtered = filtered[filtered[column].isin(selected)]
+    # rows of the mask line up with the valid flows
+    pd.testing.assert_frame_equal(valid[mask], filtered)
+    assert_matches(chart_tables(rollups, mask), filtered)
+
+
+def test_selection_without_flows_gives_empty_tables():
+    rollups = build_rollups(make_flows())
+    mask = flow_mask(rollups, src_ip=["1.2.3.4"], dst_port=[65000])
+    assert not mask.any()
+    assert all(table.empty for table in chart_tables(rollups, mask).values())
+
+
+def test_top_rows_only():
+    flows = make_flows()
+    rollups = build_rollups(flows)
+    full = chart_tables(rollups)
+    top = chart_tables(rollups, top_endpoints=3, top_conversations=2)
+
+    assert top["endpoints"]["byte_count"].tolist() == full["endpoints"]["byte_count"].head(3).tolist()
+    assert top["conversations"]["total_bytes"].tolist() == full["conversations"]["total_bytes"].head(2).tolist()
+
+
+# Bucket of each flow's start time, by arithmetic
+def expected_series(filtered, width, start=0.0):
+    bucket = np.floor(filtered["start_time"] / width).astype(int)
+    grouped = filtered.groupby(bucket).agg(byte_count=("byte_count", "sum"), packet_count=("packet_count", "sum"),
+                                           flow_count=("byte_count", "count"))
+    grouped.index = grouped.index * width
+    return grouped
+
+
+def test_time_series_fits_the_point_budget():
+    flows = make_flows(n=2000)
+    tables = build_rollups(flows)
+    valid = flows[flows["is_valid"] == True]
+    # an hour of traffic gets 100 ms buckets, at most FINE_BUCKETS of them
+    assert tables["timeline"]["seconds"].iloc[0] == 0.1
+    assert len(tables["timeline"]) <= rollups.FINE_BUCKETS
+
+    series, width = time_series(tables, max_points=100)
+    assert width == 60 and len(series) == 60
+    assert series["byte_count"].sum() == valid["byte_count"].sum()
+    assert series["flow_count"].sum() == len(valid)
+    expected = expected_series(valid, 60)
+    got = series.set_index("start").loc[expected.index]
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False, check_names=False)
+
+
+def test_zooming_in_gives_narrower_buckets():
+    flows = make_flows(n=2000, seed=2)
+    tables = build_rollups(flows)
+    valid = flows[flows["is_valid"] == True]
+
+    series, width = time_series(tables, start=100.5, end=160.2, max_points=100)
+    # widened to the whole buckets its ends fall in
+    assert width == 1 and series["start"].tolist() == [float(second) for second in range(100, 161)]
+    inside = valid[(valid["start_time"] >= 100) & (valid["start_time"] < 161)]
+    assert series["byte_count"].sum() == inside["byte_count"].sum()
+
+    # no finer than the timeline's own buckets
+    series, width = time_series(tables, start=10, end=10.05)
+    assert width == 0.1 and len(series) == 1
+
+
+def test_filtered_time_series_and_missing_times():
+    flows = make_flows(n=2000, seed=3)
+    flows.loc[flows.index[:10], "start_time"] = np.nan
+    tables = build_rollups(flows)
+    valid = flows[flows["is_valid"] == True]
+    mask = flow_mask(tables, protocol_name=["UDP"], src_port=[53])
+
+    series, width = time_series(tables, mask, max_points=500)
+    filtered = valid[mask]
+    expected = expected_series(filtered.dropna(subset=["start_time"]), width)
+    assert len(series) <= 500
+    got = series.set_index("start")
+    pd.testing.assert_frame_equal(got.loc[expected.index], expected, check_dtype=False, check_names=False)
+    # buckets without any of the flows are kept, at zero
+    assert got["flow_count"].sum() == len(filtered.dropna(subset=["start_time"]))
+    assert (got.drop(expected.index)["byte_count"] == 0).all()
+
+
+def test_capture_without_flows_has_no_series():
+    flows = make_flows()
+    flows["is_valid"] = False
+    series, width = time_series(build_rollups(flows))
+    assert series.empty and width is None
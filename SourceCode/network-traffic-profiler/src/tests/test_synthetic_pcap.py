@@ -0,0 +1,47 @@
+import pytest
+from scapy.all import rdpcap, IP, TCP, UDP
+
+from extract_features_unified import extract_all_pcap_data
+from ip_utils import YOUTUBE_MATCHER
+from synthetic_pcap import generate_capture
+
+
+@pytest.mark.parametrize("file_format", ["pcap", "pcapng"])
+def test_generated_capture_reads_back(tmp_path, file_format):
+    path = tmp_path / f"capture.{file_format}"
+    summary = generate_capture(path, packets=600, flows=40, youtube_share=0.5, file_format=file_format)
+
+    packets = rdpcap(str(path))
+    assert len(packets) == 600
+    assert all(IP in pkt for pkt in packets)
+    assert sum(len(pkt) for pkt in packets) == summary["packet_bytes"]
+
+    flows, ml_df = extract_all_pcap_data(str(path), streaming=True, engine="fast")
+    assert len(flows) == summary["port_flows"]
+    assert len(ml_df) == summary["youtube_flows"]
+    assert summary["youtube_flows"] > 0
+
+
+def test_protocol_mix_and_youtube_share(tmp_path):
+    summary = generate_capture(tmp_path / "udp.pcap", packets=400, flows=100,
+                               protocol_mix={"udp": 1.0}, youtube_share=0.0)
+    assert summary["protocol_flows"] == {"udp": 100}
+    assert summary["youtube_flows"] == 0
+
+    packets = rdpcap(str(tmp_path / "udp.pcap"))
+    assert all(UDP in pkt and TCP not in pkt for pkt in packets)
+    assert not any(YOUTUBE_MATCHER.contains(pkt[IP].src) or YOUTUBE_MATCHER.contains(pkt[IP].dst)
+                   for pkt in packets)
+
+
+def test_same_seed_same_capture(tmp_path):
+    generate_capture(tmp_path / "a.pcap", packets=300, flows=30, seed=7)
+    generate_capture(tmp_path / "b.pcap", packets=300, flows=30, seed=7)
+    assert (tmp_path / "a.pcap").read_bytes() == (tmp_path / "b.pcap").read_bytes()
+
+
+def test_invalid_settings_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        generate_capture(tmp_path / "x.pcap", packets=10, flows=20)
+    with pytest.raises(ValueError):
+        generate_capture(tmp_path / "x.pcap", file_format="erf")